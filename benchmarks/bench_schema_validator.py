@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк валидации ответов: скомпилированный валидатор JSON-Schema
+(services/schema_validator.py) против прежнего validate_schema из conftest.
+
+Прежняя реализация понимает только формат {'required': {key: type}, 'optional': ...}
+(JSON-Schema из сгенерированных тестов она фактически не проверяла), поэтому для
+неё используется эквивалентная схема в этом формате. Данные — массив объектов,
+как в ответе GET /services сервиса services-monitor.
+
+Дополнительно проверяется потоковый разбор (iter_json_array): при большом
+первом элементе он должен отдаваться сразу после своего конца, а не после
+прочтения всего тела.
+
+Использование:
+    python benchmarks/bench_schema_validator.py
+    python benchmarks/bench_schema_validator.py --repeat 20
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.schema_validator import compile_schema, iter_json_array
+
+JSON_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "name": {"type": "string"},
+            "system": {"type": "string"},
+            "description": {"type": "string"},
+            "address": {"type": "string"},
+            "enabled": {"type": "boolean"},
+            "last_good_time": {"type": "string", "format": "date-time"},
+            "state": {"type": "string", "enum": ["good", "bad"]},
+        },
+        "required": ["name", "address", "state"],
+    },
+}
+
+LEGACY_SCHEMA = {
+    "required": {"name": str, "address": str, "state": str},
+    "optional": {"system": str, "description": str, "enabled": bool, "last_good_time": str},
+}
+
+
+def legacy_validate_schema(data, schema):
+    """Копия прежнего validate_schema из services/conftest.py."""
+    if isinstance(data, list):
+        for item in data:
+            legacy_validate_schema(item, schema)
+        return
+
+    for key, expected_type in schema.get("required", {}).items():
+        assert key in data, f"Required key '{key}' is missing from data: {json.dumps(data, indent=2)}"
+
+        actual_type = type(data[key])
+        if isinstance(expected_type, tuple):
+            assert actual_type in expected_type, (
+                f"Key '{key}' has type {actual_type.__name__}, but expected one of {expected_type}."
+            )
+        else:
+            assert actual_type is expected_type, (
+                f"Key '{key}' has type {actual_type.__name__}, but expected {expected_type.__name__}."
+            )
+
+    for key, expected_type in schema.get("optional", {}).items():
+        if key in data and data[key] is not None:
+            actual_type = type(data[key])
+            if isinstance(expected_type, tuple):
+                assert actual_type in expected_type, (
+                    f"Optional key '{key}' has type {actual_type.__name__}, but expected one of {expected_type}."
+                )
+            else:
+                assert actual_type is expected_type, (
+                    f"Optional key '{key}' has type {actual_type.__name__}, but expected {expected_type.__name__}."
+                )
+
+
+def build_response(size):
+    return [
+        {
+            "name": f"service{i}",
+            "system": "system1",
+            "description": "Service description",
+            "address": f"10.0.{i // 256 % 256}.{i % 256}",
+            "enabled": i % 2 == 0,
+            "last_good_time": "2024-05-01T12:00:00Z",
+            "state": "good" if i % 3 else "bad",
+        }
+        for i in range(size)
+    ]
+
+
+def chunks_before_first_item(first_item_bytes=200 * 1024, items=100000, chunk_size=64 * 1024):
+    """(прочитано чанков до первого элемента, всего чанков) для тела с большим первым элементом."""
+    body = json.dumps([{"blob": "x" * first_item_bytes}] + build_response(items)).encode()
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+    consumed = 0
+
+    def stream():
+        nonlocal consumed
+        for chunk in chunks:
+            consumed += 1
+            yield chunk
+
+    next(iter_json_array(stream()))
+    return consumed, len(chunks)
+
+
+def best_of(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark response schema validation")
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    validator = compile_schema(JSON_SCHEMA)
+    compile_time = time.perf_counter() - started
+    cached = best_of(lambda: compile_schema(JSON_SCHEMA), 1000)
+    print(f"compile: {compile_time * 1000:.2f} ms, cached lookup: {cached * 1e6:.2f} us")
+    print("(new validator also checks format and enum, which the legacy one cannot express)")
+    # enum: true не совпадает с 1, объекты и массивы — ошибка, а не TypeError
+    assert compile_schema({"enum": [1]})(True)
+    assert compile_schema({"enum": [1, "x"]})({"a": 1})
+    assert compile_schema({"enum": [[1], {"a": True}]})({"a": True}) == []
+
+    print(f"{'items':>8} {'legacy, ms':>11} {'compiled, ms':>13} {'speedup':>8}")
+    for size in [1, 10, 100, 1000, 10000, 100000]:
+        data = build_response(size)
+        assert validator(data) == []
+        legacy_time = best_of(lambda: legacy_validate_schema(data, LEGACY_SCHEMA), args.repeat)
+        new_time = best_of(lambda: compile_schema(JSON_SCHEMA)(data), args.repeat)
+        print(f"{size:>8} {legacy_time * 1000:>11.3f} {new_time * 1000:>13.3f} "
+              f"{legacy_time / max(new_time, 1e-9):>7.1f}x")
+
+    consumed, total = chunks_before_first_item()
+    print(f"stream: first item (200 KB) yielded after {consumed} of {total} chunks")
+    # Первый элемент занимает 4 чанка; геометрический порог повторного разбора
+    # допускает не более чем удвоение прочитанного
+    assert consumed <= 8, f"iter_json_array buffered {consumed} of {total} chunks before the first item"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк типизированных ответов модели: доля ответов, которые не удалось
+разобрать в прежнем текстовом режиме, против доли повторов и отказов с
+output_type (utils/llm_outputs.py).
+
+Для каждого эндпоинта сервиса шаги 5 (поиск реализации), 6 (объединение) и
+7 (генерация кейсов) выполняются дважды, с отключенным кешем модели:
+    - legacy: свободный текст и прежний разбор (копии parse_text_response из
+      main.py, json.loads объединенной схемы, parse_cases); для шага 5 —
+      прежний промпт с форматом STATUS/FILE/CODE_EVIDENCE. Повтора не было:
+      ответ, который не разобрался, означал потерянную попытку
+    - structured: тот же шаг с output_type, как в main.py; считаются ответы,
+      не прошедшие валидацию с первой попытки, и окончательные отказы
+Шаги 6 и 7 в обоих режимах получают одинаковый промпт (разница только в
+ограничении ответа схемой); входом для них служит результат structured-режима.
+
+Требуется запущенная Ollama с моделью из utils/ollama_client.py.
+
+Использование:
+    python benchmarks/bench_structured_outputs.py source_codes/services-monitor
+    python benchmarks/bench_structured_outputs.py source_codes/services-monitor --endpoints 10
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+from itertools import islice
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydantic_ai.exceptions import UnexpectedModelBehavior
+
+from prompts import generate_cases, merge_results, search_implementation
+from utils.case_transpiler import CasesFormatError, parse_cases
+from utils.llm_outputs import MergedEndpoint, SearchResult, TestCases
+from utils.ollama_client import configure_cache, send_messages, structured_stats
+from utils.route_index import RouteIndex
+from utils.swagger_parser import iter_endpoints_swagger2
+from utils.text_utils import strip_markdown
+
+SOURCE_EXTENSIONS = {'.ml', '.mli', '.py', '.js', '.ts', '.go', '.java', '.c', '.cpp', '.h', '.rs'}
+
+# Копия прежнего промпта шага 5 (текстовый формат ответа)
+LEGACY_SEARCH_SYSTEM_PROMPT = """
+Ты — помощник для анализа кода.
+
+ТВОЯ ЕДИНСТВЕННАЯ ЗАДАЧА: Вызвать инструмент read_file для чтения файла.
+
+ОБЯЗАТЕЛЬНО:
+1. Вызови инструмент read_file с путём к файлу
+2. После чтения файла - проанализируй код и ответь в формате ниже
+
+ФОРМАТ ОТВЕТА (после чтения файла):
+
+Если НАШЁЛ код с маршрутом:
+STATUS: FOUND
+FILE: <путь к прочитанному файлу>
+CODE_EVIDENCE:
+<точная цитата кода из файла>
+
+SUMMARY: <описание>
+DESCRIPTION: <детали>
+RESPONSE_CODE: 200
+RESPONSE_DESCRIPTION: <описание>
+SCHEMA_TYPE: object или array
+SCHEMA_FIELDS:
+field: type | description
+
+Если НЕ НАШЁЛ:
+STATUS: NOT_FOUND
+FILE: <путь к прочитанному файлу>
+REASON: <причина>
+
+КРИТИЧЕСКИ ВАЖНО:
+1. СНАЧАЛА вызови read_file - БЕЗ ЭТОГО НЕЛЬЗЯ ОТВЕЧАТЬ!
+2. Цитируй ТОЛЬКО реальный код из файла
+3. НЕ выдумывай код - только то, что прочитал
+"""
+
+
+def legacy_search_user_prompt(method, path, files):
+    """Копия прежнего search_implementation.get_user_prompt."""
+    return f"""
+Найди реализацию: {method} {path}
+
+ФАЙЛЫ (отсортированы по вероятности, первый — самый вероятный):
+{files}
+
+ШАГ 1 (ОБЯЗАТЕЛЬНО): Вызови инструмент read_file
+- Выбери ОДИН файл из списка выше (начни с первого)
+- Вызови: read_file(file_path="<путь к файлу>")
+- Дождись результата
+
+ШАГ 2 (после чтения): Найди в коде маршрут "{path}"
+
+ШАГ 3 (если нашёл): Ответь форматом:
+STATUS: FOUND
+FILE: <путь к файлу>
+CODE_EVIDENCE:
+<код из файла>
+
+SUMMARY: <описание>
+SCHEMA_FIELDS:
+field: type | description
+
+ШАГ 3 (если НЕ нашёл): Ответь:
+STATUS: NOT_FOUND
+FILE: <путь к файлу>
+REASON: <причина>
+
+ВАЖНО:
+- ОБЯЗАТЕЛЬНО вызови read_file ПЕРЕД ответом
+- НЕ придумывай код - только из файла
+- Маршрут "{path}" должен быть в CODE_EVIDENCE
+   """
+
+
+def parse_text_response(text):
+    """Копия прежнего parse_text_response из main.py."""
+    lines = text.strip().split('\n')
+    data = {'status': None, 'file': None, 'reason': None, 'code_evidence': [], 'schema_fields': []}
+    current_section = None
+
+    for i, line in enumerate(lines):
+        line_stripped = line.strip()
+
+        for key, prefix in [('status', 'STATUS:'), ('file', 'FILE:'), ('reason', 'REASON:')]:
+            if line_stripped.startswith(prefix):
+                data[key] = line_stripped[len(prefix):].strip()
+                current_section = None
+                break
+        else:
+            if line_stripped.startswith('CODE_EVIDENCE:'):
+                current_section = 'code'
+            elif line_stripped.startswith('SCHEMA_FIELDS:'):
+                current_section = 'schema'
+            elif current_section == 'code':
+                data['code_evidence'].append(lines[i])
+            elif current_section == 'schema' and line_stripped:
+                data['schema_fields'].append(lines[i])
+
+    data['code_evidence'] = '\n'.join(data['code_evidence']).strip()
+    data['schema_fields'] = '\n'.join(data['schema_fields']).strip()
+    return data
+
+
+def legacy_search_ok(text):
+    """Проверки формата прежнего цикла поиска (без проверки маршрута в коде)."""
+    data = parse_text_response(text)
+    if not data['status'] or not data['file']:
+        return False
+    if data['status'] == 'NOT_FOUND':
+        return True
+    return data['status'] == 'FOUND' and bool(data['code_evidence'])
+
+
+def legacy_merge_ok(text):
+    try:
+        merged = json.loads(strip_markdown(text))
+    except ValueError:
+        return False
+    return isinstance(merged, dict) and isinstance(merged.get('responses'), dict)
+
+
+def legacy_cases_ok(text):
+    try:
+        return bool(parse_cases(strip_markdown(text)))
+    except CasesFormatError:
+        return False
+
+
+def collect_source_files(service_dir):
+    files = glob.glob(os.path.join(service_dir, "**", "*"), recursive=True)
+    return [f for f in files if os.path.isfile(f) and Path(f).suffix in SOURCE_EXTENSIONS]
+
+
+def structured(prompt, system_prompt, output_type, use_tools):
+    try:
+        output, _ = send_messages(prompt, [], system_prompt, use_tools=use_tools, output_type=output_type)
+        return output
+    except UnexpectedModelBehavior:
+        return None
+
+
+def legacy(prompt, system_prompt, use_tools, check, counters, stage):
+    text, _ = send_messages(prompt, [], system_prompt, use_tools=use_tools)
+    counters[stage]["calls"] += 1
+    if not check(text):
+        counters[stage]["failed"] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark structured LLM outputs against legacy text parsing")
+    parser.add_argument("service_dir", help="Каталог исходников сервиса со swagger.json")
+    parser.add_argument("--endpoints", type=int, default=5, help="Сколько эндпоинтов swagger прогнать")
+    args = parser.parse_args()
+
+    configure_cache(enabled=False)
+    files = collect_source_files(args.service_dir)
+    route_index = RouteIndex(tempfile.mkdtemp(prefix="qa_route_index_"), files)
+    endpoints = list(islice(iter_endpoints_swagger2(os.path.join(args.service_dir, "swagger.json")), args.endpoints))
+
+    counters = {name: {"calls": 0, "failed": 0} for name in ("SearchResult", "MergedEndpoint", "TestCases")}
+    for endpoint in endpoints:
+        print(f"--- {endpoint['method']} {endpoint['path']}")
+        candidates = route_index.shortlist(endpoint["path"], files)
+
+        legacy(legacy_search_user_prompt(endpoint["method"], endpoint["path"], candidates),
+               LEGACY_SEARCH_SYSTEM_PROMPT, True, legacy_search_ok, counters, "SearchResult")
+        found = structured(search_implementation.get_user_prompt(endpoint["method"], endpoint["path"], candidates),
+                           search_implementation.SYSTEM_PROMPT, SearchResult, True)
+        analysis = found.to_text() if found is not None else ""
+
+        prompt = merge_results.get_user_prompt(endpoint, analysis)
+        legacy(prompt, merge_results.SYSTEM_PROMPT, False, legacy_merge_ok, counters, "MergedEndpoint")
+        merged = structured(prompt, merge_results.SYSTEM_PROMPT, MergedEndpoint, False)
+        if merged is None:
+            continue
+
+        prompt = generate_cases.get_user_prompt(merged.model_dump_json(indent=2))
+        legacy(prompt, generate_cases.SYSTEM_PROMPT, False, legacy_cases_ok, counters, "TestCases")
+        structured(prompt, generate_cases.SYSTEM_PROMPT, TestCases, False)
+
+    stats = structured_stats()
+    print(f"\n{'stage':<16} {'legacy unparsed':>16} {'structured invalid':>19} {'structured failed':>18}")
+    for stage, legacy_counts in counters.items():
+        typed = stats.get(stage, {"calls": 0, "repaired": 0, "failed": 0})
+        legacy_rate = legacy_counts["failed"] / max(legacy_counts["calls"], 1)
+        invalid_rate = (typed["repaired"] + typed["failed"]) / max(typed["calls"], 1)
+        failed_rate = typed["failed"] / max(typed["calls"], 1)
+        print(f"{stage:<16} {legacy_rate:>15.0%} {invalid_rate:>18.0%} {failed_rate:>17.0%}"
+              f"   (calls: {legacy_counts['calls']} / {typed['calls']})")
+    print("legacy unparsed — the old pipeline lost the attempt; structured invalid — first answer "
+          "failed validation and was repaired by a retry; structured failed — still invalid after retries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк разыменования $ref: SwaggerRefResolver против прежнего
+рекурсивного deepcopy-раскрытия.
+
+Синтетический swagger: определения разложены по уровням (глубина вложенности),
+каждое ссылается на `fanout` определений следующего уровня; эндпоинты
+ссылаются на определения верхнего уровня. Замеряются время и пик памяти
+(tracemalloc) при раскрытии схем ответов всех эндпоинтов.
+
+Использование:
+    python benchmarks/bench_swagger_deref.py
+    python benchmarks/bench_swagger_deref.py --endpoints 200 --fanout 3
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from copy import deepcopy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.swagger_parser import SwaggerRefResolver
+
+
+def build_swagger(definitions, depth, fanout, endpoints, seed=0):
+    rnd = random.Random(seed)
+    per_level = max(1, definitions // depth)
+    levels = [[f"L{level}_D{i}" for i in range(per_level)] for level in range(depth)]
+
+    defs = {}
+    for level, names in enumerate(levels):
+        for name in names:
+            props = {f"f{i}": {"type": "string"} for i in range(3)}
+            if level + 1 < depth:
+                for i in range(fanout):
+                    props[f"ref{i}"] = {"$ref": f"#/definitions/{rnd.choice(levels[level + 1])}"}
+            defs[name] = {"type": "object", "properties": props}
+
+    paths = {}
+    for i in range(endpoints):
+        paths[f"/items{i}"] = {"get": {"responses": {"200": {
+            "description": "ok",
+            "schema": {"type": "array", "items": {"$ref": f"#/definitions/{rnd.choice(levels[0])}"}},
+        }}}}
+    return {"swagger": "2.0", "definitions": defs, "paths": paths}
+
+
+# --- Прежняя реализация (для сравнения) ---
+
+def legacy_deref(schema, swagger, _stack=()):
+    if isinstance(schema, list):
+        return [legacy_deref(x, swagger, _stack) for x in schema]
+    if not isinstance(schema, dict):
+        return schema
+    if "$ref" in schema:
+        ref = schema["$ref"]
+        if ref in _stack:
+            merged = {k: v for k, v in schema.items() if k != "$ref"}
+            merged.setdefault("type", "object")
+            merged["x-circular_ref"] = ref
+            return legacy_deref(merged, swagger, _stack)
+        current = swagger
+        for part in ref.split("/")[1:]:
+            current = current[part]
+        base = deepcopy(current)
+        base.update({k: v for k, v in schema.items() if k != "$ref"})
+        return legacy_deref(base, swagger, _stack + (ref,))
+    return {k: legacy_deref(v, swagger, _stack) for k, v in schema.items()}
+
+
+def legacy_collect(node, out):
+    if isinstance(node, dict):
+        if "x-unresolved_ref" in node:
+            out.append(node["x-unresolved_ref"])
+        for v in node.values():
+            legacy_collect(v, out)
+    elif isinstance(node, list):
+        for x in node:
+            legacy_collect(x, out)
+
+
+# Результаты сохраняются, как и список эндпоинтов в main.py: пик памяти включает их
+
+def run_legacy(swagger):
+    results = []
+    for item in swagger["paths"].values():
+        schema = item["get"]["responses"]["200"]["schema"]
+        unresolved = []
+        results.append(legacy_deref(schema, swagger))
+        legacy_collect(results[-1], unresolved)
+    return results
+
+
+def run_resolver(swagger):
+    resolver = SwaggerRefResolver(swagger)
+    results = []
+    for item in swagger["paths"].values():
+        schema = item["get"]["responses"]["200"]["schema"]
+        results.append(resolver.deref(schema, []))
+    return results
+
+
+def measure(func, swagger):
+    tracemalloc.start()
+    started = time.perf_counter()
+    func(swagger)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark $ref dereferencing")
+    parser.add_argument("--endpoints", type=int, default=100)
+    parser.add_argument("--fanout", type=int, default=2)
+    args = parser.parse_args()
+
+    print(f"{'defs':>6} {'depth':>6} {'legacy, s':>10} {'legacy, MB':>11} {'new, s':>9} {'new, MB':>8} {'speedup':>8}")
+    for definitions, depth in [(50, 3), (200, 3), (800, 3), (200, 5), (200, 7), (800, 7)]:
+        swagger = build_swagger(definitions, depth, args.fanout, args.endpoints)
+        legacy_time, legacy_peak = measure(run_legacy, swagger)
+        new_time, new_peak = measure(run_resolver, swagger)
+        print(f"{definitions:>6} {depth:>6} {legacy_time:>10.3f} {legacy_peak / 2**20:>11.1f} "
+              f"{new_time:>9.4f} {new_peak / 2**20:>8.2f} {legacy_time / max(new_time, 1e-9):>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Локальная заглушка HTTP сервиса для самопроверки нагрузочного режима (--load).
+
+На любой запрос отвечает 200 и JSON телом (по умолчанию пустой массив) с
+keep-alive; --delay-ms добавляет искусственную задержку ответа.
+
+Использование:
+    python benchmarks/standin_server.py --port 7779 --delay-ms 2
+    pytest services/services-monitor/services.py --host 127.0.0.1 --port 7779 \\
+        --load duration=10s,concurrency=16
+"""
+import argparse
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(body, delay):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _respond(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+            if delay:
+                time.sleep(delay)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _respond
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in HTTP service for --load self-tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7779)
+    parser.add_argument("--delay-ms", type=float, default=0.0)
+    parser.add_argument("--body", default="[]", help="JSON response body")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.body.encode(), args.delay_ms / 1000))
+    server.daemon_threads = True
+    print(f"Stand-in service on http://{args.host}:{args.port} (delay {args.delay_ms} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
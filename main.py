@@ -1,376 +1,687 @@
-from utils.ollama_client import send_messages, set_debug
+from utils.ollama_client import (
+    send_messages, set_debug, set_concurrency_limit, start_background_loop, stop_background_loop,
+    configure_cache, cache_stats, structured_stats, stream_stats,
+)
+from pydantic_ai.exceptions import UnexpectedModelBehavior
 from utils.console import *
 from utils.text_utils import strip_markdown
 import os
 from pathlib import Path
 import json
-from utils.swagger_parser import extract_endpoints_swagger2
+import re
+from utils.swagger_parser import iter_endpoints_swagger2
+from utils.build_manifest import BuildManifest, prompt_versions
+from utils.route_index import RouteIndex, normalize_route
+from utils.fixture_catalog import FixtureCatalog
+from utils.case_transpiler import transpile_cases
+from utils.test_merger import collect_test_names, merge_test_module
+from utils import case_transpiler, fixture_catalog, llm_outputs, test_merger
+from utils.llm_outputs import MergedEndpoint, SearchResult, TestCases, search_decided
 import glob
-from prompts import search_implementation, merge_results, generate_cases, write_tests
+from prompts import search_implementation, merge_results, generate_cases, write_tests, discover_routes
 import argparse
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 
 
 # Парсинг аргументов командной строки
 parser = argparse.ArgumentParser(description="API Test Generator")
 parser.add_argument("--debug", action="store_true", help="Включить подробный вывод")
+parser.add_argument("--workers", type=int, default=1, help="Количество эндпоинтов, обрабатываемых параллельно")
+parser.add_argument("--llm-concurrency", type=int, default=None,
+                    help="Максимум одновременных запросов к Ollama (по умолчанию = --workers)")
+parser.add_argument("--no-llm-cache", action="store_true", help="Не использовать кеш ответов модели")
+parser.add_argument("--refresh-llm-cache", action="store_true",
+                    help="Игнорировать сохранённые ответы модели и перезаписать их")
+parser.add_argument("--discovery", choices=["endpoint", "file"], default="endpoint",
+                    help="Поиск реализации: endpoint — по эндпоинту (до 10 попыток), "
+                         "file — один проход модели по каждому файлу с построением карты маршрутов")
+parser.add_argument("--force", action="store_true",
+                    help="Перегенерировать все эндпоинты, даже если их входные данные не изменились")
+parser.add_argument("--no-early-stop", action="store_true",
+                    help="Дожидаться полного ответа модели (без потокового чтения и ранней остановки)")
+parser.add_argument("--llm-cache-max-mb", type=int, default=512, help="Максимальный размер кеша ответов модели (МБ)")
 args = parser.parse_args()
 
 # Установка режима отладки
 set_debug(args.debug)
 
-# Глобальный кеш для conftest
+# Кеш ответов модели (temperature=0 → одинаковый вход даёт одинаковый ответ)
+configure_cache(
+    enabled=not args.no_llm_cache,
+    refresh=args.refresh_llm_cache,
+    max_bytes=args.llm_cache_max_mb * 1024 * 1024,
+)
+
+# Параллельный режим: общий event loop для запросов к модели и лимит на бэкенд
+if args.workers > 1:
+    set_concurrency_limit(args.llm_concurrency or args.workers)
+    start_background_loop()
+
+# Каталог фикстур conftest.py (строится один раз за процесс, разбор кешируется на диске)
 cached_fixtures_info = None
+cached_fixtures_lock = threading.Lock()
 
-# 1. Получаем список всех доступных сервисов(абсолютные пути)
-print_step(1, "Получение списка сервисов") # ... (существующий код)
+# Блокировки файлов тестов (по пути): шаги 8.1–8.6 для одного файла выполняются последовательно
+output_path_locks = {}
+output_path_locks_guard = threading.Lock()
 
-source_codes_path = os.path.join(os.path.dirname(__file__), "source_codes")
+root_path_services = os.path.join(os.path.dirname(__file__), "services")
 
-# Автоматическое создание директории source_codes
-if not os.path.exists(source_codes_path):
-    os.makedirs(source_codes_path)
-    print_warning(f"Создана директория: {source_codes_path}")
-    print_info("Поместите в неё папки с сервисами (исходный код + swagger.json)")
-services = [p for p in Path(source_codes_path).iterdir() if p.is_dir()]
 
-# 2. Парсим swagger.json
-print_step(2, "Парсинг swagger.json")
-for service in services:
-    swagger_path = os.path.join(service, "swagger.json")
-    with open(swagger_path, "r") as f:
-        swagger = json.load(f)
+# Вспомогательные функции
 
-    # 3. Получаем список эндпоинтов
-    print_step(3, "Получение списка эндпоинтов")
-    endpoints = extract_endpoints_swagger2(swagger)
-    
-    for endpoint in endpoints:
-        print_header(f"{endpoint['method']} {endpoint['path']}")
- 
-        # 4. Получаем абсолютный путь ко всем файлам сервиса
-        print_step(4, "Получение списка файлов")
-        files_path = os.path.join(service, "**", "*")
-        files = glob.glob(files_path, recursive=True)
-        # Исключаем файл swagger.json
-        files = [f for f in files if not os.path.basename(f) == "swagger.json" and os.path.isfile(f)]
-        
-        # Фильтруем файлы, оставляя только исходный код
-        source_extensions = {'.ml', '.mli', '.py', '.js', '.ts', '.go', '.java', '.c', '.cpp', '.h', '.rs'}
-        files = [f for f in files if Path(f).suffix in source_extensions]
-        
-        # Вспомогательные функции
-        def parse_text_response(text):
-            """Парсит текстовый ответ модели"""
-            lines = text.strip().split('\n')
-            data = {'status': None, 'file': None, 'reason': None, 'code_evidence': [], 'schema_fields': []}
+def parse_route_blocks(text):
+    """Парсит ответ discover_routes: список маршрутов из блоков ROUTE: ... END_ROUTE"""
+    routes = []
+    current = None
+    current_section = None
+
+    def finish(route):
+        route['code_evidence'] = '\n'.join(route['code_evidence']).strip()
+        route['schema_fields'] = '\n'.join(route['schema_fields']).strip()
+        if route['method'] and route['path']:
+            routes.append(route)
+
+    for line in text.strip().split('\n'):
+        line_stripped = line.strip()
+
+        if line_stripped.startswith('ROUTE:'):
+            if current:
+                finish(current)  # модель забыла END_ROUTE
+            parts = line_stripped[len('ROUTE:'):].split(None, 1)
+            current = {
+                'method': parts[0].upper() if parts else '',
+                'path': parts[1].strip() if len(parts) > 1 else '',
+                'handler': None, 'summary': None, 'response_code': None, 'schema_type': None,
+                'schema_fields': [], 'code_evidence': [],
+            }
             current_section = None
-            
-            for i, line in enumerate(lines):
-                line_stripped = line.strip()
-                
-                # Простые поля
-                for key, prefix in [('status', 'STATUS:'), ('file', 'FILE:'), ('reason', 'REASON:')]:
-                    if line_stripped.startswith(prefix):
-                        data[key] = line_stripped[len(prefix):].strip()
-                        current_section = None
-                        break
-                else:
-                    # Секции с несколькими строками
-                    if line_stripped.startswith('CODE_EVIDENCE:'):
-                        current_section = 'code'
-                    elif line_stripped.startswith('SCHEMA_FIELDS:'):
-                        current_section = 'schema'
-                    elif current_section == 'code':
-                        data['code_evidence'].append(lines[i])
-                    elif current_section == 'schema' and line_stripped:
-                        data['schema_fields'].append(lines[i])
-            
-            data['code_evidence'] = '\n'.join(data['code_evidence']).strip()
-            data['schema_fields'] = '\n'.join(data['schema_fields']).strip()
-            return data
-        
-        def remove_file(file_path):
-            """Удаляет файл из списка и выводит информацию"""
-            if file_path and file_path in files:
-                files.remove(file_path)
-                print(f"  [INFO] Файл {file_path} удалён из списка.")
-                print(f"  [INFO] Осталось файлов: {len(files)}")
-                return True
-            return False
-        
-        # 5. Получаем реализацию эндпоинта в исходном коде
-        print_step(5, "Получение реализации эндпоинта")
+            continue
+        if current is None:
+            continue
+        if line_stripped == 'END_ROUTE':
+            finish(current)
+            current = None
+            continue
 
-        source_code_schema = ""
-        
-        for attempt in range(1, 11):  # Максимум 10 попыток
-            prompt = search_implementation.get_user_prompt(endpoint["method"], endpoint["path"], files)
+        # Простые поля
+        for key, prefix in [('handler', 'HANDLER:'), ('summary', 'SUMMARY:'),
+                            ('response_code', 'RESPONSE_CODE:'), ('schema_type', 'SCHEMA_TYPE:')]:
+            if line_stripped.startswith(prefix):
+                current[key] = line_stripped[len(prefix):].strip()
+                current_section = None
+                break
+        else:
+            # Секции с несколькими строками
+            if line_stripped.startswith('CODE_EVIDENCE:'):
+                current_section = 'code'
+            elif line_stripped.startswith('SCHEMA_FIELDS:'):
+                current_section = 'schema'
+            elif current_section == 'code':
+                current['code_evidence'].append(line)
+            elif current_section == 'schema' and line_stripped:
+                current['schema_fields'].append(line)
+
+    if current:
+        finish(current)
+    return routes
+
+
+def resolve_from_route_map(route_map, endpoint):
+    """
+    Ищет эндпоинт в карте маршрутов сервиса.
+    Точное совпадение шаблона пути приоритетнее; иначе — самый длинный маршрут,
+    совпадающий с хвостом пути (роутер смонтирован с префиксом).
+    """
+    target = normalize_route(endpoint['path']).strip('/').split('/')
+    best, best_len = None, 0
+    for route_path, routes in route_map.items():
+        segments = route_path.strip('/').split('/')
+        if not segments[0] or len(segments) > len(target) or target[-len(segments):] != segments:
+            continue
+        for route in routes:
+            if route['method'] not in (endpoint['method'], 'ANY', '*'):
+                continue
+            if len(segments) > best_len:
+                best, best_len = route, len(segments)
+    return best
+
+
+def format_route_analysis(route):
+    """Приводит маршрут из карты к текстовому формату анализа кода (как в search_implementation)"""
+    return (
+        f"STATUS: FOUND\n"
+        f"FILE: {route['file']}\n"
+        f"CODE_EVIDENCE:\n{route['code_evidence']}\n\n"
+        f"SUMMARY: {route['summary'] or ''}\n"
+        f"RESPONSE_CODE: {route['response_code'] or 200}\n"
+        f"SCHEMA_TYPE: {route['schema_type'] or 'object'}\n"
+        f"SCHEMA_FIELDS:\n{route['schema_fields']}"
+    ).strip()
+
+
+DISCOVERY_CHUNK_CHARS = 16000  # Крупные файлы отдаём модели частями по строкам
+
+
+def discover_file_routes(file_path, route_index):
+    """Один проход модели по файлу: все маршруты, которые он регистрирует"""
+    print_substep("5", f"Маршруты файла {os.path.basename(file_path)}")
+    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+        lines = f.readlines()
+
+    chunks, current = [], ""
+    for line in lines:
+        if current and len(current) + len(line) > DISCOVERY_CHUNK_CHARS:
+            chunks.append(current)
+            current = ""
+        current += line
+    if current:
+        chunks.append(current)
+
+    known_routes = set(route_index.routes.get(file_path, []))
+    routes = []
+    for chunk in chunks:
+        result, _ = send_messages(
+            discover_routes.get_user_prompt(file_path, chunk),
+            system_prompt=discover_routes.SYSTEM_PROMPT,
+            use_tools=False,
+            step_name=f"Маршруты файла {os.path.basename(file_path)}"
+        )
+        for route in parse_route_blocks(result):
+            # СТРОГАЯ проверка: такой строковый литерал действительно есть в файле
+            if normalize_route(route['path']) not in known_routes:
+                print(f"  [REJECT] Маршрута {route['path']} нет среди литералов файла - галлюцинация.")
+                continue
+            route['file'] = file_path
+            routes.append(route)
+
+    print_info(f"Маршрутов: {len(routes)}")
+    return routes
+
+
+def build_route_map(files, route_index):
+    """
+    Файлово-ориентированный поиск: каждый файл с литералами-маршрутами читается моделью
+    один раз. Возвращает карту: нормализованный путь -> список маршрутов (method, file, evidence, ...).
+    """
+    candidates = [f for f in files if route_index.routes.get(f)]
+    print_info(f"Файлов с маршрутами: {len(candidates)} из {len(files)}")
+
+    route_map = {}
+    for routes in run_parallel(discover_file_routes, candidates, route_index):
+        for route in routes or []:
+            route_map.setdefault(normalize_route(route['path']), []).append(route)
+    return route_map
+
+
+def collect_source_files(service):
+    """Абсолютные пути ко всем файлам исходного кода сервиса"""
+    files_path = os.path.join(service, "**", "*")
+    files = glob.glob(files_path, recursive=True)
+    # Исключаем файл swagger.json
+    files = [f for f in files if not os.path.basename(f) == "swagger.json" and os.path.isfile(f)]
+    
+    # Фильтруем файлы, оставляя только исходный код
+    source_extensions = {'.ml', '.mli', '.py', '.js', '.ts', '.go', '.java', '.c', '.cpp', '.h', '.rs'}
+    return [f for f in files if Path(f).suffix in source_extensions]
+
+
+def search_endpoint_implementation(endpoint, files, route_index):
+    """
+    Поиск реализации эндпоинта: модель читает файлы-кандидаты по одному (до 10 попыток).
+    Возвращает (текстовый анализ кода, путь к файлу) или ("", None).
+    """
+    # Собственная копия: remove_file сокращает список по ходу поиска
+    files = list(files)
+
+    def remove_file(file_path):
+        """Удаляет файл из списка и выводит информацию"""
+        if file_path and file_path in files:
+            files.remove(file_path)
+            print(f"  [INFO] Файл {file_path} удалён из списка.")
+            print(f"  [INFO] Осталось файлов: {len(files)}")
+            return True
+        return False
+    
+    for attempt in range(1, 11):  # Максимум 10 попыток
+        # Кандидаты, ранжированные по статическому индексу маршрутов
+        candidates = route_index.shortlist(endpoint["path"], files)
+        prompt = search_implementation.get_user_prompt(endpoint["method"], endpoint["path"], candidates)
+        try:
             result, all_messages = send_messages(
                 prompt, [], search_implementation.SYSTEM_PROMPT,
-                step_name=f"Поиск реализации (попытка {attempt})"
+                step_name=f"Поиск реализации (попытка {attempt})",
+                output_type=SearchResult,
+                stop_when=None if args.no_early_stop else search_decided(files),
             )
-            
-            # Проверяем вызов read_file
-            tool_called = any(
-                hasattr(msg, 'parts') and any(
-                    hasattr(part, 'tool_name') and part.tool_name == 'read_file'
-                    for part in (msg.parts if hasattr(msg, 'parts') else [])
-                )
-                for msg in all_messages
+        except UnexpectedModelBehavior as e:
+            # Ответ не прошел валидацию схемы и после повторных запросов
+            print(f"  [ERROR] Невалидный ответ модели: {e}")
+            if files:
+                removed_file = files.pop(0)
+                print_info(f"Файл {os.path.basename(removed_file)} удалён (fallback). Осталось: {len(files)}")
+            continue
+        
+        # Проверяем вызов read_file
+        tool_called = any(
+            hasattr(msg, 'parts') and any(
+                hasattr(part, 'tool_name') and part.tool_name == 'read_file'
+                for part in (msg.parts if hasattr(msg, 'parts') else [])
             )
-            
-            if not tool_called:
-                print(f"  [WARNING] Модель НЕ вызвала read_file! Пропускаем итерацию.")
-                continue
-            
-            try:
-                # Парсим ответ
-                data = parse_text_response(result)
-                
-                # Валидация формата
-                if not data['status'] or not data['file']:
-                    print(f"  [ERROR] Неверный формат ответа: отсутствует STATUS или FILE")
-                    continue
-                
-                print(f"  [INFO] Файл: {data['file']}")
-                
-                # NOT_FOUND
-                if data['status'] == 'NOT_FOUND':
-                    print(f"  [NOT FOUND] Реализация не найдена")
-                    if data['reason']:
-                        print(f"  [REASON] {data['reason']}")
-                    remove_file(data['file'])
-                    continue
-                
-                # Неизвестный статус
-                if data['status'] != 'FOUND':
-                    print(f"  [ERROR] Неизвестный STATUS: {data['status']}")
-                    continue
-                
-                # FOUND - проверки
-                if not data['code_evidence']:
-                    print(f"  [ERROR] FOUND, но нет CODE_EVIDENCE")
-                    remove_file(data['file'])
-                    continue
-                
-                print_success("Реализация найдена!")
-                code_evidence_str = data['code_evidence']
-                print_info(f"Код: {code_evidence_str[:80]}...")
-                
-                if data['schema_fields']:
-                    print(f"  [SCHEMA] {data['schema_fields'][:100]}...")
-                
-                # СТРОГАЯ проверка: маршрут в code_evidence
-                if endpoint['path'] not in data['code_evidence']:
-                    print(f"  [REJECT] CODE_EVIDENCE НЕ содержит маршрут {endpoint['path']}!")
-                    print(f"  [REJECT] Это галлюцинация - модель процитировала нерелевантный код.")
-                    remove_file(data['file'])
-                    continue
-                
-                # Успех!
-                source_code_schema = result.strip()
-                break
-                
-            except Exception as e:
-                print(f"  [ERROR] Ошибка обработки: {e}")
-                
-                # Пытаемся извлечь FILE:
-                import re
-                match = re.search(r'FILE:\s*(.+)', result)
-                if match and remove_file(match.group(1).strip()):
-                    continue
-                
-                # Fallback - удаляем первый файл
-                if files:
-                    removed_file = files.pop(0)
-                    print(f"  [WARNING] Не удалось извлечь FILE")
-                    print_info(f"Файл {os.path.basename(removed_file)} удалён (fallback). Осталось: {len(files)}")
-                continue
-
-        if not source_code_schema:
-            print(f"Прекращение обработки эндпоинта {endpoint['path']} после 10 попыток.")
+            for msg in all_messages
+        )
+        
+        if not tool_called:
+            print(f"  [WARNING] Модель НЕ вызвала read_file! Пропускаем итерацию.")
             continue
         
-        # 6. Объединяем результаты в один JSON
-        print_step(6, "Объединение результатов")
-        prompt = merge_results.get_user_prompt(endpoint, source_code_schema)
+        print(f"  [INFO] Файл: {result.file}")
+        
+        # NOT_FOUND
+        if result.status == 'NOT_FOUND':
+            print(f"  [NOT FOUND] Реализация не найдена")
+            if result.reason:
+                print(f"  [REASON] {result.reason}")
+            remove_file(result.file)
+            continue
+        
+        # FOUND - проверки
+        if not result.code_evidence.strip():
+            print(f"  [ERROR] FOUND, но нет CODE_EVIDENCE")
+            remove_file(result.file)
+            continue
+        
+        print_success("Реализация найдена!")
+        print_info(f"Код: {result.code_evidence[:80]}...")
+        
+        if result.schema_fields:
+            print(f"  [SCHEMA] {'; '.join(result.schema_fields)[:100]}...")
+        
+        # СТРОГАЯ проверка: маршрут в code_evidence
+        if endpoint['path'] not in result.code_evidence:
+            print(f"  [REJECT] CODE_EVIDENCE НЕ содержит маршрут {endpoint['path']}!")
+            print(f"  [REJECT] Это галлюцинация - модель процитировала нерелевантный код.")
+            remove_file(result.file)
+            continue
+        
+        # Успех!
+        return result.to_text(), result.file
+
+    return "", None
+
 
-        system_prompt = merge_results.SYSTEM_PROMPT
+_LATENCY_BUDGET_RE = re.compile(r"^LATENCY_BUDGET_MS\s*=.*$", re.MULTILINE)
+_METHOD_LINE_RE = re.compile(r"^METHOD\s*=.*$", re.MULTILINE)
 
-        merged_schema, _ = send_messages(
+
+def ensure_latency_budget(test_code, budget_ms):
+    """
+    LATENCY_BUDGET_MS в модуле тестов: значение из x-latency-budget-ms swagger
+    (None — бюджет сервиса из LATENCY_BUDGETS_MS, если он задан). Модель может потерять
+    или исказить строку, поэтому она выставляется здесь явно.
+    """
+    line = f"LATENCY_BUDGET_MS = {budget_ms!r}"
+    if _LATENCY_BUDGET_RE.search(test_code):
+        # Значение модели не сохраняется даже при None: выдуманный бюджет
+        # перекрыл бы бюджет сервиса
+        return _LATENCY_BUDGET_RE.sub(line, test_code, count=1)
+    method_line = _METHOD_LINE_RE.search(test_code)
+    if method_line is None:
+        return test_code
+    return f"{test_code[:method_line.end()]}\n{line}{test_code[method_line.end():]}"
+
+
+def process_endpoint(endpoint, service, service_ctx):
+    """
+    Шаги 5–8.6 для одного эндпоинта.
+    service_ctx — общие для сервиса данные: manifest, files, route_index, route_map.
+    """
+    print_header(f"{endpoint['method']} {endpoint['path']}")
+
+    manifest = service_ctx["manifest"]
+
+    # Пропускаем эндпоинт, если swagger, реализация, промпты и файл тестов не менялись
+    if not args.force and manifest.is_up_to_date(endpoint):
+        print_success("Без изменений (манифест), пропускаем")
+        return
+
+    # 5. Получаем реализацию эндпоинта в исходном коде
+    print_step(5, "Получение реализации эндпоинта")
+
+    source_code_schema = ""
+    implementation_file = None
+
+    # Файлово-ориентированный режим: сначала ищем в карте маршрутов сервиса
+    route_map = service_ctx.get("route_map")
+    if route_map is not None:
+        route = resolve_from_route_map(route_map, endpoint)
+        if route:
+            print_success(f"Маршрут найден в карте: {route['method']} {route['path']}")
+            print_info(f"Файл: {route['file']}")
+            source_code_schema = format_route_analysis(route)
+            implementation_file = route['file']
+        else:
+            print_warning("Маршрута нет в карте, переходим к поиску по файлам")
+
+    if not source_code_schema:
+        source_code_schema, implementation_file = search_endpoint_implementation(
+            endpoint, service_ctx["files"], service_ctx["route_index"]
+        )
+
+    if not source_code_schema:
+        print(f"Прекращение обработки эндпоинта {endpoint['path']} после 10 попыток.")
+        return
+    
+    # 6. Объединяем результаты в один JSON
+    print_step(6, "Объединение результатов")
+    prompt = merge_results.get_user_prompt(endpoint, source_code_schema)
+
+    system_prompt = merge_results.SYSTEM_PROMPT
+
+    try:
+        merged, _ = send_messages(
             prompt, 
             system_prompt=system_prompt, 
             use_tools=False,
-            step_name="Объединение результатов (Swagger + Code)"
+            step_name="Объединение результатов (Swagger + Code)",
+            output_type=MergedEndpoint,
         )
-        merged_schema = strip_markdown(merged_schema)
+    except UnexpectedModelBehavior as e:
+        print_error(f"Схема эндпоинта не прошла валидацию: {e}")
+        return
+    merged_schema = merged.model_dump_json(indent=2)
 
-        # 7. Генерируем кейсы
-        print_step(7, "Генерация тестовых кейсов")
-        prompt = generate_cases.get_user_prompt(merged_schema)
+    # 7. Генерируем кейсы
+    print_step(7, "Генерация тестовых кейсов")
+    prompt = generate_cases.get_user_prompt(merged_schema)
 
-        system_prompt = generate_cases.SYSTEM_PROMPT
+    system_prompt = generate_cases.SYSTEM_PROMPT
 
+    try:
         gen_cases, _ = send_messages(
             prompt, 
             system_prompt=system_prompt, 
             use_tools=False,
-            step_name="Генерация тестовых кейсов"
+            step_name="Генерация тестовых кейсов",
+            output_type=TestCases,
         )
-        gen_cases = strip_markdown(gen_cases)
+    except UnexpectedModelBehavior as e:
+        print_error(f"Кейсы не прошли валидацию: {e}")
+        return
 
-        # 8. Формируем файл с тестами (6 подшагов)
-        root_path_services = os.path.join(os.path.dirname(__file__), "services")
-        service_test_dir = os.path.join(root_path_services, service.name)
-        
-        endpoint_filename = endpoint['path'].strip('/').replace('/', '_') or "root"
-        full_path_endpoint = os.path.join(service_test_dir, f"{endpoint_filename}.py")
-
-        print_step(8, "Создание файла тестов")
-        print_info(f"Файл: {full_path_endpoint}")
-
-        # 8.1 Проверка существования файла
-        print_substep("8.1", "Проверка файла")
-        prompt = write_tests.get_step1_check_file_prompt(full_path_endpoint)
-        result, _ = send_messages(prompt, step_name="Проверка файла")
-        file_exists = result.upper().strip().rstrip('.!?') == "СУЩЕСТВУЕТ"  # Точная проверка (игнорируем знаки препинания)
-        existing_content = ""
-        
-        if file_exists:
-            print_warning("Файл уже существует, будем объединять кейсы")
-            with open(full_path_endpoint, 'r') as f:
-                existing_content = f.read()
-        else:
-            print_info("Файл не существует, будет создан")
+    # 8. Формируем файл с тестами (6 подшагов)
+    service_test_dir = os.path.join(root_path_services, service.name)
+    
+    endpoint_filename = endpoint['path'].strip('/').replace('/', '_') or "root"
+    full_path_endpoint = os.path.join(service_test_dir, f"{endpoint_filename}.py")
 
-        # 8.2 Чтение conftest.py (с кешированием)
-        print_substep("8.2", "Чтение conftest.py")
-        conftest_path = os.path.join(root_path_services, "conftest.py")
-        
+    with output_path_lock(full_path_endpoint):
+        write_endpoint_tests(endpoint, merged, gen_cases, implementation_file, manifest, full_path_endpoint)
+
+
+def output_path_lock(path):
+    """Блокировка файла тестов: GET /x и POST /x в параллельном режиме пишут один и тот же x.py"""
+    with output_path_locks_guard:
+        return output_path_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+def write_endpoint_tests(endpoint, merged, gen_cases, implementation_file, manifest, full_path_endpoint):
+    """
+    Шаги 8.1–8.6: чтение, слияние и запись файла тестов.
+    Вызывается под output_path_lock(full_path_endpoint).
+    """
+    global cached_fixtures_info
+
+    print_step(8, "Создание файла тестов")
+    print_info(f"Файл: {full_path_endpoint}")
+
+    # 8.1 Проверка существования файла
+    print_substep("8.1", "Проверка файла")
+    prompt = write_tests.get_step1_check_file_prompt(full_path_endpoint)
+    result, _ = send_messages(prompt, step_name="Проверка файла")
+    file_exists = result.upper().strip().rstrip('.!?') == "СУЩЕСТВУЕТ"  # Точная проверка (игнорируем знаки препинания)
+    existing_content = ""
+    
+    if file_exists:
+        print_warning("Файл уже существует, будем объединять кейсы")
+        with open(full_path_endpoint, 'r') as f:
+            existing_content = f.read()
+    else:
+        print_info("Файл не существует, будет создан")
+
+    # 8.2 Каталог фикстур conftest.py (ast, без модели)
+    print_substep("8.2", "Каталог фикстур conftest.py")
+    conftest_path = os.path.join(root_path_services, "conftest.py")
+
+    with cached_fixtures_lock:
         if cached_fixtures_info:
             fixtures_info = cached_fixtures_info
             print_info("Используем закешированную информацию о фикстурах")
         else:
-            prompt = write_tests.get_step2_read_conftest_prompt(conftest_path)
-            fixtures_info, _ = send_messages(prompt, step_name="Чтение conftest")
+            catalog = FixtureCatalog(conftest_path)
+            fixtures_info = catalog.render()
             cached_fixtures_info = fixtures_info
-            print_success("Фикстуры найдены и закешированы")
+            print_success(f"Фикстур: {len(catalog.fixtures)} (файлов разобрано заново: {catalog.reparsed})")
 
-        # 8.3 Преобразование кейсов JSON → Python
-        print_substep("8.3", "Преобразование кейсов JSON → Python")
-        prompt = write_tests.get_step3_transform_cases_prompt(gen_cases)
-        result, _ = send_messages(prompt, use_tools=False, step_name="Преобразование кейсов")
-        cases_code = strip_markdown(result)
-        
-        
-        # Парсим POSITIVE_CASES и NEGATIVE_CASES
-        positive_cases = "[]"
-        negative_cases = "[]"
-        if "POSITIVE_CASES" in cases_code:
-            start = cases_code.find("POSITIVE_CASES = ")
-            if start != -1:
-                end = cases_code.find("\n\nNEGATIVE_CASES", start)
-                if end == -1:
-                    end = cases_code.find("\nNEGATIVE_CASES", start)
-                if end != -1:
-                    positive_cases = cases_code[start:end].replace("POSITIVE_CASES = ", "").strip()
-        
-        if "NEGATIVE_CASES" in cases_code:
-            start = cases_code.find("NEGATIVE_CASES = ")
-            if start != -1:
-                negative_cases = cases_code[start:].replace("NEGATIVE_CASES = ", "").strip()
-        
-        # Валидация: проверка количества кейсов
-        try:
-            json_cases = json.loads(gen_cases)
-            json_count = len(json_cases)
-            python_count = positive_cases.count("pytest.param") + negative_cases.count("pytest.param")
-            
-            if python_count < json_count:
-                print_warning(f"Модель потеряла кейсы! JSON: {json_count}, Python: {python_count}")
-            elif python_count == json_count:
-                print_success(f"Все {json_count} кейсов преобразованы корректно")
-            else:
-                print_info(f"Кейсов: JSON={json_count}, Python={python_count}")
-        except Exception as e:
-            print_warning(f"Не удалось проверить количество кейсов: {e}")
-        
-        print_success("Кейсы преобразованы")
+    # 8.3 Преобразование кейсов JSON → Python (без модели)
+    print_substep("8.3", "Преобразование кейсов JSON → Python")
+    json_cases = [case.model_dump() for case in gen_cases.cases]
+    positive_cases, negative_cases, transpile_warnings = transpile_cases(json_cases, endpoint.get('method', 'GET'))
+    for warning in transpile_warnings:
+        print_warning(warning)
+    print_success(
+        f"Кейсов: {len(json_cases)} "
+        f"(positive: {positive_cases.count('pytest.param')}, negative: {negative_cases.count('pytest.param')})"
+    )
 
-        # 8.4 Генерация кода теста
-        print_substep("8.4", "Генерация кода теста")
+    # 8.4 Генерация кода теста
+    print_substep("8.4", "Генерация кода теста")
+    
+    schema_json = json.dumps(merged.responses.get('200', {}).get('schema', {}))
+    
+    prompt = write_tests.get_step4_generate_code_prompt(
+        endpoint['path'],
+        endpoint.get('method', 'GET'),
+        schema_json,
+        positive_cases,
+        negative_cases,
+        fixtures_info,
+        latency_budget_ms=endpoint.get('x_latency_budget_ms'),
+    )
+    result, _ = send_messages(prompt, use_tools=False, step_name="Генерация кода")
+    
+    # Убираем markdown разметку (включая dedent)
+    test_code = strip_markdown(result)
+    
+    # autopep8 для базового PEP8 форматирования (без агрессивных изменений)
+    try:
+        import autopep8
+        original_code = test_code
+        test_code = autopep8.fix_code(test_code)  # Без aggressive - только базовые исправления
         
-        # merged_schema это строка JSON, нужно распарсить
+        if test_code != original_code:
+            print_info("Код отформатирован (autopep8)")
+    except Exception as e:
+        print_warning(f"autopep8: {e}")
+    
+    test_code = ensure_latency_budget(test_code.strip(), endpoint.get('x_latency_budget_ms'))
+
+    
+    print_success(f"Код сгенерирован ({len(test_code)} символов)")
+
+    # 8.5 Валидация синтаксиса Python
+    print_substep("8.5", "Валидация синтаксиса Python")
+    try:
+        compile(test_code, '<string>', 'exec')
+        print_success("Код валидный")
+    except SyntaxError as e:
+        print_error(f"Синтаксическая ошибка: {e}")
+        print_warning("Пропускаем создание файла")
+        return
+
+    # 8.5.1 Слияние с существующим файлом (ast, без модели)
+    if file_exists and existing_content:
+        print_substep("8.5.1", "Слияние с существующим файлом")
         try:
-            merged_schema_dict = json.loads(merged_schema)
-            schema_json = json.dumps(merged_schema_dict.get('responses', {}).get('200', {}).get('schema', {}))
-        except json.JSONDecodeError:
-            print(f"  [ERROR] Не удалось распарсить merged_schema как JSON")
-            schema_json = "{}"
-        
-        prompt = write_tests.get_step4_generate_code_prompt(
-            endpoint['path'],
-            endpoint.get('method', 'GET'),
-            schema_json,
-            positive_cases,
-            negative_cases,
-            fixtures_info,
-            existing_content
-        )
-        result, _ = send_messages(prompt, use_tools=False, step_name="Генерация кода")
-        
-        # Убираем markdown разметку (включая dedent)
-        test_code = strip_markdown(result)
-        
-        # autopep8 для базового PEP8 форматирования (без агрессивных изменений)
+            merge = merge_test_module(existing_content, test_code)
+        except SyntaxError as e:
+            print_error(f"Существующий файл не разбирается: {e}")
+            print_warning("Файл НЕ будет перезаписан для безопасности.")
+            return
+
+        lost = collect_test_names(existing_content) - collect_test_names(merge.code)
+        if lost:
+            print_error(f"ОПАСНОСТЬ: при слиянии потеряны тесты: {', '.join(sorted(lost))}")
+            print_warning("Файл НЕ будет перезаписан для безопасности.")
+            return
+
+        test_code = merge.code
+        if merge.renamed:
+            print_info("Переименовано: " + ", ".join(f"{a} -> {b}" for a, b in merge.renamed.items()))
+        print_success(f"Заменено: {len(merge.replaced)}, добавлено: {len(merge.added)}")
+
+    # 8.6 Запись файла
+    print_substep("8.6", "Запись файла")
+    
+    # Создать директорию если нужно
+    if not file_exists:
+        os.makedirs(os.path.dirname(full_path_endpoint), exist_ok=True)
+        print_info(f"Директория создана: {os.path.basename(os.path.dirname(full_path_endpoint))}")
+    
+    # Записать файл НАПРЯМУЮ (без LLM, чтобы не портить код)
+    with open(full_path_endpoint, 'w', encoding='utf-8') as f:
+        f.write(test_code)
+    
+    print_success(f"Файл с тестами {'обновлён' if file_exists else 'создан'}!")
+    print_info(f"Путь: {full_path_endpoint}")
+
+    manifest.record(endpoint, implementation_file, full_path_endpoint)
+
+
+def _run_buffered(func, item, *extra):
+    """Выполняет func(item, *extra) в воркере, собирая его вывод в отдельный буфер"""
+    result = None
+    with capture_output() as buffer:
         try:
-            import autopep8
-            original_code = test_code
-            test_code = autopep8.fix_code(test_code)  # Без aggressive - только базовые исправления
-            
-            if test_code != original_code:
-                print_info("Код отформатирован (autopep8)")
+            result = func(item, *extra)
         except Exception as e:
-            print_warning(f"autopep8: {e}")
-        
-        test_code = test_code.strip()
+            print_error(f"Ошибка обработки: {e}")
+    return buffer.getvalue(), result
 
-        
-        print_success(f"Код сгенерирован ({len(test_code)} символов)")
 
-        # 8.5 Валидация синтаксиса Python
-        print_substep("8.5", "Валидация синтаксиса Python")
-        try:
-            compile(test_code, '<string>', 'exec')
-            print_success("Код валидный")
-        except SyntaxError as e:
-            print_error(f"Синтаксическая ошибка: {e}")
-            print_warning("Пропускаем создание файла")
-            continue
+def run_parallel(func, items, *extra):
+    """
+    Вызывает func(item, *extra) для каждого элемента (items может быть ленивым итератором).
+    При --workers > 1 — на пуле потоков; лог каждого элемента выводится целиком и в исходном порядке.
+    В работе одновременно не больше 2 * workers элементов, поэтому items читается по мере обработки.
+    Возвращает результаты в порядке items.
+    """
+    if args.workers <= 1:
+        return [func(item, *extra) for item in items]
 
-        # 8.5.1 Проверка на потерю тестов (Safety Check)
-        if file_exists and existing_content:
-            old_tests_count = existing_content.count("def test_")
-            new_tests_count = test_code.count("def test_")
-            
-            if new_tests_count < old_tests_count:
-                print_error(f"ОПАСНОСТЬ: Модель потеряла тесты! Было: {old_tests_count}, Стало: {new_tests_count}")
-                print_warning("Файл НЕ будет перезаписан для безопасности.")
-                continue
-            
-            print_success(f"Количество тестов: {old_tests_count} -> {new_tests_count}")
+    results = []
+    in_flight = deque()
 
-        # 8.6 Запись файла
-        print_substep("8.6", "Запись файла")
-        
-        # Создать директорию если нужно
-        if not file_exists:
-            os.makedirs(os.path.dirname(full_path_endpoint), exist_ok=True)
-            print_info(f"Директория создана: {os.path.basename(os.path.dirname(full_path_endpoint))}")
-        
-        # Записать файл НАПРЯМУЮ (без LLM, чтобы не портить код)
-        with open(full_path_endpoint, 'w', encoding='utf-8') as f:
-            f.write(test_code)
-        
-        print_success(f"Файл с тестами {'обновлён' if file_exists else 'создан'}!")
-        print_info(f"Путь: {full_path_endpoint}")
+    def drain_one():
+        output, result = in_flight.popleft().result()
+        sys.stdout.write(output)
+        sys.stdout.flush()
+        results.append(result)
+
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="worker") as pool:
+        for item in items:
+            if len(in_flight) >= 2 * args.workers:
+                drain_one()
+            in_flight.append(pool.submit(_run_buffered, func, item, *extra))
+        while in_flight:
+            drain_one()
+    return results
+
+
+# 1. Получаем список всех доступных сервисов(абсолютные пути)
+print_step(1, "Получение списка сервисов") # ... (существующий код)
+
+source_codes_path = os.path.join(os.path.dirname(__file__), "source_codes")
+
+# Автоматическое создание директории source_codes
+if not os.path.exists(source_codes_path):
+    os.makedirs(source_codes_path)
+    print_warning(f"Создана директория: {source_codes_path}")
+    print_info("Поместите в неё папки с сервисами (исходный код + swagger.json)")
+services = [p for p in Path(source_codes_path).iterdir() if p.is_dir()]
+
+# 2. Парсим swagger.json
+print_step(2, "Парсинг swagger.json")
+for service in services:
+    swagger_path = os.path.join(service, "swagger.json")
+
+    # 3. Получаем список эндпоинтов: лениво, операции разбираются по мере обработки
+    # (повторно — из бинарного кеша рядом со swagger.json)
+    print_step(3, "Получение списка эндпоинтов")
+    # closing: при исключении или Ctrl-C недочитанный генератор закрывается сразу
+    # и удаляет свой временный файл кеша
+    with closing(iter_endpoints_swagger2(swagger_path)) as endpoints:
+        manifest = BuildManifest(
+            os.path.join(root_path_services, service.name),
+            # Схемы ответов и код шагов 8.2–8.5 (каталог фикстур, преобразование кейсов,
+            # слияние) влияют на результат так же, как промпты: их изменение требует перегенерации
+            prompt_versions(
+                search_implementation, merge_results, generate_cases, write_tests, discover_routes,
+                llm_outputs, fixture_catalog, case_transpiler, test_merger,
+            ),
+        )
+
+        # 4. Получаем абсолютный путь ко всем файлам сервиса (один раз на сервис)
+        print_step(4, "Получение списка файлов")
+        files = collect_source_files(service)
+        route_index = RouteIndex(os.path.join(root_path_services, service.name), files)
+        print_info(f"Файлов: {len(files)}, проиндексировано заново: {route_index.rescanned}")
+
+        service_ctx = {"manifest": manifest, "files": files, "route_index": route_index, "route_map": None}
+
+        # 5. (file-режим) Карта маршрутов сервиса: один проход модели по каждому файлу
+        if args.discovery == "file":
+            endpoints = list(endpoints)
+            pending = [e for e in endpoints if args.force or not manifest.is_up_to_date(e)]
+            if pending:
+                print_step(5, "Построение карты маршрутов сервиса")
+                service_ctx["route_map"] = build_route_map(files, route_index)
+                print_success(f"Маршрутов в карте: {sum(len(r) for r in service_ctx['route_map'].values())}")
+
+        # Шаги 5–8.6 для каждого эндпоинта
+        run_parallel(process_endpoint, endpoints, service, service_ctx)
+
+if args.workers > 1:
+    stop_background_loop()
+
+stats = cache_stats()
+if stats is not None:
+    print_info(
+        f"Кеш модели: попаданий {stats['hits']}, промахов {stats['misses']} "
+        f"(устаревших {stats['stale']}), записано {stats['writes']}, вытеснено {stats['evictions']}"
+    )
+
+# Типизированные ответы: сколько прошли валидацию сразу, сколько исправлены повтором
+# (база для сравнения — доля неразобранных ответов прежнего текстового режима:
+# benchmarks/bench_structured_outputs.py)
+for output_name, output_stats in structured_stats().items():
+    calls = output_stats['calls']
+    print_info(
+        f"{output_name}: вызовов {calls}, с первой попытки {output_stats['first_try']}, "
+        f"исправлено {output_stats['repaired']}, отказов {output_stats['failed']}, "
+        f"повторных запросов {output_stats['retries']} "
+        f"(с повтором {(output_stats['repaired'] + output_stats['failed']) / calls:.0%})"
+    )
+
+# Ранняя остановка потоковых ответов по этапам
+for stage, stage_stats in stream_stats().items():
+    saved = stage_stats['saved_tokens']
+    print_info(
+        f"Ранняя остановка {stage}: вызовов {stage_stats['calls']}, остановлено {stage_stats['stopped']}, "
+        f"сгенерировано до остановки ~{stage_stats['stopped_tokens']} ток., "
+        f"сэкономлено ~{saved if saved is not None else 'н/д'} ток."
+    )
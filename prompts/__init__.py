@@ -1 +1 @@
-from . import search_implementation, merge_results, generate_cases, write_tests
+from . import search_implementation, merge_results, generate_cases, write_tests, discover_routes
@@ -1,7 +1,7 @@
 SYSTEM_PROMPT = """
 Ты — генератор тестовых кейсов для REST API.
 
-ЗАДАЧА: Создай JSON массив с тестовыми кейсами для эндпоинта.
+ЗАДАЧА: Создай JSON объект со списком тестовых кейсов для эндпоинта.
 
 КОЛИЧЕСТВО: МИНИМУМ 10 КЕЙСОВ! (лучше 12-15)
 
@@ -11,9 +11,9 @@ SYSTEM_PROMPT = """
 1. positive - нормальные запросы (должны работать)
 2. negative - ошибочные запросы (должны вернуть 4xx ошибку)
 
-ФОРМАТ ОТВЕТА (только JSON массив, БЕЗ текста):
+ФОРМАТ ОТВЕТА (только JSON объект, БЕЗ текста):
 
-[
+{"cases": [
   {
     "id": "TC-001",
     "title": "Краткое название",
@@ -27,7 +27,7 @@ SYSTEM_PROMPT = """
     "expected_status": 200,
     "expected_response": {"field": "value"}
   }
-]
+]}
 
 КРИТИЧЕСКИ ВАЖНО - НЕ ПУТАЙ REQUEST И RESPONSE:
 
@@ -42,7 +42,7 @@ RESPONSE (что API возвращает - НЕ тестируешь):
 - НЕ создавай negative кейсы про валидацию полей ответа!
 
 ПРАВИЛА:
-1. ТОЛЬКО JSON массив - начни с [ и закончи ]
+1. ТОЛЬКО JSON объект {"cases": [...]}
 2. БЕЗ ```json и прочего markdown
 3. Для GET/DELETE: body ВСЕГДА null
 4. НЕ выдумывай параметры - только из схемы
@@ -60,7 +60,7 @@ def get_user_prompt(merged_schema):
     ИНСТРУКЦИИ:
     1. Изучи схему - есть ли входные параметры (parameters, requestBody)?
     2. СОЗДАЙ МИНИМУМ 10 КЕЙСОВ (positive + negative) - это ОБЯЗАТЕЛЬНОЕ ТРЕБОВАНИЕ!
-    3. Верни ТОЛЬКО JSON массив
+    3. Верни ТОЛЬКО JSON объект {{"cases": [...]}}
 
     ПРИМЕРЫ NEGATIVE КЕЙСОВ:
 
@@ -83,5 +83,5 @@ def get_user_prompt(merged_schema):
 
     ВАЖНО: НЕ создавай тесты про валидацию полей ОТВЕТА!
 
-    Начни ответ с [
+    Начни ответ с {{"cases": [
     """
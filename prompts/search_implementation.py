@@ -5,28 +5,24 @@ SYSTEM_PROMPT = """
 
 ОБЯЗАТЕЛЬНО:
 1. Вызови инструмент read_file с путём к файлу
-2. После чтения файла - проанализируй код и ответь в формате ниже
+2. После чтения файла - проанализируй код и верни результат через инструмент final_result
 
-ФОРМАТ ОТВЕТА (после чтения файла):
+ПОЛЯ РЕЗУЛЬТАТА:
 
 Если НАШЁЛ код с маршрутом:
-STATUS: FOUND
-FILE: <путь к прочитанному файлу>
-CODE_EVIDENCE:
-<точная цитата кода из файла>
-
-SUMMARY: <описание>
-DESCRIPTION: <детали>
-RESPONSE_CODE: 200
-RESPONSE_DESCRIPTION: <описание>
-SCHEMA_TYPE: object или array
-SCHEMA_FIELDS:
-field: type | description
+- status: "FOUND"
+- file: путь к прочитанному файлу
+- code_evidence: точная цитата кода из файла
+- summary, description: описание эндпоинта
+- response_code: 200
+- response_description: описание ответа
+- schema_type: "object" или "array"
+- schema_fields: список строк "field: type | description"
 
 Если НЕ НАШЁЛ:
-STATUS: NOT_FOUND
-FILE: <путь к прочитанному файлу>
-REASON: <причина>
+- status: "NOT_FOUND"
+- file: путь к прочитанному файлу
+- reason: причина
 
 КРИТИЧЕСКИ ВАЖНО:
 1. СНАЧАЛА вызови read_file - БЕЗ ЭТОГО НЕЛЬЗЯ ОТВЕЧАТЬ!
@@ -38,33 +34,23 @@ def get_user_prompt(method, path, files):
    return f"""
 Найди реализацию: {method} {path}
 
-ФАЙЛЫ:
+ФАЙЛЫ (отсортированы по вероятности, первый — самый вероятный):
 {files}
 
 ШАГ 1 (ОБЯЗАТЕЛЬНО): Вызови инструмент read_file
-- Выбери ОДИН файл из списка выше
+- Выбери ОДИН файл из списка выше (начни с первого)
 - Вызови: read_file(file_path="<путь к файлу>")
 - Дождись результата
 
 ШАГ 2 (после чтения): Найди в коде маршрут "{path}"
 
-ШАГ 3 (если нашёл): Ответь форматом:
-STATUS: FOUND
-FILE: <путь к файлу>
-CODE_EVIDENCE:
-<код из файла>
-
-SUMMARY: <описание>
-SCHEMA_FIELDS:
-field: type | description
+ШАГ 3 (если нашёл): Верни результат со status="FOUND", file,
+code_evidence (код из файла), summary и schema_fields ("field: type | description")
 
-ШАГ 3 (если НЕ нашёл): Ответь:
-STATUS: NOT_FOUND
-FILE: <путь к файлу>
-REASON: <причина>
+ШАГ 3 (если НЕ нашёл): Верни результат со status="NOT_FOUND", file и reason
 
 ВАЖНО:
 - ОБЯЗАТЕЛЬНО вызови read_file ПЕРЕД ответом
 - НЕ придумывай код - только из файла
-- Маршрут "{path}" должен быть в CODE_EVIDENCE
+- Маршрут "{path}" должен быть в code_evidence
    """
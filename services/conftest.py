@@ -9,7 +9,10 @@ import json
 from json import JSONDecodeError
 import functools
 import contextlib
-# Simplified: no custom HTTPAdapter or retry logic required
+import threading
+import sqlite3
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 
@@ -18,14 +21,22 @@ _SERVICES_DIR = os.path.dirname(__file__)
 if _SERVICES_DIR not in sys.path:
     sys.path.insert(0, _SERVICES_DIR)
 
-from services.qa_constants import SERVICES, TUNNEL_CONFIG
+from services.qa_constants import LATENCY_BUDGETS_MS, SERVICES, TUNNEL_CONFIG
 from services.auth_utils import login
 from services.tunnel_manager import SSHTunnelManager
+from services.schema_validator import StreamFormatError, compile_schema, validate_array_stream
+from services.latency import LatencyRecorder, TimedHTTPAdapter, last_connect_time, reset_connect_time
+from services.latency_baseline import DEFAULT_BASELINE_DB, check_and_store, report_lines as baseline_report_lines
+from services.load_runner import (
+    LoadTarget, module_cases, module_constant, module_variants, parse_load_spec,
+    report_lines as load_report_lines, run_load,
+)
 
 # Регистрируем pytest plugins
 pytest_plugins = [
     "services.test_failure_logger",  # Автоматическое логирование упавших тестов
     "services.test_pass_logger",     # Логирование прошедших тестов в JSONL
+    "services.run_history",          # История длительностей: порядок тестов и flaky score
 ]
 
 # --- Command-line options ---
@@ -55,64 +66,181 @@ def pytest_addoption(parser):
         help="IP адрес Mirada хоста для автоматического проброса портов через SSH туннели"
     )
     parser.addoption('--resume', action='store_true', help='Run tests with custom resume logic')
+    parser.addoption(
+        "--no-preflight",
+        action="store_true",
+        help="Disable session-start tunnel bring-up and service reachability probes."
+    )
+    parser.addoption(
+        "--preflight-timeout",
+        action="store",
+        type=float,
+        default=3.0,
+        help="Timeout in seconds for each service reachability probe during preflight."
+    )
+    parser.addoption(
+        "--ssh-multiplex",
+        action="store_true",
+        help="Use one SSH ControlMaster connection for all tunnels (forwards are added on demand)."
+    )
+    parser.addoption(
+        "--schema-fail-fast",
+        action="store_true",
+        help="Stop streaming response validation at the first invalid array element."
+    )
+    parser.addoption(
+        "--latency-json",
+        action="store",
+        default="logs/latency.json",
+        help="Where to write per-endpoint request latency percentiles and histograms (empty to disable)."
+    )
+    parser.addoption(
+        "--latency-budget",
+        action="store",
+        choices=("fail", "warn", "off"),
+        default="warn",
+        help="What to do when an API call exceeds LATENCY_BUDGET_MS of the test module "
+             "(or the service budget from LATENCY_BUDGETS_MS in qa_constants.py). "
+             "Modules and services without a budget are not checked."
+    )
+    parser.addoption(
+        "--latency-baseline",
+        action="store",
+        default=DEFAULT_BASELINE_DB,
+        help="SQLite store of per-run endpoint latencies used to detect regressions (empty to disable)."
+    )
+    parser.addoption(
+        "--latency-regressions-json",
+        action="store",
+        default="logs/latency_regressions.json",
+        help="Where to write the latency regression report against the baseline."
+    )
+    parser.addoption(
+        "--load",
+        action="store",
+        metavar="duration=60s,concurrency=32",
+        help="Run collected POSITIVE_CASES as a closed-loop load test instead of the tests "
+             "and report requests/s, error rate and latency percentiles per endpoint."
+    )
+    parser.addoption(
+        "--load-json",
+        action="store",
+        default="logs/load.json",
+        help="Where to write the --load report (empty to disable)."
+    )
+    parser.addoption(
+        "--http-pool-size",
+        action="store",
+        type=int,
+        default=10,
+        help="Max keep-alive connections per base URL in the shared HTTP pool."
+    )
+
+
+# --- Keep-alive connection pools ---
+
+class HTTPConnectionPools:
+    """
+    Один requests.Session с keep-alive пулом на каждый base URL на всю сессию pytest.
+    Соединения через SSH туннель переиспользуются между тестами и модулями.
+    """
+
+    def __init__(self, pool_size=10):
+        self.pool_size = pool_size
+        self._sessions = {}
+        self._lock = threading.Lock()
+        # Счетчики пулов, которые уже закрыты (сброс после ошибок соединения)
+        self._closed_stats = {"requests": 0, "connections": 0}
+
+    def session(self, base_url):
+        """Session для base_url (создается при первом обращении)."""
+        with self._lock:
+            session = self._sessions.get(base_url)
+            if session is None:
+                session = requests.Session()
+                adapter = TimedHTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[base_url] = session
+            return session
 
+    @staticmethod
+    def _session_stats(session):
+        requests_count = connections = 0
+        for adapter in session.adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    requests_count += pool.num_requests
+                    connections += pool.num_connections
+        return requests_count, connections
 
-# --- Custom HTTP Adapter for Maximum Stability ---
+    def _close_locked(self, base_url):
+        session = self._sessions.pop(base_url, None)
+        if session is None:
+            return
+        requests_count, connections = self._session_stats(session)
+        self._closed_stats["requests"] += requests_count
+        self._closed_stats["connections"] += connections
+        session.close()
 
-# removed custom HTTPAdapter classes - using plain requests.Session
+    def reset(self, base_url):
+        """Закрывает все соединения base_url; следующий запрос откроет новые."""
+        with self._lock:
+            self._close_locked(base_url)
+
+    def close_all(self):
+        with self._lock:
+            for base_url in list(self._sessions):
+                self._close_locked(base_url)
+
+    def stats(self):
+        """Запросы, открытые соединения и переиспользования по всем пулам."""
+        with self._lock:
+            requests_count = self._closed_stats["requests"]
+            connections = self._closed_stats["connections"]
+            for session in self._sessions.values():
+                r, c = self._session_stats(session)
+                requests_count += r
+                connections += c
+        return {
+            "requests": requests_count,
+            "connections": connections,
+            "reused": max(requests_count - connections, 0),
+        }
+
+
+@pytest.fixture(scope="session")
+def http_pools(request):
+    """Общие keep-alive пулы соединений; статистика выводится в итоговом отчете."""
+    pools = HTTPConnectionPools(pool_size=request.config.getoption("--http-pool-size"))
+    try:
+        yield pools
+    finally:
+        pools.close_all()
+        request.config._http_pool_stats = pools.stats()
 
 # --- Core Fixtures ---
 
-@pytest.fixture(scope="module")
-def api_base_url(request, tunnel_manager):
+def resolve_service(test_path):
     """
-    Provides the correct base URL for the API being tested.
-    
-    ВАЖНО: Параметр --mirada-host является ОБЯЗАТЕЛЬНЫМ для работы тестов.
-    Это гарантирует, что все тесты выполняются через SSH туннели с использованием ключей.
-    
-    - Если --host и --port указаны, они переопределяют конфигурацию сервиса.
-    - --mirada-host обязателен - автоматически создает SSH туннели и использует localhost.
-    - Определяет сервис из пути к тесту (например, 'services/frrouting'),
-      ищет конфигурацию в qa_constants.py и строит URL.
+    Определяет сервис по пути к тесту (services/<service_name>/...).
+    Возвращает (service_name, tunnel_key, service_config); ValueError, если сервис не определен.
     """
-    # Проверяем обязательный параметр --mirada-host
-    mirada_host = request.config.getoption("--mirada-host")
-    if not mirada_host:
-        pytest.fail(
-            "REQUIRED: --mirada-host parameter is mandatory for test execution.\n"
-            "\n"
-            "Usage:\n"
-            "  pytest services/service-name/ --mirada-host=<IP_ADDRESS>\n"
-            "\n"
-            "SSH key setup required before running tests:\n"
-            "  1. Generate SSH key: ssh-keygen -t rsa\n"
-            "  2. Copy to server: ssh-copy-id codemaster@<IP_ADDRESS>\n"
-            "  3. Verify access: ssh codemaster@<IP_ADDRESS>\n"
-            "\n"
-            "This ensures secure passwordless authentication."
-        )
-    
-    # Priority 1: Use command-line arguments if provided
-    host_override = request.config.getoption("--host")
-    port_override = request.config.getoption("--port")
-    
-    # Priority 2: Determine from test path
-    test_path = str(request.node.fspath)
-    
     path_parts = test_path.split(os.sep)
     try:
         services_index = path_parts.index("services")
         service_name = path_parts[services_index + 1]
     except (ValueError, IndexError):
-        pytest.fail(
+        raise ValueError(
             "Could not determine service from test path. "
             "Ensure tests are in a 'services/<service_name>/' directory "
             "or provide --host and --port."
         )
 
     if service_name not in SERVICES:
-        pytest.fail(
+        raise ValueError(
             f"Service '{service_name}' found in path but not defined in qa_constants.py."
         )
     
@@ -137,6 +265,65 @@ def api_base_url(request, tunnel_manager):
     else:
         tunnel_key = service_name
 
+    return service_name, tunnel_key, service_config
+
+
+def ensure_tunnel(tunnel_manager, tunnel_key):
+    """Создает туннель из TUNNEL_CONFIG, если он еще не поднят этим менеджером."""
+    local_port, remote_port, remote_host = TUNNEL_CONFIG[tunnel_key]
+    if f"{tunnel_key}_{local_port}" in tunnel_manager.tunnels:
+        return True
+    print(f"Creating SSH tunnel for {tunnel_key}: {local_port} -> {remote_host}:{remote_port}")
+    return tunnel_manager.create_tunnel(tunnel_key, local_port, remote_port, remote_host)
+
+
+def service_base_url(tunnel_key, service_config):
+    """Base URL сервиса через локальный конец SSH туннеля."""
+    local_port = TUNNEL_CONFIG[tunnel_key][0]
+    base_path = service_config.get("base_path", "").rstrip('/')
+    return f"http://127.0.0.1:{local_port}{base_path}"
+
+
+@pytest.fixture(scope="module")
+def api_base_url(request, tunnel_manager):
+    """
+    Provides the correct base URL for the API being tested.
+    
+    ВАЖНО: Параметр --mirada-host является ОБЯЗАТЕЛЬНЫМ для работы тестов.
+    Это гарантирует, что все тесты выполняются через SSH туннели с использованием ключей.
+    
+    - Если --host и --port указаны, они переопределяют конфигурацию сервиса.
+    - --mirada-host обязателен - автоматически создает SSH туннели и использует localhost.
+    - Определяет сервис из пути к тесту (например, 'services/frrouting'),
+      ищет конфигурацию в qa_constants.py и строит URL.
+    """
+    # Проверяем обязательный параметр --mirada-host
+    mirada_host = request.config.getoption("--mirada-host")
+    if not mirada_host:
+        pytest.fail(
+            "REQUIRED: --mirada-host parameter is mandatory for test execution.\n"
+            "\n"
+            "Usage:\n"
+            "  pytest services/service-name/ --mirada-host=<IP_ADDRESS>\n"
+            "\n"
+            "SSH key setup required before running tests:\n"
+            "  1. Generate SSH key: ssh-keygen -t rsa\n"
+            "  2. Copy to server: ssh-copy-id codemaster@<IP_ADDRESS>\n"
+            "  3. Verify access: ssh codemaster@<IP_ADDRESS>\n"
+            "\n"
+            "This ensures secure passwordless authentication."
+        )
+    
+    # Priority 1: Use command-line arguments if provided
+    host_override = request.config.getoption("--host")
+    port_override = request.config.getoption("--port")
+    
+    # Priority 2: Determine from test path
+    try:
+        service_name, tunnel_key, service_config = resolve_service(str(request.node.fspath))
+    except ValueError as e:
+        pytest.fail(str(e))
+
     # Determine host and port - ТОЛЬКО через SSH туннели
     if host_override and port_override:
         # Command line overrides (для отладки)
@@ -158,28 +345,19 @@ def api_base_url(request, tunnel_manager):
         
         # Create agent tunnel first if not already established
         if "mirada-agent" in TUNNEL_CONFIG:
-            agent_local_port, agent_remote_port, agent_remote_host = TUNNEL_CONFIG["mirada-agent"]
-            agent_tunnel_key = f"mirada-agent_{agent_local_port}"
-            if agent_tunnel_key not in tunnel_manager.tunnels:
-                print(f"Creating persistent SSH tunnel for mirada-agent: {agent_local_port} -> {agent_remote_host}:{agent_remote_port}")
-                success = tunnel_manager.create_tunnel("mirada-agent", agent_local_port, agent_remote_port, agent_remote_host)
-                if not success:
-                    pytest.fail("ERROR: Failed to create tunnel for mirada-agent. Check SSH keys.")
+            if not ensure_tunnel(tunnel_manager, "mirada-agent"):
+                pytest.fail("ERROR: Failed to create tunnel for mirada-agent. Check SSH keys.")
         
         # Create tunnel for current service if not already established
         local_port, remote_port, remote_host = TUNNEL_CONFIG[tunnel_key]
-        service_tunnel_key = f"{tunnel_key}_{local_port}"
-        if service_tunnel_key not in tunnel_manager.tunnels:
-            print(f"Creating SSH tunnel for {tunnel_key}: {local_port} -> {remote_host}:{remote_port}")
-            success = tunnel_manager.create_tunnel(tunnel_key, local_port, remote_port, remote_host)
-            if not success:
-                pytest.fail(
-                    f"ERROR: Failed to create tunnel for {tunnel_key}.\n"
-                    f"Check:\n"
-                    f"  1. SSH keys: ssh codemaster@{mirada_host}\n"
-                    f"  2. Service availability on {remote_host}:{remote_port}\n"
-                    f"  3. Network connectivity to {mirada_host}"
-                )
+        if not ensure_tunnel(tunnel_manager, tunnel_key):
+            pytest.fail(
+                f"ERROR: Failed to create tunnel for {tunnel_key}.\n"
+                f"Check:\n"
+                f"  1. SSH keys: ssh codemaster@{mirada_host}\n"
+                f"  2. Service availability on {remote_host}:{remote_port}\n"
+                f"  3. Network connectivity to {mirada_host}"
+            )
         
         host = "127.0.0.1"
         port = local_port
@@ -193,13 +371,28 @@ def request_timeout(request):
     """Returns the request timeout in seconds from the command line."""
     return int(request.config.getoption("--request-timeout"))
 
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
 class SimpleAPIClient:
-    """Wrapper that uses plain requests (no Session)."""
+    """Wrapper over a pooled keep-alive requests.Session shared per base URL."""
     
-    def __init__(self, base_url, timeout, headers=None):
+    def __init__(self, base_url, timeout, headers=None, pools=None, fail_fast=False,
+                 service=None, recorder=None):
         self.base_url = base_url
         self.timeout = timeout
         self.headers = headers or {}
+        # Замеры задержек: тег сервиса и LatencyRecorder сессии (None — не замерять)
+        self.service = service
+        self.recorder = recorder
+        # stream_validate: останавливаться на первом невалидном элементе
+        self.fail_fast = fail_fast
+        # Без общих пулов (клиент создан вручную) — собственный пул клиента
+        self.pools = pools or HTTPConnectionPools()
+
+    @property
+    def session(self):
+        return self.pools.session(self.base_url)
     
     def _make_url(self, endpoint):
         """Build full URL from base and endpoint."""
@@ -210,7 +403,29 @@ class SimpleAPIClient:
         full_url = self._make_url(url)
         kwargs.setdefault('timeout', self.timeout)
         kwargs.setdefault('headers', self.headers)
-        return requests.request(method, full_url, *args, **kwargs)
+        case_headers = _active_case_headers.get()
+        if case_headers:
+            kwargs['headers'] = {**kwargs['headers'], **case_headers}
+        case_params = _active_case_params.get()
+        if case_params:
+            kwargs['params'] = {**case_params, **(kwargs.get('params') or {})}
+        reset_connect_time()
+        started = time.perf_counter()
+        response = self.session.request(method, full_url, *args, **kwargs)
+        if kwargs.get('stream'):
+            # Тело еще не прочитано: замер завершит тот, кто его дочитает
+            response.latency_start = (started, last_connect_time())
+        else:
+            self._observe(method, url, response, time.perf_counter() - started, last_connect_time())
+        return response
+
+    def _observe(self, method, url, response, elapsed, connect):
+        """Замер задержки: гистограммы сессии и бюджет времени ответа текущего теста."""
+        if self.recorder is not None:
+            self.recorder.record_response(self.service, method, url, response, elapsed, connect)
+        budget = _active_latency_budget.get()
+        if budget is not None:
+            budget.observe(method, url, elapsed)
     
     def get(self, url, **kwargs):
         return self.request('GET', url, **kwargs)
@@ -227,29 +442,188 @@ class SimpleAPIClient:
     def patch(self, url, **kwargs):
         return self.request('PATCH', url, **kwargs)
     
-    def send(self, prepared_request, **kwargs):
-        """Send PreparedRequest as-is."""
-        kwargs.setdefault('timeout', self.timeout)
-        adapter = requests.adapters.HTTPAdapter()
+    def stream_validate(self, method, url, schema, fail_fast=None, chunk_size=STREAM_CHUNK_SIZE, **kwargs):
+        """
+        Request whose JSON-array response is validated while it is read from the socket.
+
+        Elements are parsed and checked against schema['items'] one by one, so memory
+        does not grow with the response size; the body is not kept (no response.json()).
+        Responses with status >= 400 are read as usual. The number of elements is set
+        as response.items_count. Schema violations raise AssertionError with all errors,
+        or only the first one with fail_fast (defaults to --schema-fail-fast).
+        """
+        kwargs['stream'] = True
+        response = self.request(method, url, **kwargs)
+        if response.status_code >= 400:
+            _ = response.content
+            return response
+
+        if fail_fast is None:
+            fail_fast = self.fail_fast
         try:
-            return adapter.send(prepared_request, **kwargs)
+            count, errors = validate_array_stream(response.iter_content(chunk_size), schema, fail_fast=fail_fast)
+        except StreamFormatError as e:
+            raise AssertionError(f"Response is not a valid JSON array: {e}")
         finally:
-            adapter.close()
+            response.close()
+
+        response.items_count = count
+        started, connect = response.latency_start
+        self._observe(method, url, response, time.perf_counter() - started, connect)
+        if errors:
+            raise AssertionError(format_schema_errors(errors))
+        return response
+
+    def send(self, prepared_request, **kwargs):
+        """Send PreparedRequest as-is (без редиректов и cookies Session) через общий пул."""
+        kwargs.setdefault('timeout', self.timeout)
+        adapter = self.session.get_adapter(prepared_request.url)
+        return adapter.send(prepared_request, **kwargs)
+
+    def close(self):
+        """Сбрасывает пул соединений base_url (после обрыва соединения сервером)."""
+        self.pools.reset(self.base_url)
 
 
 @pytest.fixture(scope="module")
-def api_client(api_base_url, request_timeout):
-    """Returns a client that uses plain requests (no Session)."""
+def api_client(request, api_base_url, request_timeout, http_pools):
+    """Returns a client backed by the shared keep-alive pool for api_base_url."""
     return SimpleAPIClient(
         base_url=api_base_url,
         timeout=request_timeout,
         headers={
             "Content-Type": "application/json",
             "Accept": "application/json"
-        }
+        },
+        pools=http_pools,
+        fail_fast=request.config.getoption("--schema-fail-fast"),
+        service=_service_tag(str(request.node.fspath)),
+        recorder=getattr(request.config, "_latency_recorder", None),
     )
 
 
+# --- Response-time budgets ---
+
+class LatencyBudget:
+    """Бюджет времени ответа теста и вызовы, которые его превысили."""
+
+    def __init__(self, budget_ms, mode):
+        self.ms = budget_ms
+        self.mode = mode
+        self.violations = []
+
+    def observe(self, method, url, elapsed):
+        if self.ms and elapsed * 1000 > self.ms:
+            self.violations.append((method.upper(), url, elapsed * 1000))
+
+    def describe(self):
+        calls = "; ".join(f"{method} {url}: {ms:.0f} ms" for method, url, ms in self.violations[:5])
+        more = f" (+{len(self.violations) - 5} more)" if len(self.violations) > 5 else ""
+        return f"Latency budget {self.ms} ms exceeded by {len(self.violations)} call(s): {calls}{more}"
+
+
+# Бюджет теста, выполняемого в текущем контексте (его видит SimpleAPIClient)
+_active_latency_budget = contextvars.ContextVar("active_latency_budget", default=None)
+
+
+def resolve_latency_budget(module, test_path, test_name=""):
+    """
+    LATENCY_BUDGET_MS модуля (x-latency-budget-ms из swagger) или бюджет сервиса из
+    LATENCY_BUDGETS_MS. None — бюджет нигде не объявлен, время ответа не проверяется.
+    В файле с несколькими методами тест test_positive_post берёт LATENCY_BUDGET_MS_POST.
+    """
+    suffix = next((s for _, s in module_variants(module) if s and test_name.endswith(s.lower())), "")
+    budget = module_constant(module, "LATENCY_BUDGET_MS", suffix)
+    if budget:
+        return budget
+    tunnel_key = _service_tag(test_path)
+    return LATENCY_BUDGETS_MS.get(tunnel_key) if tunnel_key else None
+
+
+@pytest.fixture(autouse=True)
+def latency_budget(request):
+    """
+    Время каждого вызова api_client сравнивается с бюджетом модуля/сервиса.
+    Превышения проверяются после теста (см. pytest_runtest_call): --latency-budget=fail
+    делает из них обычное падение теста, warn — предупреждение.
+    """
+    mode = request.config.getoption("--latency-budget")
+    budget_ms = None
+    if mode != "off" and request.node.get_closest_marker("no_latency_budget") is None:
+        budget_ms = resolve_latency_budget(
+            request.module, str(request.node.fspath), getattr(request.node, "originalname", request.node.name)
+        )
+    budget = LatencyBudget(budget_ms, mode)
+    _active_latency_budget.set(budget if budget_ms else None)
+    try:
+        yield budget
+    finally:
+        _active_latency_budget.set(None)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    """Превышение бюджета времени ответа в прошедшем тесте — падение или предупреждение."""
+    outcome = yield
+    budget = getattr(item, "funcargs", {}).get("latency_budget")
+    if budget is None or not budget.violations or outcome.excinfo is not None:
+        return
+    if budget.mode == "fail":
+        outcome.force_exception(AssertionError(budget.describe()))
+    elif budget.mode == "warn":
+        item.warn(pytest.PytestWarning(budget.describe()))
+
+
+# --- Per-case request headers ---
+
+# Заголовки из маркера request_headers текущего теста (их добавляет SimpleAPIClient)
+_active_case_headers = contextvars.ContextVar("active_case_headers", default=None)
+# Query-параметры из маркера request_params (кейсы POST/PUT/PATCH с телом и query)
+_active_case_params = contextvars.ContextVar("active_case_params", default=None)
+
+
+@pytest.fixture(autouse=True)
+def case_request_headers(request):
+    """
+    Заголовки кейса: pytest.param(..., marks=pytest.mark.request_headers({...}))
+    добавляются ко всем запросам api_client в этом тесте.
+    """
+    marker = request.node.get_closest_marker("request_headers")
+    headers = dict(marker.args[0]) if marker and marker.args else {}
+    if marker:
+        headers.update(marker.kwargs)
+    _active_case_headers.set(headers or None)
+    try:
+        yield headers
+    finally:
+        _active_case_headers.set(None)
+
+
+@pytest.fixture(autouse=True)
+def case_request_params(request):
+    """
+    Query-параметры кейса: pytest.param(..., marks=pytest.mark.request_params({...}))
+    добавляются ко всем запросам api_client в этом тесте (явные params= важнее).
+    """
+    marker = request.node.get_closest_marker("request_params")
+    params = dict(marker.args[0]) if marker and marker.args else {}
+    if marker:
+        params.update(marker.kwargs)
+    _active_case_params.set(params or None)
+    try:
+        yield params
+    finally:
+        _active_case_params.set(None)
+
+
+def _service_tag(test_path):
+    """Метка сервиса для замеров задержек (ключ туннеля: различает сервисы vswitch)."""
+    try:
+        return resolve_service(test_path)[1]
+    except ValueError:
+        return None
+
+
 @pytest.fixture(scope="module")
 def agent_base_url(request, tunnel_manager):
     """
@@ -377,7 +751,7 @@ def capture_last_request(request):
     api_client_instance.send = original_send
 
 @pytest.fixture
-def agent_verification(agent_base_url):
+def agent_verification(request, agent_base_url, http_pools):
     """
     Фикстура для проверки через агента.
     
@@ -418,7 +792,13 @@ def agent_verification(agent_base_url):
             agent_url = f"{agent_base_url.rstrip('/')}{endpoint}"
             
             print(f"Agent request to {endpoint}: {json.dumps(payload, indent=2)}")
-            response = requests.post(agent_url, json=payload, timeout=timeout)
+            reset_connect_time()
+            started = time.perf_counter()
+            response = http_pools.session(agent_base_url).post(agent_url, json=payload, timeout=timeout)
+            recorder = getattr(request.config, "_latency_recorder", None)
+            if recorder is not None:
+                recorder.record_response("mirada-agent", "POST", endpoint, response,
+                                         time.perf_counter() - started, last_connect_time())
             
             # Обрабатываем ответ агента
             if response.status_code == 200:
@@ -468,14 +848,54 @@ def agent_verification(agent_base_url):
 
 # --- Validation Helpers ---
 
+MAX_SCHEMA_ERRORS_SHOWN = 50
+
+
 def validate_schema(data, schema):
+    """
+    Validates data against a schema and fails with all collected errors at once.
+
+    - JSON-Schema (type/items/properties/required/enum/format), as emitted by the
+      test generator: compiled once per schema, see services/schema_validator.py.
+    - Legacy format {'required': {key: type}, 'optional': {key: type}}: checked as before.
+    A list of objects may be validated against an object schema (each element is checked).
+    """
+    if _is_legacy_schema(schema):
+        _validate_legacy_schema(data, schema)
+        return
+
+    validator = compile_schema(schema)
+    if isinstance(data, list) and schema.get("type") == "object":
+        errors = []
+        for index, item in enumerate(data):
+            errors.extend(f"$[{index}]{error[1:]}" for error in validator(item))
+    else:
+        errors = validator(data)
+
+    if errors:
+        raise AssertionError(format_schema_errors(errors))
+
+
+def format_schema_errors(errors):
+    shown = "\n".join(f"  {error}" for error in errors[:MAX_SCHEMA_ERRORS_SHOWN])
+    more = len(errors) - MAX_SCHEMA_ERRORS_SHOWN
+    if more > 0:
+        shown += f"\n  ... and {more} more"
+    return f"Response does not match schema ({len(errors)} errors):\n{shown}"
+
+
+def _is_legacy_schema(schema):
+    return isinstance(schema.get("required"), dict) or "optional" in schema
+
+
+def _validate_legacy_schema(data, schema):
     """
     Recursively validates a dictionary or a list of dictionaries against a schema.
     The schema defines 'required' and 'optional' fields with their expected types.
     """
     if isinstance(data, list):
         for item in data:
-            validate_schema(item, schema)
+            _validate_legacy_schema(item, schema)
         return
 
     for key, expected_type in schema.get("required", {}).items():
@@ -582,17 +1002,318 @@ def tunnel_manager(request):
         yield None
         return
     
-    # Создаем менеджер туннелей
-    manager = SSHTunnelManager(mirada_host)
+    # Менеджер туннелей: создан на preflight (туннели уже подняты) или создаем новый
+    manager = getattr(request.config, "_preflight_tunnel_manager", None)
+    if manager is None:
+        manager = SSHTunnelManager(mirada_host, multiplex=request.config.getoption("--ssh-multiplex"))
     try:
         yield manager
     finally:
+        request.config._tunnel_stats = dict(manager.stats, multiplex=manager.multiplex)
         # Очищаем все туннели при завершении
         for key in list(manager.tunnels.keys()):
             service, port = key.rsplit('_', 1)
             manager.close_tunnel(service, int(port))
 
 
+# --- Session Preflight ---
+
+def _probe_service(base_url, timeout):
+    """None, если сервис ответил (любой HTTP статус), иначе текст ошибки."""
+    try:
+        requests.get(base_url, timeout=timeout, headers={"Accept": "application/json"}).close()
+        return None
+    except requests.exceptions.RequestException as e:
+        return type(e).__name__
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_collection_modifyitems(session, config, items):
+    """
+    Preflight перед запуском: параллельно поднимает туннели всех сервисов из
+    собранных тестов, проверяет доступность каждого сервиса коротким запросом
+    и снимает (deselect) все тесты недоступных сервисов сразу.
+
+    Под xdist preflight выполняет каждый воркер, и результаты проб могут
+    разойтись; списки тестов воркеров обязаны совпадать, поэтому там тесты
+    недоступных сервисов не снимаются, а помечаются skip.
+    """
+    mirada_host = config.getoption("--mirada-host")
+    if (not mirada_host or config.getoption("--no-preflight")
+            or (config.getoption("--host") and config.getoption("--port"))):
+        return
+
+    # tunnel_key -> (base_url, [items])
+    services = {}
+    for item in items:
+        if "api_base_url" not in getattr(item, "fixturenames", ()):
+            continue
+        try:
+            _, tunnel_key, service_config = resolve_service(str(item.fspath))
+        except ValueError:
+            continue
+        if tunnel_key not in TUNNEL_CONFIG:
+            continue
+        entry = services.setdefault(tunnel_key, (service_base_url(tunnel_key, service_config), []))
+        entry[1].append(item)
+    if not services:
+        return
+
+    started = time.monotonic()
+    manager = SSHTunnelManager(mirada_host, multiplex=config.getoption("--ssh-multiplex"))
+    config._preflight_tunnel_manager = manager
+    timeout = config.getoption("--preflight-timeout")
+
+    tunnel_keys = list(services)
+    if "mirada-agent" in TUNNEL_CONFIG:
+        tunnel_keys.append("mirada-agent")
+    with ThreadPoolExecutor(max_workers=len(tunnel_keys)) as pool:
+        tunnels_up = dict(zip(tunnel_keys, pool.map(lambda key: ensure_tunnel(manager, key), tunnel_keys)))
+
+        probes = {
+            key: pool.submit(_probe_service, base_url, timeout)
+            for key, (base_url, _) in services.items()
+            if tunnels_up[key]
+        }
+        unreachable = {key: "tunnel failed" for key in services if not tunnels_up[key]}
+        for key, future in probes.items():
+            error = future.result()
+            if error:
+                unreachable[key] = error
+
+    is_worker = hasattr(config, "workerinput")
+    deselected = [item for key in unreachable for item in services[key][1]]
+    if is_worker:
+        for key, reason in unreachable.items():
+            for item in services[key][1]:
+                item.add_marker(pytest.mark.skip(reason=f"preflight: {key} unreachable ({reason})"))
+    elif deselected:
+        deselected_ids = {id(item) for item in deselected}
+        config.hook.pytest_deselected(items=deselected)
+        items[:] = [item for item in items if id(item) not in deselected_ids]
+
+    config._preflight_summary = {
+        "action": "skipped" if is_worker else "deselected",
+        "seconds": time.monotonic() - started,
+        "reachable": sorted(set(services) - set(unreachable)),
+        "unreachable": {key: (reason, len(services[key][1])) for key, reason in sorted(unreachable.items())},
+    }
+    reporter = config.pluginmanager.get_plugin("terminalreporter")
+    if reporter is not None:
+        reporter.write_line(_format_preflight(config._preflight_summary))
+
+
+def pytest_sessionfinish(session, exitstatus):
+    """
+    Закрывает туннели preflight, если ни один тест не запросил tunnel_manager.
+    Передает замеры задержек, preflight и статистику туннелей/пулов главному
+    процессу xdist или пишет JSON-экспорт.
+    """
+    config = session.config
+    manager = getattr(config, "_preflight_tunnel_manager", None)
+    if manager is not None:
+        for key in list(manager.tunnels.keys()):
+            service, port = key.rsplit('_', 1)
+            manager.close_tunnel(service, int(port))
+
+    recorder = getattr(config, "_latency_recorder", None)
+    if hasattr(config, "workeroutput"):
+        for key, attr in _WORKER_OUTPUTS.items():
+            value = getattr(config, attr, None)
+            if value:
+                config.workeroutput[key] = value
+        if recorder is not None:
+            config.workeroutput["latency"] = recorder.to_dict()
+        return
+    if recorder is None:
+        return
+    export_path = config.getoption("--latency-json")
+    if recorder and export_path:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(export_path)), exist_ok=True)
+            with open(export_path, "w", encoding="utf-8") as f:
+                json.dump(recorder.to_dict(), f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            logger.warning(f"Failed to write latency report {export_path}: {e}")
+
+    baseline_path = config.getoption("--latency-baseline")
+    if recorder and baseline_path:
+        try:
+            config._baseline_report = check_and_store(
+                baseline_path, _baseline_host(config), recorder.to_dict(), recorder.versions,
+                report_path=config.getoption("--latency-regressions-json"),
+            )
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Failed to update latency baseline {baseline_path}: {e}")
+
+
+def _baseline_host(config):
+    """Ключ хоста базовой линии: mirada host или --host:--port (локальная заглушка)."""
+    host_override = config.getoption("--host")
+    port_override = config.getoption("--port")
+    if host_override and port_override:
+        return f"{host_override}:{port_override}"
+    return config.getoption("--mirada-host") or "local"
+
+
+# Ключ workeroutput -> атрибут config, который воркер передает главному процессу xdist
+_WORKER_OUTPUTS = {
+    "preflight": "_preflight_summary",
+    "tunnel_stats": "_tunnel_stats",
+    "http_pool_stats": "_http_pool_stats",
+}
+
+
+def _merge_preflight(total, summary):
+    """Сводка preflight по воркерам: сервис недоступен, если проба не прошла хотя бы у одного."""
+    if total is None:
+        return dict(summary, reachable=list(summary["reachable"]), unreachable=dict(summary["unreachable"]))
+    total["seconds"] = max(total["seconds"], summary["seconds"])
+    for key, value in summary["unreachable"].items():
+        total["unreachable"].setdefault(key, value)
+    total["reachable"] = sorted((set(total["reachable"]) | set(summary["reachable"])) - set(total["unreachable"]))
+    return total
+
+
+def _sum_stats(total, stats):
+    """Сумма числовых счетчиков воркеров (туннели, пулы соединений)."""
+    if total is None:
+        return dict(stats)
+    for key, value in stats.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    """xdist: складываем гистограммы задержек, preflight и статистику туннелей/пулов воркера в общие."""
+    config = node.config
+    output = getattr(node, "workeroutput", {})
+    recorder = getattr(config, "_latency_recorder", None)
+    data = output.get("latency")
+    if recorder is not None and data:
+        recorder.merge_dict(data)
+    if output.get("preflight"):
+        config._preflight_summary = _merge_preflight(getattr(config, "_preflight_summary", None), output["preflight"])
+    for key in ("tunnel_stats", "http_pool_stats"):
+        if output.get(key):
+            attr = _WORKER_OUTPUTS[key]
+            setattr(config, attr, _sum_stats(getattr(config, attr, None), output[key]))
+
+
+def _format_preflight(summary):
+    lines = [
+        f"[preflight] {len(summary['reachable'])} services reachable, "
+        f"{len(summary['unreachable'])} unreachable ({summary['seconds']:.2f}s)"
+    ]
+    for key, (reason, count) in summary["unreachable"].items():
+        lines.append(f"[preflight]   {key}: {reason} -> {count} tests {summary['action']}")
+    return "\n".join(lines)
+
+
+# --- Load Mode (--load) ---
+
+def _load_base_url(config, test_path, manager):
+    """
+    Base URL сервиса модуля для нагрузки: --host/--port (локальная заглушка)
+    или SSH туннель, как в api_base_url. None, если сервис недоступен.
+    """
+    _, tunnel_key, service_config = resolve_service(test_path)
+    base_path = service_config.get("base_path", "").rstrip('/')
+    host_override = config.getoption("--host")
+    port_override = config.getoption("--port")
+    if host_override and port_override:
+        return f"http://{host_override}:{port_override}{base_path}"
+    if manager is None or tunnel_key not in TUNNEL_CONFIG or not ensure_tunnel(manager, tunnel_key):
+        return None
+    return service_base_url(tunnel_key, service_config)
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_runtestloop(session):
+    """
+    --load: вместо выполнения тестов гоняет POSITIVE_CASES собранных модулей
+    как замкнутую нагрузку (см. services/load_runner.py).
+    """
+    config = session.config
+    spec = getattr(config, "_load_spec", None)
+    if spec is None or hasattr(config, "workerinput"):
+        return None
+    duration, concurrency = spec
+    reporter = config.pluginmanager.get_plugin("terminalreporter")
+
+    def write(line):
+        if reporter is not None:
+            reporter.write_line(line)
+
+    manager = None
+    mirada_host = config.getoption("--mirada-host")
+    if mirada_host and not (config.getoption("--host") and config.getoption("--port")):
+        # Туннели preflight или новый менеджер (закрывается в pytest_sessionfinish)
+        manager = getattr(config, "_preflight_tunnel_manager", None)
+        if manager is None:
+            manager = SSHTunnelManager(mirada_host, multiplex=config.getoption("--ssh-multiplex"))
+            config._preflight_tunnel_manager = manager
+
+    pools = HTTPConnectionPools(pool_size=max(concurrency, config.getoption("--http-pool-size")))
+    timeout = int(config.getoption("--request-timeout"))
+    targets = []
+    seen_modules = set()
+    for item in session.items:
+        module = getattr(item, "module", None)
+        if module is None or id(module) in seen_modules:
+            continue
+        seen_modules.add(id(module))
+        # (METHOD, ENDPOINT, кейсы) каждого метода модуля: METHOD, METHOD_POST, ...
+        variants = [
+            (method, module_constant(module, "ENDPOINT", suffix), module_cases(module, suffix))
+            for method, suffix in module_variants(module)
+        ]
+        variants = [(method, endpoint, cases) for method, endpoint, cases in variants if cases and endpoint]
+        if not variants:
+            continue
+        test_path = str(item.fspath)
+        try:
+            base_url = _load_base_url(config, test_path, manager)
+        except ValueError as e:
+            write(f"[load] skip {item.nodeid.split('::', 1)[0]}: {e}")
+            continue
+        if base_url is None:
+            write(f"[load] skip {item.nodeid.split('::', 1)[0]}: service unreachable (use --mirada-host or --host/--port)")
+            continue
+        client = SimpleAPIClient(
+            base_url=base_url,
+            timeout=timeout,
+            headers={"Content-Type": "application/json", "Accept": "application/json"},
+            pools=pools,
+            service=_service_tag(test_path),
+        )
+        for method, endpoint, cases in variants:
+            targets.append(LoadTarget(client=client, method=method, endpoint=endpoint, cases=cases))
+
+    if not targets:
+        write("[load] no modules with ENDPOINT and POSITIVE_CASES collected")
+        return True
+
+    write(f"[load] {sum(len(t.cases) for t in targets)} cases from {len(targets)} modules, "
+          f"duration {duration:g}s, concurrency {concurrency}")
+    try:
+        config._load_result = run_load(targets, duration, concurrency, progress=write)
+    finally:
+        pools.close_all()
+
+    export_path = config.getoption("--load-json")
+    if export_path:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(export_path)), exist_ok=True)
+            with open(export_path, "w", encoding="utf-8") as f:
+                json.dump(config._load_result, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            logger.warning(f"Failed to write load report {export_path}: {e}")
+    return True
+
+
 # --- Ultra-Stable Connection Handling Functions ---
 
 def handle_negative_response_safely(api_client, method, url, expected_status, **kwargs):
@@ -616,11 +1337,13 @@ def handle_negative_response_safely(api_client, method, url, expected_status, **
     
     for attempt in range(max_attempts):
         try:
-            # Выполняем запрос с дополнительными заголовками для стабильности
+            # Выполняем запрос с дополнительными заголовками для стабильности.
+            # Соединение остается в keep-alive пуле; 'Connection: close' передается,
+            # только если его явно указал вызывающий (например, multipart) — такое
+            # соединение http.client закрывает после ответа, и пул открывает новое.
             headers = kwargs.get('headers') or {}
             stable_headers = headers.copy() if headers else {}
             stable_headers.update({
-                'Connection': 'close',  # Принудительно закрываем соединение после ответа
                 'Cache-Control': 'no-cache',
                 'Accept': '*/*'
             })
@@ -655,7 +1378,7 @@ def handle_negative_response_safely(api_client, method, url, expected_status, **
                 print(f"Connection error in negative test, attempt {attempt + 1}: {type(e).__name__}")
                 time.sleep(0.5 * (attempt + 1))
                 
-                # Принудительно закрываем и пересоздаем соединения
+                # Сбрасываем пул: соединения, оборванные сервером, не переиспользуем
                 try:
                     api_client.close()
                 except Exception:
@@ -751,6 +1474,60 @@ def stable_multipart_post():
     return robust_multipart_post
 
 
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    """Preflight, время подъема SSH туннелей, задержки запросов и переиспользование HTTP соединений."""
+    preflight = getattr(config, "_preflight_summary", None)
+    if preflight and preflight["unreachable"]:
+        terminalreporter.write_sep("-", "Service preflight")
+        terminalreporter.write_line(_format_preflight(preflight))
+
+    tunnel_stats = getattr(config, "_tunnel_stats", None)
+    if tunnel_stats and (tunnel_stats["created"] or tunnel_stats["attached"] or tunnel_stats["failed"]):
+        terminalreporter.write_sep("-", "SSH tunnels")
+        terminalreporter.write_line(
+            f"mode: {'multiplex (ControlMaster)' if tunnel_stats['multiplex'] else 'ssh per tunnel'}, "
+            f"created: {tunnel_stats['created']}, attached: {tunnel_stats['attached']}, "
+            f"failed: {tunnel_stats['failed']}, start-up time: {tunnel_stats['setup_seconds']:.2f}s"
+        )
+
+    load_result = getattr(config, "_load_result", None)
+    if load_result:
+        terminalreporter.write_sep("-", "Load test (closed loop, by endpoint)")
+        for line in load_report_lines(load_result):
+            terminalreporter.write_line(line)
+        export_path = config.getoption("--load-json")
+        if export_path:
+            terminalreporter.write_line(f"JSON export: {export_path}")
+
+    recorder = getattr(config, "_latency_recorder", None)
+    if recorder:
+        terminalreporter.write_sep("-", "Request latency (total, by endpoint)")
+        for line in recorder.report_lines():
+            terminalreporter.write_line(line)
+        export_path = config.getoption("--latency-json")
+        if export_path:
+            terminalreporter.write_line(f"JSON export: {export_path}")
+
+    baseline_report = getattr(config, "_baseline_report", None)
+    if baseline_report and (baseline_report["compared"] or baseline_report["regressions"]):
+        terminalreporter.write_sep("-", "Latency vs baseline", red=bool(baseline_report["regressions"]))
+        for line in baseline_report_lines(baseline_report):
+            terminalreporter.write_line(line)
+        report_path = config.getoption("--latency-regressions-json")
+        if report_path:
+            terminalreporter.write_line(f"JSON report: {report_path}")
+
+    stats = getattr(config, "_http_pool_stats", None)
+    if not stats or not stats["requests"]:
+        return
+    terminalreporter.write_sep("-", "HTTP connection pool")
+    ratio = stats["reused"] / stats["requests"] * 100
+    terminalreporter.write_line(
+        f"requests: {stats['requests']}, new connections: {stats['connections']}, "
+        f"reused: {stats['reused']} ({ratio:.1f}%)"
+    )
+
+
 @pytest.hookimpl(tryfirst=True)
 
 # --- Resume Option Handling ---
@@ -762,3 +1539,19 @@ def pytest_configure(config):
     """
     resume_enabled = config.getoption('--resume')
     config.resume_enabled = resume_enabled
+    config.addinivalue_line("markers", "no_latency_budget: do not check API call times against the latency budget")
+    config.addinivalue_line("markers", "request_headers(headers): extra HTTP headers for every api_client request of the case")
+    config.addinivalue_line("markers", "request_params(params): extra query parameters for every api_client request of the case")
+    # Гистограммы задержек запросов к сервисам (см. services/latency.py)
+    config._latency_recorder = LatencyRecorder()
+
+    # Нагрузочный режим: разбираем спецификацию сразу, чтобы ошибка была до коллекции
+    load_spec = config.getoption("--load")
+    config._load_spec = None
+    if load_spec:
+        try:
+            config._load_spec = parse_load_spec(load_spec)
+        except ValueError as e:
+            raise pytest.UsageError(str(e))
+        if getattr(config.option, "numprocesses", None):
+            raise pytest.UsageError("--load runs in a single process; drop -n (use concurrency=N instead)")
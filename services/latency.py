@@ -0,0 +1,285 @@
+"""
+Замеры задержек HTTP запросов к тестируемым сервисам.
+
+Для каждого запроса SimpleAPIClient / agent_verification записываются:
+connect (установка TCP соединения; 0 при переиспользовании keep-alive),
+ttfb (от отправки до получения заголовков ответа), total и объём тела.
+Значения складываются в лог-гистограммы (корзины с шагом 5%) по ключу
+(service, method, шаблон endpoint): запись — O(1), память не растёт с
+числом запросов, гистограммы воркеров pytest-xdist складываются без потерь.
+"""
+import math
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+LATENCY_METRICS = ("connect", "ttfb", "total")
+PERCENTILES = (50, 95, 99)
+# Заголовки ответа, из которых берется версия сборки сервиса (для базовых линий)
+SERVICE_VERSION_HEADERS = ("X-Service-Version", "X-App-Version", "X-Build-Version", "X-Version")
+
+# --- Шаблон эндпоинта ---
+
+_ID_SEGMENT_RE = re.compile(
+    r"^(\d+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|[0-9a-fA-F]{16,})$"
+)
+
+
+def endpoint_template(url: str) -> str:
+    """'/users/42/roles?x=1' -> '/users/{id}/roles': идентификаторы в пути заменяются на {id}."""
+    path = url.split("?", 1)[0].split("#", 1)[0]
+    segments = ["{id}" if _ID_SEGMENT_RE.match(s) else s for s in path.split("/")]
+    return "/".join(segments) or "/"
+
+
+# --- Гистограмма ---
+
+class LatencyHistogram:
+    """Лог-гистограмма значений в секундах: относительная ошибка перцентилей не больше 5%."""
+
+    GROWTH = 1.05
+    MIN_VALUE = 1e-6
+    _LOG_GROWTH = math.log(GROWTH)
+
+    __slots__ = ("counts", "count", "sum", "min", "max")
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        bucket = int(math.log(value / self.MIN_VALUE) / self._LOG_GROWTH) if value > self.MIN_VALUE else 0
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p: float) -> float:
+        """Верхняя граница корзины, в которую попадает p-й перцентиль (не больше max)."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(p / 100 * self.count))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                upper = self.MIN_VALUE * self.GROWTH ** (bucket + 1)
+                return min(max(upper, self.min), self.max)
+        return self.max
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def summary(self) -> Dict[str, float]:
+        """Перцентили, среднее и максимум в миллисекундах."""
+        result = {f"p{p}": round(self.percentile(p) * 1000, 3) for p in PERCENTILES}
+        result["mean"] = round(self.sum / self.count * 1000, 3) if self.count else 0.0
+        result["max"] = round(self.max * 1000, 3)
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "counts": {str(k): v for k, v in self.counts.items()},
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencyHistogram":
+        hist = cls()
+        hist.counts = {int(k): v for k, v in data.get("counts", {}).items()}
+        hist.count = data.get("count", 0)
+        hist.sum = data.get("sum", 0.0)
+        hist.min = data["min"] if data.get("min") is not None else math.inf
+        hist.max = data.get("max", 0.0)
+        return hist
+
+
+class _EndpointStats:
+    __slots__ = ("histograms", "bytes")
+
+    def __init__(self):
+        self.histograms = {metric: LatencyHistogram() for metric in LATENCY_METRICS}
+        self.bytes = 0
+
+
+Key = Tuple[str, str, str]
+
+
+def service_key(service: Optional[str]) -> str:
+    """Имя сервиса в ключах замеров и versions; "-" — сервис не определен."""
+    return service or "-"
+
+
+class LatencyRecorder:
+    """Гистограммы задержек по (service, method, endpoint) одного процесса pytest."""
+
+    def __init__(self):
+        self._stats: Dict[Key, _EndpointStats] = {}
+        # service -> версия из заголовков ответа (последняя увиденная)
+        self.versions: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def record(self, service: str, method: str, endpoint: str, total: float,
+               ttfb: Optional[float] = None, connect: float = 0.0, nbytes: int = 0) -> None:
+        key = (service_key(service), method.upper(), endpoint_template(endpoint))
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _EndpointStats()
+            stats.histograms["total"].add(total)
+            stats.histograms["ttfb"].add(total if ttfb is None else ttfb)
+            stats.histograms["connect"].add(connect)
+            stats.bytes += nbytes
+
+    def record_response(self, service: str, method: str, endpoint: str, response, total: float,
+                        connect: float = 0.0) -> None:
+        ttfb = response.elapsed.total_seconds() if getattr(response, "elapsed", None) is not None else None
+        self.record(service, method, endpoint, total, ttfb, connect, response_bytes(response))
+        version = response_version(response)
+        if version:
+            self.versions[service_key(service)] = version
+
+    def __bool__(self) -> bool:
+        return bool(self._stats)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Сериализуемое состояние (для xdist workeroutput и JSON-экспорта)."""
+        with self._lock:
+            items = list(self._stats.items())
+        return {
+            "endpoints": [
+                {
+                    "service": service,
+                    "method": method,
+                    "endpoint": endpoint,
+                    "count": stats.histograms["total"].count,
+                    "bytes": stats.bytes,
+                    **{metric: hist.summary() for metric, hist in stats.histograms.items()},
+                    "histograms": {metric: hist.to_dict() for metric, hist in stats.histograms.items()},
+                }
+                for (service, method, endpoint), stats in sorted(items)
+            ],
+            "versions": dict(self.versions),
+        }
+
+    def merge_dict(self, data: Dict[str, Any]) -> None:
+        """Добавляет гистограммы из to_dict() другого процесса."""
+        with self._lock:
+            for entry in data.get("endpoints", []):
+                key = (entry["service"], entry["method"], entry["endpoint"])
+                stats = self._stats.get(key)
+                if stats is None:
+                    stats = self._stats[key] = _EndpointStats()
+                for metric, hist in entry.get("histograms", {}).items():
+                    if metric in stats.histograms:
+                        stats.histograms[metric].merge(LatencyHistogram.from_dict(hist))
+                stats.bytes += entry.get("bytes", 0)
+            self.versions.update(data.get("versions", {}))
+
+    def report_lines(self, limit: int = 30) -> Iterable[str]:
+        """Таблица перцентилей total по эндпоинтам (самые медленные по p95 — первыми)."""
+        with self._lock:
+            rows = [(key, stats.histograms["total"].summary(), stats.histograms["ttfb"].summary(),
+                     stats.histograms["total"].count, stats.bytes)
+                    for key, stats in self._stats.items()]
+        rows.sort(key=lambda row: -row[1]["p95"])
+        yield (f"{'service':<20} {'method':<7} {'endpoint':<40} {'count':>6} "
+               f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ttfb p50':>9} {'avg KB':>8}")
+        for (service, method, endpoint), total, ttfb, count, nbytes in rows[:limit]:
+            yield (f"{service[:20]:<20} {method:<7} {endpoint[:40]:<40} {count:>6} "
+                   f"{total['p50']:>9.1f} {total['p95']:>9.1f} {total['p99']:>9.1f} "
+                   f"{ttfb['p50']:>9.1f} {nbytes / max(count, 1) / 1024:>8.1f}")
+        if len(rows) > limit:
+            yield f"... {len(rows) - limit} more endpoints in the JSON export"
+
+
+def response_bytes(response) -> int:
+    """Байт тела, прочитанных из сокета (до распаковки), либо длина content."""
+    raw = getattr(response, "raw", None)
+    try:
+        if raw is not None:
+            return int(raw.tell())
+    except Exception:
+        pass
+    content = getattr(response, "_content", None)
+    return len(content) if isinstance(content, bytes) else 0
+
+
+def response_version(response) -> Optional[str]:
+    """Версия сервиса из заголовков ответа (None, если сервис ее не сообщает)."""
+    headers = getattr(response, "headers", None) or {}
+    for name in SERVICE_VERSION_HEADERS:
+        value = headers.get(name)
+        if value:
+            return str(value).strip()
+    return None
+
+
+# --- Время установки соединения ---
+
+_connect_timing = threading.local()
+
+
+def reset_connect_time() -> None:
+    _connect_timing.value = 0.0
+
+
+def last_connect_time() -> float:
+    """Время connect() последнего нового соединения в этом потоке (0 — соединение переиспользовано)."""
+    return getattr(_connect_timing, "value", 0.0)
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _connect_timing.value = time.perf_counter() - started
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _connect_timing.value = time.perf_counter() - started
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter, пулы которого замеряют время установки новых соединений."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
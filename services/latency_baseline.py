@@ -0,0 +1,175 @@
+"""
+Базовые линии задержек эндпоинтов между прогонами и поиск регрессий.
+
+В конце сессии замеры LatencyRecorder (перцентили total по эндпоинтам и
+гистограммы) сохраняются в SQLite (logs/latency_baselines.sqlite3) с ключом
+mirada host + версия сервиса (если сервис ее сообщает в заголовках ответа).
+До сохранения текущий прогон сравнивается с последними BASELINE_RUNS
+прогонами на том же хосте: по p50 и p95 берется медиана базовых прогонов и
+ее разброс (MAD); регрессия — если текущее значение выше медианы больше чем
+на max(Z_THRESHOLD * sigma, REL_TOLERANCE * медиана, ABS_TOLERANCE_MS).
+"""
+import json
+import os
+import sqlite3
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+from services.latency import service_key
+
+DEFAULT_BASELINE_DB = os.path.join("logs", "latency_baselines.sqlite3")
+BASELINE_RUNS = 5
+MIN_BASELINE_RUNS = 3
+MIN_SAMPLES = 3
+Z_THRESHOLD = 3.0
+REL_TOLERANCE = 0.2
+ABS_TOLERANCE_MS = 1.0
+COMPARED_METRICS = ("p50", "p95")
+# Масштаб MAD к стандартному отклонению для нормального распределения
+_MAD_SCALE = 1.4826
+
+
+class LatencyBaselineStore:
+    """SQLite хранилище перцентилей задержек по прогонам."""
+
+    def __init__(self, path: str = DEFAULT_BASELINE_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " started REAL NOT NULL,"
+            " host TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS endpoint_latency ("
+            " run_id INTEGER NOT NULL REFERENCES runs(id),"
+            " service TEXT NOT NULL,"
+            " version TEXT,"
+            " method TEXT NOT NULL,"
+            " endpoint TEXT NOT NULL,"
+            " count INTEGER NOT NULL,"
+            " p50 REAL NOT NULL,"
+            " p95 REAL NOT NULL,"
+            " p99 REAL NOT NULL,"
+            " histogram TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS endpoint_latency_key"
+            " ON endpoint_latency(service, method, endpoint, run_id)"
+        )
+        self._conn.commit()
+
+    def save_run(self, host: str, latency: Dict[str, Any], versions: Dict[str, str]) -> int:
+        """Сохраняет LatencyRecorder.to_dict() как новый прогон; возвращает его id."""
+        with self._conn:
+            run_id = self._conn.execute(
+                "INSERT INTO runs (started, host) VALUES (?, ?)", (time.time(), host)
+            ).lastrowid
+            self._conn.executemany(
+                "INSERT INTO endpoint_latency"
+                " (run_id, service, version, method, endpoint, count, p50, p95, p99, histogram)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (run_id, e["service"], versions.get(service_key(e["service"])), e["method"], e["endpoint"], e["count"],
+                     e["total"]["p50"], e["total"]["p95"], e["total"]["p99"],
+                     json.dumps(e["histograms"]["total"]))
+                    for e in latency.get("endpoints", [])
+                ],
+            )
+        return run_id
+
+    def baseline(self, host: str, service: str, method: str, endpoint: str,
+                 runs: int = BASELINE_RUNS) -> List[Dict[str, Any]]:
+        """Последние runs прогонов эндпоинта на хосте (с достаточным числом замеров), новые первыми."""
+        rows = self._conn.execute(
+            "SELECT l.run_id, l.version, l.count, l.p50, l.p95, l.p99"
+            " FROM endpoint_latency l JOIN runs r ON r.id = l.run_id"
+            " WHERE r.host = ? AND l.service = ? AND l.method = ? AND l.endpoint = ? AND l.count >= ?"
+            " ORDER BY l.run_id DESC LIMIT ?",
+            (host, service, method, endpoint, MIN_SAMPLES, runs),
+        ).fetchall()
+        return [dict(zip(("run_id", "version", "count", "p50", "p95", "p99"), row)) for row in rows]
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def _threshold(values: List[float]) -> Dict[str, float]:
+    median = statistics.median(values)
+    sigma = _MAD_SCALE * statistics.median(abs(v - median) for v in values)
+    return {
+        "median": median,
+        "limit": median + max(Z_THRESHOLD * sigma, REL_TOLERANCE * median, ABS_TOLERANCE_MS),
+    }
+
+
+def compare_to_baseline(store: LatencyBaselineStore, host: str, latency: Dict[str, Any],
+                        versions: Dict[str, str], runs: int = BASELINE_RUNS) -> Dict[str, Any]:
+    """
+    Сравнивает текущий прогон (LatencyRecorder.to_dict()) с базовой линией.
+    Возвращает {'compared', 'no_baseline', 'regressions': [...]}.
+    """
+    report = {"host": host, "compared": 0, "no_baseline": 0, "regressions": []}
+    for entry in latency.get("endpoints", []):
+        if entry["count"] < MIN_SAMPLES:
+            continue
+        history = store.baseline(host, entry["service"], entry["method"], entry["endpoint"], runs)
+        if len(history) < MIN_BASELINE_RUNS:
+            report["no_baseline"] += 1
+            continue
+        report["compared"] += 1
+        for metric in COMPARED_METRICS:
+            current = entry["total"][metric]
+            bound = _threshold([run[metric] for run in history])
+            if current > bound["limit"]:
+                report["regressions"].append({
+                    "service": entry["service"],
+                    "method": entry["method"],
+                    "endpoint": entry["endpoint"],
+                    "metric": metric,
+                    "current_ms": current,
+                    "baseline_ms": round(bound["median"], 3),
+                    "limit_ms": round(bound["limit"], 3),
+                    "ratio": round(current / bound["median"], 2) if bound["median"] else None,
+                    "version": versions.get(service_key(entry["service"])),
+                    "baseline_versions": sorted({run["version"] for run in history if run["version"]}),
+                    "baseline_runs": len(history),
+                })
+    return report
+
+
+def report_lines(report: Dict[str, Any]) -> List[str]:
+    lines = [
+        f"host {report['host']}: {report['compared']} endpoints compared, "
+        f"{report['no_baseline']} without baseline (< {MIN_BASELINE_RUNS} runs), "
+        f"{len(report['regressions'])} regressions"
+    ]
+    for r in sorted(report["regressions"], key=lambda r: -(r["ratio"] or 0)):
+        version = ""
+        if r["version"] and r["version"] not in r["baseline_versions"]:
+            version = f" [version {', '.join(r['baseline_versions']) or '?'} -> {r['version']}]"
+        lines.append(
+            f"REGRESSION {(r['service'] or '-')} {r['method']} {r['endpoint']} {r['metric']}: "
+            f"{r['current_ms']:.1f} ms vs baseline {r['baseline_ms']:.1f} ms "
+            f"(limit {r['limit_ms']:.1f}, x{r['ratio']}){version}"
+        )
+    return lines
+
+
+def check_and_store(path: str, host: str, latency: Dict[str, Any], versions: Dict[str, str],
+                    report_path: Optional[str] = None) -> Dict[str, Any]:
+    """Сравнение с базовой линией, затем сохранение прогона; отчет пишется в report_path."""
+    store = LatencyBaselineStore(path)
+    try:
+        report = compare_to_baseline(store, host, latency, versions)
+        report["run_id"] = store.save_run(host, latency, versions)
+    finally:
+        store.close()
+    if report_path:
+        os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
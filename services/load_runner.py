@@ -0,0 +1,220 @@
+"""
+Нагрузочный режим: сгенерированные POSITIVE_CASES как замкнутая нагрузка.
+
+`pytest services/vswitch --mirada-host=... --load duration=60s,concurrency=32`
+вместо выполнения тестов берёт из собранных модулей ENDPOINT, METHOD и
+POSITIVE_CASES (в файле с несколькими методами — и METHOD_POST,
+POSITIVE_CASES_POST и т.д.) и гоняет их по кругу из `concurrency` потоков в
+течение `duration`: каждый поток отправляет следующий запрос сразу после
+ответа на предыдущий. По каждому эндпоинту считаются запросы/с, доля ошибок (исключение
+или статус, отличный от ожидаемого в кейсе) и перцентили задержек.
+"""
+import itertools
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Tuple
+
+from services.latency import LatencyRecorder, endpoint_template, service_key
+
+DEFAULT_DURATION = 60.0
+DEFAULT_CONCURRENCY = 8
+
+_DURATION_RE = re.compile(r"^(\d+(?:\.\d+)?)\s*(ms|s|m|h)?$")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, None: 1}
+
+
+def parse_load_spec(spec: str) -> Tuple[float, int]:
+    """'duration=60s,concurrency=32' -> (60.0, 32). Пустые поля — значения по умолчанию."""
+    duration, concurrency = DEFAULT_DURATION, DEFAULT_CONCURRENCY
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        key, _, value = part.partition("=")
+        key, value = key.strip(), value.strip()
+        if key == "duration":
+            match = _DURATION_RE.match(value)
+            if not match:
+                raise ValueError(f"Invalid duration '{value}' (expected e.g. 30s, 2m, 500ms)")
+            duration = float(match.group(1)) * _DURATION_UNITS[match.group(2)]
+        elif key == "concurrency":
+            concurrency = int(value)
+        else:
+            raise ValueError(f"Unknown --load option '{key}' (expected duration, concurrency)")
+    if duration <= 0 or concurrency <= 0:
+        raise ValueError("--load duration and concurrency must be positive")
+    return duration, concurrency
+
+
+@dataclass
+class LoadTarget:
+    """Кейсы одного модуля тестов: куда и что отправлять."""
+    client: Any
+    method: str
+    endpoint: str
+    cases: List[Tuple[Any, Any, Dict[str, Any], Dict[str, Any]]]
+
+
+@dataclass
+class _Counters:
+    requests: int = 0
+    errors: int = 0
+    statuses: Dict[Any, int] = field(default_factory=dict)
+
+
+def module_variants(module) -> List[Tuple[str, str]]:
+    """
+    (METHOD, суффикс имён) для каждого метода модуля. GET /x и POST /x пишутся в
+    один x.py: при слиянии отличающиеся константы второго метода получают суффикс
+    (METHOD_POST, POSITIVE_CASES_POST, LATENCY_BUDGET_MS_POST, см. utils/test_merger.py).
+    """
+    variants = [(str(getattr(module, "METHOD", "GET")).upper(), "")]
+    for name in sorted(vars(module)):
+        if name.startswith("METHOD_") and isinstance(getattr(module, name), str):
+            variants.append((getattr(module, name).upper(), name[len("METHOD"):]))
+    return variants
+
+
+def module_constant(module, name: str, suffix: str = "", default: Any = None) -> Any:
+    """Константа метода с суффиксом; без суффикса в файле — общая (совпала при слиянии)."""
+    if suffix and hasattr(module, name + suffix):
+        return getattr(module, name + suffix)
+    return getattr(module, name, default)
+
+
+def _mark_dict(case, name: str) -> Dict[str, Any]:
+    """Аргументы маркера name из pytest.param(..., marks=...) — как в фикстурах conftest."""
+    result: Dict[str, Any] = {}
+    for mark in getattr(case, "marks", None) or ():
+        mark = getattr(mark, "mark", mark)
+        if getattr(mark, "name", None) == name:
+            if mark.args:
+                result.update(mark.args[0])
+            result.update(mark.kwargs)
+    return result
+
+
+def module_cases(module, suffix: str = "") -> List[Tuple[Any, Any, Dict[str, Any], Dict[str, Any]]]:
+    """
+    (data, expected_status, headers, params) из POSITIVE_CASES{suffix} модуля
+    (pytest.param или кортежи); headers и params — из маркеров request_headers и
+    request_params кейса.
+    """
+    cases = []
+    for case in module_constant(module, "POSITIVE_CASES", suffix) or []:
+        values = getattr(case, "values", case)
+        if isinstance(values, (tuple, list)) and len(values) >= 2:
+            cases.append((values[0], values[1], _mark_dict(case, "request_headers"), _mark_dict(case, "request_params")))
+    return cases
+
+
+def send_case(client, method: str, endpoint: str, data: Any, headers: Dict[str, Any] = None,
+              params: Dict[str, Any] = None):
+    """Запрос так же, как его отправляет сгенерированный тест (с заголовками и query кейса)."""
+    kwargs = {}
+    if headers:
+        kwargs["headers"] = {**client.headers, **headers}
+    if method in ("POST", "PUT", "PATCH"):
+        return client.request(method, endpoint, json=data, params=params or None, **kwargs)
+    if params and isinstance(data, dict):
+        data = {**params, **data}
+    return client.request(method, endpoint, params=data, **kwargs)
+
+
+def _status_matches(status: int, expected: Any) -> bool:
+    if isinstance(expected, (list, tuple, set)):
+        return status in expected
+    return expected is None or status == expected
+
+
+def run_load(targets: List[LoadTarget], duration: float, concurrency: int,
+             progress: Callable[[str], None] = None) -> Dict[str, Any]:
+    """
+    Замкнутая нагрузка: concurrency потоков по кругу отправляют все кейсы всех
+    targets, пока не истечёт duration. Возвращает сводку по эндпоинтам.
+    """
+    recorder = LatencyRecorder()
+    counters: Dict[Tuple[str, str, str], _Counters] = {}
+    lock = threading.Lock()
+    work = [(target, case) for target in targets for case in target.cases]
+    if not work:
+        return {"duration": 0.0, "concurrency": concurrency, "endpoints": []}
+    # Сдвиг старта у каждого потока, чтобы не бить все вместе в первый кейс
+    next_index = itertools.count()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        position = next(next_index)
+        while time.monotonic() < deadline:
+            target, (data, expected, headers, params) = work[position % len(work)]
+            position += 1
+            key = (service_key(target.client.service), target.method, endpoint_template(target.endpoint))
+            started = time.perf_counter()
+            status = None
+            try:
+                response = send_case(target.client, target.method, target.endpoint, data, headers, params)
+                status = response.status_code
+                failed = not _status_matches(status, expected)
+                recorder.record_response(target.client.service, target.method, target.endpoint,
+                                         response, time.perf_counter() - started)
+            except Exception as e:
+                failed = True
+                status = type(e).__name__
+                recorder.record(target.client.service, target.method, target.endpoint,
+                                time.perf_counter() - started)
+            with lock:
+                entry = counters.get(key)
+                if entry is None:
+                    entry = counters[key] = _Counters()
+                entry.requests += 1
+                entry.errors += failed
+                entry.statuses[status] = entry.statuses.get(status, 0) + 1
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, name=f"load-{i}", daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads):
+        for thread in threads:
+            thread.join(timeout=5)
+        if progress is not None and time.monotonic() < deadline:
+            with lock:
+                done = sum(c.requests for c in counters.values())
+            progress(f"[load] {time.monotonic() - started:.0f}s, {done} requests")
+    elapsed = time.monotonic() - started
+
+    latency = {(e["service"], e["method"], e["endpoint"]): e for e in recorder.to_dict()["endpoints"]}
+    endpoints = []
+    for (service, method, endpoint), entry in sorted(counters.items()):
+        stats = latency.get((service, method, endpoint), {})
+        endpoints.append({
+            "service": service,
+            "method": method,
+            "endpoint": endpoint,
+            "requests": entry.requests,
+            "errors": entry.errors,
+            "rps": round(entry.requests / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(entry.errors / entry.requests, 4) if entry.requests else 0.0,
+            "statuses": {str(k): v for k, v in entry.statuses.items()},
+            "latency_ms": stats.get("total", {}),
+        })
+    return {"duration": round(elapsed, 3), "concurrency": concurrency, "endpoints": endpoints}
+
+
+def report_lines(result: Dict[str, Any]) -> List[str]:
+    total = sum(e["requests"] for e in result["endpoints"])
+    errors = sum(e["errors"] for e in result["endpoints"])
+    duration = result["duration"] or 1
+    lines = [
+        f"duration {result['duration']:.1f}s, concurrency {result['concurrency']}, "
+        f"{total} requests, {total / duration:.1f} req/s, errors {errors}",
+        f"{'service':<20} {'method':<7} {'endpoint':<40} {'req/s':>8} {'err %':>6} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}",
+    ]
+    for e in sorted(result["endpoints"], key=lambda e: -e["rps"]):
+        latency = e["latency_ms"]
+        lines.append(
+            f"{(e['service'] or '-')[:20]:<20} {e['method']:<7} {e['endpoint'][:40]:<40} {e['rps']:>8.1f} "
+            f"{e['error_rate'] * 100:>6.1f} {latency.get('p50', 0):>9.1f} {latency.get('p95', 0):>9.1f} "
+            f"{latency.get('p99', 0):>9.1f}"
+        )
+    return lines
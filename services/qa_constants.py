@@ -114,4 +114,16 @@ TUNNEL_CONFIG = {
     "centec": (7783, 7783, "127.0.0.1"),
     "core": (4006, 4006, "127.0.0.1"),
     "csi-server": (2999, 2999, "127.0.0.1")
-}
\ No newline at end of file
+}
+
+# Бюджет времени ответа (мс) для сервиса (ключ как в TUNNEL_CONFIG).
+# Используется, если в модуле тестов нет LATENCY_BUDGET_MS из x-latency-budget-ms swagger;
+# для сервисов не из этого списка (и модулей без бюджета) время ответа не проверяется.
+LATENCY_BUDGETS_MS = {
+    "vswitch": 1000,
+    "vswitch-connections": 1000,
+    "vswitch-filter": 1000,
+    "netmap": 1000,
+    "services-monitor": 1000,
+    "analytics-server": 5000,
+}
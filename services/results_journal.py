@@ -0,0 +1,113 @@
+"""Append-only журнал результатов тестов в формате JSONL.
+
+Каждая строка — один JSON объект (passed/failed тест). Записи копятся в памяти
+и сбрасываются одним write() в файл, открытый с O_APPEND, под flock — поэтому
+несколько процессов (pytest-xdist воркеры) могут писать в один файл, не
+перемешивая строки. fsync выполняется не чаще, чем раз в FSYNC_INTERVAL секунд,
+и обязательно при закрытии.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: O_APPEND без межпроцессной блокировки
+    fcntl = None
+
+DEFAULT_JOURNAL_FILE = Path("logs/results.jsonl")
+# Старый формат (JSON массив) — читается при --resume, если журнала еще нет
+LEGACY_PASSED_FILE = Path("logs/passed_tests.json")
+
+FLUSH_EVERY = 50
+FSYNC_INTERVAL = 2.0
+
+
+class ResultsJournal:
+    """Буферизованная дозапись JSONL записей в общий файл."""
+
+    def __init__(self, path=DEFAULT_JOURNAL_FILE, truncate=False):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        if truncate:
+            flags |= os.O_TRUNC
+        self._fd = os.open(self.path, flags, 0o644)
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._last_fsync = self._last_flush
+
+    def append(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._buffer.append(line)
+            if len(self._buffer) >= FLUSH_EVERY or time.monotonic() - self._last_flush >= FSYNC_INTERVAL:
+                self._flush_locked()
+
+    def flush(self, fsync=False):
+        with self._lock:
+            self._flush_locked(force_fsync=fsync)
+
+    def _flush_locked(self, force_fsync=False):
+        now = time.monotonic()
+        if self._buffer:
+            data = "".join(self._buffer).encode("utf-8")
+            self._buffer.clear()
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                view = memoryview(data)
+                while view:
+                    written = os.write(self._fd, view)
+                    view = view[written:]
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._last_flush = now
+        if force_fsync or now - self._last_fsync >= FSYNC_INTERVAL:
+            os.fsync(self._fd)
+            self._last_fsync = now
+
+    def close(self):
+        with self._lock:
+            if self._fd is None:
+                return
+            self._flush_locked(force_fsync=True)
+            os.close(self._fd)
+            self._fd = None
+
+
+def iter_records(path=DEFAULT_JOURNAL_FILE):
+    """Записи журнала; оборванная последняя строка (падение процесса) пропускается."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+    except FileNotFoundError:
+        return
+
+
+def load_passed_index(path=DEFAULT_JOURNAL_FILE, legacy_path=LEGACY_PASSED_FILE):
+    """Множество nodeid прошедших тестов (для --resume), читается один раз."""
+    path = Path(path)
+    if path.exists():
+        return {r["nodeid"] for r in iter_records(path) if r.get("outcome") == "passed" and "nodeid" in r}
+    try:
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            return {r["nodeid"] for r in json.load(f)}
+    except FileNotFoundError:
+        return set()
+    except Exception as e:
+        sys.stderr.write(f"[results-journal] failed to read {legacy_path}: {e}\n")
+        return set()
@@ -0,0 +1,267 @@
+"""pytest плагин: история прогонов в SQLite, порядок тестов по длительности и оценка нестабильности.
+
+Поведение:
+    - Путь по умолчанию: logs/run_history.sqlite3 (--run-history, пусто — отключить)
+    - Для каждого nodeid пишется суммарная длительность (setup + call + teardown) и исход;
+      пишет только главный процесс (отчеты воркеров xdist приходят ему же), в конце сессии
+    - Прогноз длительности теста — медиана последних PREDICTION_RUNS прогонов;
+      для тестов без истории — медиана прогнозов известных тестов
+    - Без xdist и с --dist loadscope/loadfile/loadgroup модули идут по убыванию
+      суммарной длительности (порядок внутри модуля сохраняется, module-фикстуры
+      не пересоздаются); с --dist load/worksteal — тесты по убыванию длительности,
+      и планировщик xdist раздает самые долгие первыми свободным воркерам (LPT)
+    - Нестабильность (flaky score) — доля смен исхода passed <-> failed между
+      соседними из последних FLAKY_WINDOW прогонов теста
+"""
+
+import os
+import sqlite3
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional
+
+import pytest
+
+DEFAULT_HISTORY_DB = os.path.join("logs", "run_history.sqlite3")
+PREDICTION_RUNS = 5
+FLAKY_WINDOW = 20
+FLAKY_MIN_RUNS = 3
+KEEP_RUNS = 200
+# --dist режимы xdist, в которых тесты раздаются по одному (а не модулями)
+_ITEM_LEVEL_DIST = ("load", "worksteal")
+
+
+class RunHistory:
+    """SQLite хранилище длительностей и исходов тестов по прогонам."""
+
+    def __init__(self, path: str = DEFAULT_HISTORY_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " started REAL NOT NULL,"
+            " finished REAL NOT NULL,"
+            " workers INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " run_id INTEGER NOT NULL REFERENCES runs(id),"
+            " nodeid TEXT NOT NULL,"
+            " duration REAL NOT NULL,"
+            " outcome TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_nodeid ON results(nodeid, run_id)")
+        self._conn.commit()
+
+    def save_run(self, started: float, workers: int, results: Dict[str, Dict]) -> int:
+        with self._conn:
+            run_id = self._conn.execute(
+                "INSERT INTO runs (started, finished, workers) VALUES (?, ?, ?)",
+                (started, time.time(), workers),
+            ).lastrowid
+            self._conn.executemany(
+                "INSERT INTO results (run_id, nodeid, duration, outcome) VALUES (?, ?, ?, ?)",
+                [(run_id, nodeid, r["duration"], r["outcome"]) for nodeid, r in results.items()],
+            )
+            # Храним только последние KEEP_RUNS прогонов
+            self._conn.execute("DELETE FROM results WHERE run_id <= ?", (run_id - KEEP_RUNS,))
+            self._conn.execute("DELETE FROM runs WHERE id <= ?", (run_id - KEEP_RUNS,))
+        return run_id
+
+    def predicted_durations(self, runs: int = PREDICTION_RUNS) -> Dict[str, float]:
+        """nodeid -> медиана длительности за последние runs прогонов (без skipped)."""
+        rows = self._conn.execute(
+            "SELECT nodeid, duration FROM ("
+            "  SELECT nodeid, duration,"
+            "         ROW_NUMBER() OVER (PARTITION BY nodeid ORDER BY run_id DESC) AS n"
+            "  FROM results WHERE outcome != 'skipped'"
+            ") WHERE n <= ?",
+            (runs,),
+        ).fetchall()
+        durations: Dict[str, List[float]] = {}
+        for nodeid, duration in rows:
+            durations.setdefault(nodeid, []).append(duration)
+        return {nodeid: statistics.median(values) for nodeid, values in durations.items()}
+
+    def flaky_scores(self, window: int = FLAKY_WINDOW, nodeids=None) -> Dict[str, Dict]:
+        """
+        nodeid -> {'score', 'runs', 'failures'}: доля смен исхода между соседними
+        прогонами (0 — стабилен, 1 — исход меняется каждый раз). Только тесты,
+        которые в окне и проходили, и падали.
+        """
+        rows = self._conn.execute(
+            "SELECT nodeid, outcome FROM ("
+            "  SELECT nodeid, outcome, run_id,"
+            "         ROW_NUMBER() OVER (PARTITION BY nodeid ORDER BY run_id DESC) AS n"
+            "  FROM results WHERE outcome != 'skipped'"
+            ") WHERE n <= ? ORDER BY nodeid, run_id",
+            (window,),
+        ).fetchall()
+        outcomes: Dict[str, List[bool]] = {}
+        for nodeid, outcome in rows:
+            if nodeids is None or nodeid in nodeids:
+                outcomes.setdefault(nodeid, []).append(outcome == "passed")
+        scores = {}
+        for nodeid, passed in outcomes.items():
+            failures = passed.count(False)
+            if len(passed) < FLAKY_MIN_RUNS or not failures or failures == len(passed):
+                continue
+            flips = sum(1 for a, b in zip(passed, passed[1:]) if a != b)
+            scores[nodeid] = {
+                "score": round(flips / (len(passed) - 1), 3),
+                "runs": len(passed),
+                "failures": failures,
+            }
+        return scores
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def order_by_duration(items: List[pytest.Item], predicted: Dict[str, float], item_level: bool) -> float:
+    """
+    Сортирует items на месте по прогнозу длительности (самые долгие первыми).
+    item_level=False — сортируются модули целиком. Возвращает прогноз суммарного времени.
+    """
+    known = [predicted[item.nodeid] for item in items if item.nodeid in predicted]
+    default = statistics.median(known) if known else 0.0
+    estimate = {item.nodeid: predicted.get(item.nodeid, default) for item in items}
+    position = {item.nodeid: i for i, item in enumerate(items)}
+
+    if item_level:
+        # Стабильно: при равном прогнозе сохраняется порядок коллекции (одинаковый на всех воркерах)
+        items.sort(key=lambda item: (-estimate[item.nodeid], position[item.nodeid]))
+    else:
+        module_total: Dict[str, float] = {}
+        module_first: Dict[str, int] = {}
+        for item in items:
+            module = item.nodeid.split("::", 1)[0]
+            module_total[module] = module_total.get(module, 0.0) + estimate[item.nodeid]
+            module_first.setdefault(module, position[item.nodeid])
+        items.sort(key=lambda item: (
+            -module_total[item.nodeid.split("::", 1)[0]],
+            module_first[item.nodeid.split("::", 1)[0]],
+            position[item.nodeid],
+        ))
+    return sum(estimate.values())
+
+
+class RunHistoryPlugin:
+    def __init__(self, config, path: str):
+        self.config = config
+        self.path = path
+        self.is_worker = hasattr(config, "workerinput")
+        self.started = time.time()
+        self.results: Dict[str, Dict] = {}
+        self.flaky: Dict[str, Dict] = {}
+        self.order_summary: Optional[str] = None
+
+    def _open(self) -> Optional[RunHistory]:
+        try:
+            return RunHistory(self.path)
+        except (OSError, sqlite3.Error) as e:
+            sys.stderr.write(f"[run-history] failed to open {self.path}: {e}\n")
+            return None
+
+    @pytest.hookimpl(trylast=True)
+    def pytest_collection_modifyitems(self, session, config, items):
+        """Порядок по прогнозу длительности (после снятия прошедших/недоступных тестов)."""
+        if not items or config.getoption("--no-history-order"):
+            return
+        history = self._open()
+        if history is None:
+            return
+        try:
+            predicted = history.predicted_durations()
+        finally:
+            history.close()
+        if not predicted:
+            return
+
+        dist = getattr(config.option, "dist", "no")
+        xdist = dist != "no" and (getattr(config.option, "numprocesses", None) or self.is_worker)
+        item_level = bool(xdist) and dist in _ITEM_LEVEL_DIST
+        total = order_by_duration(items, predicted, item_level)
+        known = sum(1 for item in items if item.nodeid in predicted)
+        self.order_summary = (
+            f"[history] {len(items)} tests ordered longest-first by {'test' if item_level else 'module'} "
+            f"({known} with history), predicted total {total:.1f}s"
+        )
+        reporter = config.pluginmanager.get_plugin("terminalreporter")
+        if reporter is not None and not self.is_worker:
+            reporter.write_line(self.order_summary)
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_testnodedown(self, node, error):
+        """xdist: контроллер не собирает тесты — строку о порядке присылает воркер."""
+        summary = getattr(node, "workeroutput", {}).get("run_history_order")
+        if summary and self.order_summary is None:
+            self.order_summary = summary
+
+    def pytest_runtest_logreport(self, report):
+        if self.is_worker:
+            return
+        entry = self.results.setdefault(report.nodeid, {"duration": 0.0, "outcome": "passed"})
+        entry["duration"] += report.duration
+        if report.failed:
+            entry["outcome"] = "failed" if report.when == "call" else "error"
+        elif report.skipped and entry["outcome"] == "passed":
+            entry["outcome"] = "skipped"
+
+    def pytest_sessionfinish(self, session, exitstatus):
+        if self.is_worker:
+            if self.order_summary:
+                self.config.workeroutput["run_history_order"] = self.order_summary
+            return
+        if not self.results:
+            return
+        history = self._open()
+        if history is None:
+            return
+        try:
+            # Оценка по прошлым запускам (до сохранения текущего) для выполненных тестов:
+            # под xdist контроллер не собирает тесты, поэтому берем nodeid из отчетов
+            self.flaky = history.flaky_scores(nodeids=set(self.results))
+            workers = getattr(self.config.option, "numprocesses", None) or 1
+            history.save_run(self.started, workers, self.results)
+        except sqlite3.Error as e:
+            sys.stderr.write(f"[run-history] failed to save run: {e}\n")
+        finally:
+            history.close()
+
+    def pytest_terminal_summary(self, terminalreporter, exitstatus, config):
+        if self.order_summary and getattr(config.option, "numprocesses", None):
+            terminalreporter.write_line(self.order_summary)
+        if not self.flaky:
+            return
+        terminalreporter.write_sep("-", "Flaky tests (run history)")
+        rows = sorted(self.flaky.items(), key=lambda kv: (-kv[1]["score"], kv[0]))
+        for nodeid, entry in rows[:15]:
+            terminalreporter.write_line(
+                f"{entry['score']:>5.2f}  {entry['failures']}/{entry['runs']} failed  {nodeid}"
+            )
+        if len(rows) > 15:
+            terminalreporter.write_line(f"... {len(rows) - 15} more")
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--run-history",
+        action="store",
+        default=DEFAULT_HISTORY_DB,
+        help="SQLite history of test durations and outcomes (empty to disable)."
+    )
+    parser.addoption(
+        "--no-history-order",
+        action="store_true",
+        help="Keep collection order instead of ordering tests by predicted duration."
+    )
+
+
+def pytest_configure(config):
+    path = config.getoption("--run-history")
+    if path:
+        config.pluginmanager.register(RunHistoryPlugin(config, path), "run_history_plugin")
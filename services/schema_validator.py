@@ -0,0 +1,424 @@
+"""
+Компилируемый валидатор JSON-Schema для ответов API.
+
+Схема один раз превращается в специализированную Python-функцию (исходный код
+генерируется и компилируется через exec): проверки типов, enum, format,
+required и обход properties/items разворачиваются в прямой код без
+интерпретации схемы на каждом вызове. Валидатор собирает все ошибки, а не
+останавливается на первой.
+
+Поддерживаемое подмножество (то, что выдаёт генератор тестов):
+type (строка или список), nullable, items, properties, required, enum, format.
+Остальные ключевые слова (description, $ref-маркеры и т.п.) игнорируются.
+
+Скомпилированные валидаторы кешируются по идентичности объекта схемы и по
+хэшу её содержимого.
+
+Большие массивы можно валидировать потоково (validate_array_stream): элементы
+разбираются из чанков тела ответа по одному, память не растёт с размером ответа.
+"""
+import builtins
+import codecs
+import hashlib
+import ipaddress
+import json
+import re
+import threading
+import uuid
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+Validator = Callable[[Any], List[str]]
+
+_TYPE_CHECKS = {
+    "string": "isinstance({v}, str)",
+    "integer": "(isinstance({v}, int) and not isinstance({v}, bool))",
+    "number": "(isinstance({v}, (int, float)) and not isinstance({v}, bool))",
+    "boolean": "isinstance({v}, bool)",
+    "object": "isinstance({v}, dict)",
+    "array": "isinstance({v}, list)",
+    "null": "({v} is None)",
+}
+
+_DATE_TIME_RE = re.compile(
+    r"^\d{4}-\d{2}-\d{2}[Tt ]\d{2}:\d{2}:\d{2}(\.\d+)?([Zz]|[+-]\d{2}:?\d{2})?$"
+)
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+def _is_uuid(value: str) -> bool:
+    try:
+        uuid.UUID(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _is_ip(version: int) -> Callable[[str], bool]:
+    def check(value: str) -> bool:
+        try:
+            return ipaddress.ip_address(value).version == version
+        except ValueError:
+            return False
+    return check
+
+
+# Форматы-регулярки проверяются вызовом pattern.match прямо в сгенерированном коде
+_FORMAT_PATTERNS = {
+    "date-time": _DATE_TIME_RE,
+    "date": _DATE_RE,
+    "email": _EMAIL_RE,
+}
+_FORMAT_CHECKS: Dict[str, Callable[[str], bool]] = {
+    "uuid": _is_uuid,
+    "ipv4": _is_ip(4),
+    "ipv6": _is_ip(6),
+}
+
+
+def _type_name(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float)):
+        return "number" if isinstance(value, float) else "integer"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, list):
+        return "array"
+    if isinstance(value, dict):
+        return "object"
+    return type(value).__name__
+
+
+def _json_equal(a: Any, b: Any) -> bool:
+    """Равенство JSON-значений: true не равно 1, 1 равно 1.0, объекты и массивы — поэлементно."""
+    if isinstance(a, bool) or isinstance(b, bool):
+        return a is b
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return a == b
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_json_equal(a[k], b[k]) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_json_equal(x, y) for x, y in zip(a, b))
+    return type(a) is type(b) and a == b
+
+
+def _in_enum(value: Any, allowed: List[Any]) -> bool:
+    return any(_json_equal(value, item) for item in allowed)
+
+
+_ENUM_SCALARS = (str, int, float, type(None))
+
+_BUILTINS = {
+    name: getattr(builtins, name)
+    for name in ("isinstance", "str", "int", "float", "bool", "dict", "list", "enumerate", "sorted", "map", "type")
+}
+
+
+class _Compiler:
+    """Генератор исходного кода одной функции-валидатора."""
+
+    def __init__(self):
+        self.lines: List[str] = []
+        self.namespace: Dict[str, Any] = {
+            "_type_name": _type_name,
+            "_short": _short_repr,
+            "_in_enum": _in_enum,
+        }
+        self._counter = 0
+
+    def _name(self, prefix: str) -> str:
+        self._counter += 1
+        return f"{prefix}{self._counter}"
+
+    def _const(self, value: Any, prefix: str = "C") -> str:
+        name = self._name(prefix)
+        self.namespace[name] = value
+        return name
+
+    def emit(self, indent: int, line: str) -> None:
+        self.lines.append("    " * indent + line)
+
+    def node(self, schema: Any, var: str, path: str, indent: int) -> None:
+        """
+        Код проверки значения в переменной var против schema.
+        path — тело f-строки пути до значения (динамические индексы — через {iN}).
+        """
+        if not isinstance(schema, dict):
+            return
+
+        types = schema.get("type")
+        if isinstance(types, str):
+            types = [types]
+        types = [t for t in (types or []) if t in _TYPE_CHECKS]
+        nullable = bool(schema.get("nullable")) or "null" in types
+        types = [t for t in types if t != "null"]
+        start = len(self.lines)
+
+        if nullable:
+            self.emit(indent, f"if {var} is not None:")
+            indent += 1
+
+        else_line = None
+        if types:
+            checks = " or ".join(_TYPE_CHECKS[t].format(v=var) for t in types)
+            self.emit(indent, f"if not ({checks}):")
+            self.emit(indent + 1, f"errors.append(f\"{path}: expected {' | '.join(types)}, got {{_type_name({var})}}\")")
+            # Остальные проверки — только для значения нужного типа
+            self.emit(indent, "else:")
+            else_line = len(self.lines)
+            indent += 1
+
+        if "enum" in schema and isinstance(schema["enum"], list):
+            enum = schema["enum"]
+            if all(isinstance(e, _ENUM_SCALARS) and not isinstance(e, bool) for e in enum):
+                # Хэшируемые скаляры без bool: проверка по множеству, а точный тип
+                # значения отсекает true для enum [1] и dict/list до хэширования
+                classes = {type(e) for e in enum}
+                if classes & {int, float}:
+                    classes |= {int, float}
+                allowed = self._const(frozenset(enum), "ENUM")
+                allowed_types = self._const(frozenset(classes), "ENUMT")
+                self.emit(indent, f"if type({var}) not in {allowed_types} or {var} not in {allowed}:")
+            else:
+                allowed = self._const(list(enum), "ENUM")
+                self.emit(indent, f"if not _in_enum({var}, {allowed}):")
+            self.emit(indent + 1, f"errors.append(f\"{path}: {{_short({var})}} is not one of {{sorted(map(str, {allowed}))}}\")")
+
+        fmt = schema.get("format")
+        if fmt in _FORMAT_PATTERNS or fmt in _FORMAT_CHECKS:
+            guard = "" if types == ["string"] else f"isinstance({var}, str) and "
+            if fmt in _FORMAT_PATTERNS:
+                match = self._const(_FORMAT_PATTERNS[fmt].match, "FMT")
+                self.emit(indent, f"if {guard}{match}({var}) is None:")
+            else:
+                check = self._const(_FORMAT_CHECKS[fmt], "FMT")
+                self.emit(indent, f"if {guard}not {check}({var}):")
+            self.emit(indent + 1, f"errors.append(f\"{path}: {{_short({var})}} is not a valid {fmt}\")")
+
+        required = schema.get("required")
+        properties = schema.get("properties")
+        required = required if isinstance(required, list) else []
+        properties = properties if isinstance(properties, dict) else {}
+        if required or properties:
+            guard_start = len(self.lines)
+            inner = indent
+            if types != ["object"]:
+                self.emit(indent, f"if isinstance({var}, dict):")
+                inner += 1
+            for key in required:
+                key_const = self._const(key, "K")
+                self.emit(inner, f"if {key_const} not in {var}:")
+                self.emit(inner + 1, f"errors.append(f\"{path}: required property {{{key_const}!r}} is missing\")")
+            for key, subschema in properties.items():
+                key_const = self._const(key, "K")
+                child = self._name("v")
+                body_start = len(self.lines)
+                self.emit(inner, f"{child} = {var}.get({key_const}, _MISSING)")
+                self.emit(inner, f"if {child} is not _MISSING:")
+                self.node(subschema, child, f"{path}.{{{key_const}}}", inner + 1)
+                if len(self.lines) == body_start + 2:
+                    del self.lines[body_start:]
+            if len(self.lines) == guard_start + (inner - indent):
+                del self.lines[guard_start:]
+
+        items = schema.get("items")
+        if isinstance(items, dict):
+            index = self._name("i")
+            child = self._name("v")
+            body_start = len(self.lines)
+            inner = indent
+            if types != ["array"]:
+                self.emit(indent, f"if isinstance({var}, list):")
+                inner += 1
+            self.emit(inner, f"for {index}, {child} in enumerate({var}):")
+            loop_header = len(self.lines)
+            self.node(items, child, f"{path}[{{{index}}}]", inner + 1)
+            if len(self.lines) == loop_header:
+                del self.lines[body_start:]
+
+        if else_line is not None and len(self.lines) == else_line:
+            self.lines.pop()
+        if nullable and len(self.lines) == start + 1:
+            self.lines.pop()
+
+    def build(self, schema: Any) -> Validator:
+        self.emit(1, "def validate(data):")
+        self.emit(2, "errors = []")
+        self.node(schema, "data", "$", 2)
+        self.emit(2, "return errors")
+        self.emit(1, "return validate")
+        # Константы и встроенные функции передаются в фабрику и видны в validate
+        # как переменные замыкания — это быстрее поиска в globals/builtins
+        self.namespace.update(_BUILTINS)
+        self.namespace["_MISSING"] = object()
+        names = sorted(self.namespace)
+        source = "\n".join([f"def factory({', '.join(names)}):"] + self.lines)
+        scope: Dict[str, Any] = {}
+        exec(compile(source, "<compiled-schema>", "exec"), scope)
+        validate = scope["factory"](**self.namespace)
+        validate.source = source
+        return validate
+
+
+def _short_repr(value: Any, limit: int = 60) -> str:
+    text = repr(value)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def schema_hash(schema: Any) -> str:
+    raw = json.dumps(schema, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+_by_id: Dict[int, Tuple[Any, Validator]] = {}
+_by_hash: Dict[str, Validator] = {}
+_lock = threading.Lock()
+
+
+def compile_schema(schema: Any) -> Validator:
+    """
+    Скомпилированный валидатор для schema: validator(data) -> список ошибок.
+    Повторный вызов с тем же объектом схемы (константа модуля теста) не считает даже хэш.
+    """
+    cached = _by_id.get(id(schema))
+    if cached is not None and cached[0] is schema:
+        return cached[1]
+
+    key = schema_hash(schema)
+    with _lock:
+        validator = _by_hash.get(key)
+        if validator is None:
+            validator = _Compiler().build(schema)
+            _by_hash[key] = validator
+        # Храним ссылку на схему, чтобы id не был переиспользован другим объектом
+        _by_id[id(schema)] = (schema, validator)
+    return validator
+
+
+def validate(data: Any, schema: Any) -> List[str]:
+    """Все ошибки валидации data против schema (пустой список — данные валидны)."""
+    return compile_schema(schema)(data)
+
+
+# --- Потоковая валидация массивов ---
+
+_WHITESPACE_RE = re.compile(r"[ \t\r\n]*")
+
+
+class StreamFormatError(ValueError):
+    """Тело ответа не является JSON-массивом."""
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """
+    Лениво разбирает JSON-массив верхнего уровня из потока байтовых чанков
+    (например, response.iter_content()) и отдаёт элементы по одному.
+    В памяти держится только текущий (ещё не разобранный) хвост потока.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+    pos = 0
+    exhausted = False
+    started = False
+    # Повторный разбор незавершённого элемента — только когда буфер заметно вырос
+    retry_at = 0
+
+    def fill() -> bool:
+        nonlocal buffer, pos, exhausted
+        if exhausted:
+            return False
+        chunk = next(chunks, None)
+        if chunk is None:
+            buffer = buffer[pos:] + utf8.decode(b"", final=True)
+            exhausted = True
+        else:
+            buffer = buffer[pos:] + utf8.decode(chunk)
+        pos = 0
+        return True
+
+    def skip_ws() -> bool:
+        """Пропускает пробелы; False, если поток закончился."""
+        nonlocal pos
+        while True:
+            pos = _WHITESPACE_RE.match(buffer, pos).end()
+            if pos < len(buffer):
+                return True
+            if not fill():
+                return False
+
+    if not skip_ws() or buffer[pos] != "[":
+        raise StreamFormatError("response body is not a JSON array")
+    pos += 1
+    expect_value = True
+
+    while True:
+        if not skip_ws():
+            raise StreamFormatError("unexpected end of JSON array")
+        char = buffer[pos]
+        if char == "]":
+            if started and expect_value:
+                raise StreamFormatError("trailing comma in JSON array")
+            pos += 1
+            if skip_ws():
+                raise StreamFormatError("extra data after JSON array")
+            return
+        if not expect_value:
+            if char != ",":
+                raise StreamFormatError(f"expected ',' or ']' at offset {pos}")
+            pos += 1
+            expect_value = True
+            continue
+
+        # Элемент принимается, только если за ним в буфере уже есть разделитель:
+        # иначе "12" или "0" могли быть началом "123" или "0.5"
+        if not exhausted and len(buffer) - pos < retry_at:
+            fill()
+            continue
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+            tail = _WHITESPACE_RE.match(buffer, end).end()
+            if not exhausted and (tail == len(buffer) or buffer[tail] not in ",]"):
+                raise json.JSONDecodeError("incomplete", buffer, pos)
+        except json.JSONDecodeError:
+            if exhausted:
+                raise StreamFormatError(f"invalid JSON array element at offset {pos}")
+            fill()
+            # Порог — от размера буфера после дочитывания: растёт геометрически,
+            # поэтому повторных разборов O(log n) и элемент отдаётся сразу после конца
+            retry_at = (len(buffer) - pos) * 2
+            continue
+
+        retry_at = 0
+        pos = end
+        started = True
+        expect_value = False
+        yield value
+
+
+def validate_array_stream(chunks: Iterable[bytes], schema: Any, fail_fast: bool = False) -> Tuple[int, List[str]]:
+    """
+    Потоково валидирует JSON-массив: каждый элемент проверяется против
+    schema['items'] (или schema, если это схема элемента) сразу после разбора.
+    Возвращает (число элементов, ошибки). При fail_fast чтение прекращается
+    на первом невалидном элементе.
+    """
+    if isinstance(schema, dict) and schema.get("type") == "array":
+        item_validator = compile_schema(schema.get("items") or {})
+    else:
+        item_validator = compile_schema(schema)
+
+    count = 0
+    errors: List[str] = []
+    for index, item in enumerate(iter_json_array(chunks)):
+        count += 1
+        item_errors = item_validator(item)
+        if item_errors:
+            errors.extend(f"$[{index}]{error[1:]}" for error in item_errors)
+            if fail_fast:
+                break
+    return count, errors
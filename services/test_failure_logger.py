@@ -1,12 +1,16 @@
 """
 Pytest plugin для логирования непройденных тестов.
+Помимо текстового лога, каждое падение пишется в общий JSONL журнал результатов.
 """
 
 import logging
+import sys
 from datetime import datetime
 from pathlib import Path
 import pytest
 
+from services.test_pass_logger import get_journal, journal_record
+
 
 class TestLoggingConfig:
     """Конфигурация логирования тестов."""
@@ -60,4 +64,12 @@ def pytest_runtest_makereport(item, call):
         traceback = getattr(report, 'longreprtext', '')
         stage = report.when.upper()  # CALL, SETUP, TEARDOWN
         message = f"{stage} FAILED: {test_name} in {test_file}\n{traceback}"
-        _failure_logger.error(message)
\ No newline at end of file
+        _failure_logger.error(message)
+
+    if report.failed:
+        journal = get_journal(item.config)
+        if journal is not None:
+            try:
+                journal.append(journal_record(item, report, longrepr=getattr(report, 'longreprtext', '')))
+            except Exception as e:
+                sys.stderr.write(f"[failed-tests-log] failed to write journal: {e}\n")
\ No newline at end of file
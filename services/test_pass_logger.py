@@ -1,55 +1,100 @@
-"""Минимальный pytest плагин: сохраняет прошедшие тесты в один JSON файл (массив).
+"""Минимальный pytest плагин: журнал результатов тестов в JSONL и пропуск прошедших при --resume.
 
 Поведение:
-    - Без опций командной строки
-    - Путь фиксированный: logs/passed_tests.json
-    - Формат файла: JSON массив объектов
-    - Перед каждым прогоном файл очищается (перезаписывается пустым массивом [])
-    - Запись на диск выполняется один раз в конце сессии
+    - Путь фиксированный: logs/results.jsonl (см. services/results_journal.py)
+    - Формат файла: одна JSON запись на строку; пишутся passed тесты,
+      упавшие тесты добавляет test_failure_logger
+    - Без --resume журнал очищается в начале прогона (только в главном процессе xdist)
+    - Запись — дозапись буфером с периодическим fsync, без перечитывания файла
+    - При --resume индекс nodeid прошедших тестов загружается один раз, и прошедшие
+      тесты снимаются с выполнения еще на этапе коллекции (до создания фикстур)
 """
 
-from pathlib import Path
-import json
+import os
 import sys
+import time
 import pytest
 from _pytest.reports import TestReport
 
-DEFAULT_PASSED_FILE = Path("logs/passed_tests.json")
-_passed_records: list[dict] = []
-_already_passed_cache: set[str] | None = None
+from services.results_journal import DEFAULT_JOURNAL_FILE, ResultsJournal, load_passed_index
+
+_already_passed_cache: set[str] = set()
+
+
+def get_journal(config):
+    """Общий журнал результатов сессии (None, если открыть не удалось)."""
+    return getattr(config, "_results_journal", None)
+
+
+def journal_record(item: pytest.Item, report: TestReport, **extra) -> dict:
+    record = {
+        "test_name": item.name,
+        "nodeid": item.nodeid,
+        "file": str(item.fspath),
+        "outcome": report.outcome,
+        "when": report.when,
+        "duration": round(report.duration, 6),
+        "time": time.time(),
+        "worker": os.environ.get("PYTEST_XDIST_WORKER", "master"),
+    }
+    record.update(extra)
+    return record
 
 
 def pytest_configure(config):
-    """Инициализация плагина: создаем директорию и очищаем файл."""
-    DEFAULT_PASSED_FILE.parent.mkdir(parents=True, exist_ok=True)
-    
-    # Очищаем файл только если НЕ указан --resume
+    """Инициализация плагина: открываем журнал и загружаем индекс для --resume."""
+    global _already_passed_cache
+
     resume_enabled = getattr(config, 'resume_enabled', False)
-    if not resume_enabled:
-        try:
-            DEFAULT_PASSED_FILE.write_text("[]", encoding="utf-8")
-        except Exception as e:
-            sys.stderr.write(f"[passed-tests-log] failed to init JSON file: {e}\n")
+    is_worker = hasattr(config, "workerinput")
 
+    if resume_enabled:
+        _already_passed_cache = load_passed_index()
 
-def pytest_runtest_setup(item: pytest.Item):
-    """Пропускаем тест, если он уже passed ранее."""
-    global _already_passed_cache
-    
-    # Ленивая загрузка кеша один раз для всей сессии
-    if _already_passed_cache is None:
-        try:
-            if DEFAULT_PASSED_FILE.exists():
-                with DEFAULT_PASSED_FILE.open("r", encoding="utf-8") as f:
-                    passed_tests = json.load(f)
-                _already_passed_cache = {x["nodeid"] for x in passed_tests}
-            else:
-                _already_passed_cache = set()
-        except Exception:
-            _already_passed_cache = set()
-    
-    if item.nodeid in _already_passed_cache:
-        pytest.skip(f"Already passed: {item.nodeid}")
+    try:
+        # Очищаем журнал только если НЕ указан --resume
+        config._results_journal = ResultsJournal(
+            DEFAULT_JOURNAL_FILE,
+            truncate=not resume_enabled and not is_worker,
+        )
+    except Exception as e:
+        sys.stderr.write(f"[passed-tests-log] failed to open journal: {e}\n")
+        config._results_journal = None
+
+
+def pytest_unconfigure(config):
+    journal = get_journal(config)
+    if journal is not None:
+        journal.close()
+
+
+def pytest_collection_modifyitems(session, config, items):
+    """
+    Снимаем (deselect) уже прошедшие тесты до выполнения: для модулей, где все
+    тесты прошли, не создаются туннели, не выполняется логин и т.п.
+    """
+    if not _already_passed_cache:
+        return
+
+    remaining = []
+    deselected = []
+    for item in items:
+        (deselected if item.nodeid in _already_passed_cache else remaining).append(item)
+    if not deselected:
+        return
+
+    remaining_modules = {item.nodeid.split("::", 1)[0] for item in remaining}
+    pruned_modules = {item.nodeid.split("::", 1)[0] for item in deselected} - remaining_modules
+
+    config.hook.pytest_deselected(items=deselected)
+    items[:] = remaining
+
+    reporter = config.pluginmanager.get_plugin("terminalreporter")
+    if reporter is not None and not hasattr(config, "workerinput"):
+        reporter.write_line(
+            f"[resume] already passed: {len(deselected)} tests deselected, "
+            f"{len(pruned_modules)} modules pruned entirely"
+        )
 
 
 @pytest.hookimpl(tryfirst=True, hookwrapper=True)
@@ -57,37 +102,19 @@ def pytest_runtest_makereport(item: pytest.Item, call):
     """Записываем прошедшие тесты."""
     outcome = yield
     report: TestReport = outcome.get_result()
-    
+
     if report.when == "call" and report.outcome == "passed":
-        record = {
-            "test_name": item.name,
-            "nodeid": item.nodeid,
-            "file": str(item.fspath),
-            "outcome": report.outcome,
-        }
-        _passed_records.append(record)
-        resume_enabled = getattr(item.config, 'resume_enabled', False)
+        journal = get_journal(item.config)
+        if journal is None:
+            return
         try:
-            if resume_enabled:
-                if DEFAULT_PASSED_FILE.exists():
-                    with DEFAULT_PASSED_FILE.open("r", encoding="utf-8") as f:
-                        old_records = json.load(f)
-                else:
-                    old_records = []
-                all_records = old_records + [record]
-                DEFAULT_PASSED_FILE.write_text(
-                    json.dumps(all_records, ensure_ascii=False, indent=2),
-                    encoding="utf-8"
-                )
-            else:
-                DEFAULT_PASSED_FILE.write_text(
-                    json.dumps(_passed_records, ensure_ascii=False, indent=2),
-                    encoding="utf-8"
-                )
+            journal.append(journal_record(item, report))
         except Exception as e:
-            sys.stderr.write(f"[passed-tests-log] failed to write JSON: {e}\n")
+            sys.stderr.write(f"[passed-tests-log] failed to write journal: {e}\n")
 
 
 def pytest_sessionfinish(session, exitstatus):
-    """Сохраняем все прошедшие тесты в JSON файл."""
-    pass
\ No newline at end of file
+    """Сбрасываем буфер журнала на диск."""
+    journal = get_journal(session.config)
+    if journal is not None:
+        journal.flush(fsync=True)
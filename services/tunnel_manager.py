@@ -1,66 +1,279 @@
 """
 Упрощённый менеджер SSH-туннелей для проброса портов.
 Только базовые функции: создать/закрыть туннель, проверить порт.
+
+Туннели общие для всех процессов pytest на машине (pytest-xdist воркеры):
+реестр в каталоге TunnelBroker хранит для каждого туннеля PID ssh и список
+процессов-пользователей. Первый процесс создаёт туннель, остальные
+подключаются к нему, последний закрывает.
+
+В режиме multiplex все пробросы идут через одно мастер-соединение
+(ControlMaster): туннель — это `ssh -O forward` к управляющему сокету,
+без нового SSH-рукопожатия.
 """
+import contextlib
+import functools
+import json
 import subprocess
 import socket
 import logging
 import platform
 import os
+import signal
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
 IS_WINDOWS = platform.system() == "Windows"
 IS_UNIX = not IS_WINDOWS
 
+# Ожидание готовности проброса: частый опрос порта вместо фиксированных пауз
+READY_TIMEOUT = 10.0
+POLL_INTERVAL = 0.02
+MAX_POLL_INTERVAL = 0.2
+MASTER_KEY = "master"
+
+
+@functools.lru_cache(maxsize=None)
+def find_ssh_executable():
+    """Путь к SSH клиенту (определяется один раз на процесс)."""
+    candidates = [
+        'ssh',
+        'C:\\Windows\\System32\\OpenSSH\\ssh.exe',
+        'C:\\Program Files\\Git\\usr\\bin\\ssh.exe',
+        'C:\\Program Files (x86)\\Git\\usr\\bin\\ssh.exe',
+        '/usr/bin/ssh',
+        '/usr/local/bin/ssh',
+    ]
+    for path in candidates:
+        try:
+            result = subprocess.run([path, '-V'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=5)
+            if result.returncode == 0 or b'OpenSSH' in result.stderr:
+                return path
+        except Exception:
+            continue
+    return None
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class TunnelBroker:
+    """
+    Межпроцессный реестр туннелей: <dir>/<tunnel_key>.json под flock <tunnel_key>.lock.
+    Запись: {"pid": PID ssh, "holders": [PID процессов, использующих туннель]}.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @contextlib.contextmanager
+    def locked(self, tunnel_key: str):
+        """Эксклюзивная блокировка записи туннеля (ждёт другие процессы)."""
+        with open(os.path.join(self.directory, f"{tunnel_key}.lock"), "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _path(self, tunnel_key: str) -> str:
+        return os.path.join(self.directory, f"{tunnel_key}.json")
+
+    def read(self, tunnel_key: str):
+        """Запись туннеля с отброшенными завершившимися процессами или None."""
+        try:
+            with open(self._path(tunnel_key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        entry["holders"] = [pid for pid in entry.get("holders", []) if _pid_alive(pid)]
+        return entry
+
+    def write(self, tunnel_key: str, entry) -> None:
+        tmp_path = f"{self._path(tunnel_key)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._path(tunnel_key))
+
+    def remove(self, tunnel_key: str) -> None:
+        with contextlib.suppress(OSError):
+            os.remove(self._path(tunnel_key))
+
+
 class SSHTunnelManager:
-    def __init__(self, mirada_host: str, username: str = "codemaster"):
+    def __init__(self, mirada_host: str, username: str = "codemaster", broker_dir: str = None,
+                 multiplex: bool = False):
         self.mirada_host = mirada_host
         self.username = username
+        # tunnel_key -> PID ssh-процесса (своего, чужого или мастер-соединения)
         self.tunnels = {}
+        # Процессы ssh, запущенные этим процессом
+        self._procs = {}
+        self.broker = None
+        if fcntl is not None:
+            broker_dir = broker_dir or os.path.join(
+                tempfile.gettempdir(), f"qa_tunnels_{username}@{mirada_host}"
+            )
+            self.broker = TunnelBroker(broker_dir)
+        # ControlMaster доступен только в OpenSSH на Unix и требует общий реестр
+        self.multiplex = multiplex and IS_UNIX and self.broker is not None
+        self._master_pid = None
+        # Время, потраченное на подъём туннелей (для отчёта о старте сессии)
+        self.stats = {"created": 0, "attached": 0, "failed": 0, "setup_seconds": 0.0}
+
+    @property
+    def control_path(self) -> str:
+        return os.path.join(self.broker.directory, "master.sock")
+
+    @property
+    def _target(self) -> str:
+        return f"{self.username}@{self.mirada_host}"
 
     def _test_agent_health(self, local_port: int) -> bool:
         """Проверяет доступность агента по локальному порту."""
         return self._is_port_available(local_port)
 
-    def _is_port_available(self, port: int) -> bool:
+    def _is_port_available(self, port: int, timeout: float = 1) -> bool:
         """True если порт занят (туннель работает)."""
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(1)
+                s.settimeout(timeout)
                 return s.connect_ex(('127.0.0.1', port)) == 0
         except Exception:
             return False
 
     def _get_ssh_executable(self):
         """Возвращает путь к SSH клиенту."""
-        candidates = [
-            'ssh',
-            'C:\\Windows\\System32\\OpenSSH\\ssh.exe',
-            'C:\\Program Files\\Git\\usr\\bin\\ssh.exe',
-            'C:\\Program Files (x86)\\Git\\usr\\bin\\ssh.exe',
-            '/usr/bin/ssh',
-            '/usr/local/bin/ssh',
+        return find_ssh_executable()
+
+    def _ssh_options(self):
+        options = [
+            "-o", "BatchMode=yes",
+            "-o", "StrictHostKeyChecking=no",
+            # ssh завершится сразу, если порт занят или проброс не удался
+            "-o", "ExitOnForwardFailure=yes",
         ]
-        for path in candidates:
-            try:
-                result = subprocess.run([path, '-V'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=5)
-                if result.returncode == 0 or b'OpenSSH' in result.stderr:
-                    return path
-            except Exception:
-                continue
-        return None
+        if IS_WINDOWS:
+            options += ["-o", "UserKnownHostsFile=NUL"]
+        else:
+            options += ["-o", "UserKnownHostsFile=/dev/null"]
+        return options
+
+    def _spawn(self, ssh_cmd):
+        popen_kwargs = {
+            'stdout': subprocess.DEVNULL,
+            'stderr': subprocess.DEVNULL,
+            'stdin': subprocess.DEVNULL,
+        }
+        if IS_UNIX and hasattr(os, 'setsid'):
+            popen_kwargs['preexec_fn'] = os.setsid
+        elif IS_WINDOWS:
+            popen_kwargs['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP
+        return subprocess.Popen(ssh_cmd, **popen_kwargs)
+
+    def _wait_until(self, ready, proc=None, timeout: float = READY_TIMEOUT) -> bool:
+        """Опрашивает ready() с нарастающим интервалом; False, если proc завершился или вышло время."""
+        deadline = time.monotonic() + timeout
+        interval = POLL_INTERVAL
+        while True:
+            if ready():
+                return True
+            if proc is not None and proc.poll() is not None:
+                return False
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(interval)
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+    def _wait_for_port(self, local_port: int, proc=None) -> bool:
+        return self._wait_until(lambda: self._is_port_available(local_port, timeout=0.2), proc)
 
     def create_tunnel(self, service_name: str, local_port: int, remote_port: int, remote_host: str = "127.0.0.1") -> bool:
-        """Создаёт SSH-туннель."""
+        """Создаёт SSH-туннель или подключается к уже созданному другим процессом."""
+        started = time.monotonic()
+        try:
+            ok = self._create_tunnel(service_name, local_port, remote_port, remote_host)
+        finally:
+            self.stats["setup_seconds"] += time.monotonic() - started
+        if not ok:
+            self.stats["failed"] += 1
+        return ok
+
+    def _create_tunnel(self, service_name: str, local_port: int, remote_port: int, remote_host: str) -> bool:
         tunnel_key = f"{service_name}_{local_port}"
-        if tunnel_key in self.tunnels:
-            proc = self.tunnels[tunnel_key]
+        if self.broker is None:
+            ok = self._ensure_own_tunnel(tunnel_key, local_port, remote_port, remote_host)
+            if ok:
+                self.stats["created"] += 1
+            return ok
+
+        if self.multiplex and not self._ensure_master():
+            return False
+
+        with self.broker.locked(tunnel_key):
+            entry = self.broker.read(tunnel_key)
+            if entry and _pid_alive(entry["pid"]) and self._is_port_available(local_port):
+                if os.getpid() not in entry["holders"]:
+                    entry["holders"].append(os.getpid())
+                    self.broker.write(tunnel_key, entry)
+                self.tunnels[tunnel_key] = entry["pid"]
+                self.stats["attached"] += 1
+                logger.info(f"Tunnel {tunnel_key} attached (PID: {entry['pid']}, holders: {len(entry['holders'])})")
+                return True
+
+            # Записи нет или туннель умер — поднимаем заново
+            if entry and _pid_alive(entry["pid"]) and not entry.get("mux"):
+                self._terminate(entry["pid"])
+            if self.multiplex:
+                ok = self._add_forward(tunnel_key, local_port, remote_port, remote_host)
+            else:
+                ok = self._ensure_own_tunnel(tunnel_key, local_port, remote_port, remote_host)
+            if not ok:
+                self.broker.remove(tunnel_key)
+                return False
+            holders = (entry or {}).get("holders", [])
+            if os.getpid() not in holders:
+                holders.append(os.getpid())
+            self.broker.write(tunnel_key, {
+                "pid": self.tunnels[tunnel_key],
+                "holders": holders,
+                "mux": self.multiplex,
+                "forward": self._forward_spec(local_port, remote_port, remote_host),
+            })
+            self.stats["created"] += 1
+            return True
+
+    @staticmethod
+    def _forward_spec(local_port: int, remote_port: int, remote_host: str) -> str:
+        return f"127.0.0.1:{local_port}:{remote_host}:{remote_port}"
+
+    def _ensure_own_tunnel(self, tunnel_key: str, local_port: int, remote_port: int, remote_host: str) -> bool:
+        """Запускает отдельный ssh этого процесса (без мастер-соединения)."""
+        if tunnel_key in self._procs:
+            proc = self._procs[tunnel_key]
             if proc.poll() is None:
                 logger.info(f"Tunnel {tunnel_key} already running")
                 return True
             else:
-                del self.tunnels[tunnel_key]
+                del self._procs[tunnel_key]
+                self.tunnels.pop(tunnel_key, None)
 
         ssh_exe = self._get_ssh_executable()
         if not ssh_exe:
@@ -70,56 +283,165 @@ class SSHTunnelManager:
         ssh_cmd = [
             ssh_exe,
             "-N",
-            "-L", f"127.0.0.1:{local_port}:{remote_host}:{remote_port}",
-            "-o", "BatchMode=yes",
-            "-o", "StrictHostKeyChecking=no",
-            f"{self.username}@{self.mirada_host}"
+            "-L", self._forward_spec(local_port, remote_port, remote_host),
+            *self._ssh_options(),
+            self._target,
         ]
-        if IS_WINDOWS:
-            ssh_cmd += ["-o", "UserKnownHostsFile=NUL"]
-        else:
-            ssh_cmd += ["-o", "UserKnownHostsFile=/dev/null"]
-
-        popen_kwargs = {
-            'stdout': subprocess.PIPE,
-            'stderr': subprocess.PIPE,
-            'stdin': subprocess.PIPE,
-        }
-        if IS_UNIX and hasattr(os, 'setsid'):
-            popen_kwargs['preexec_fn'] = os.setsid
-        elif IS_WINDOWS:
-            popen_kwargs['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP
 
         try:
-            proc = subprocess.Popen(ssh_cmd, **popen_kwargs)
-            for _ in range(5):
-                if proc.poll() is None and self._is_port_available(local_port):
-                    self.tunnels[tunnel_key] = proc
-                    logger.info(f"Tunnel {tunnel_key} created (PID: {proc.pid})")
-                    return True
-                else:
-                    logger.info(f"Waiting for tunnel {tunnel_key}...")
-                    import time; time.sleep(2)
-            proc.terminate()
-            logger.error(f"Tunnel {tunnel_key} failed to start.")
+            proc = self._spawn(ssh_cmd)
+            if self._wait_for_port(local_port, proc):
+                self._procs[tunnel_key] = proc
+                self.tunnels[tunnel_key] = proc.pid
+                logger.info(f"Tunnel {tunnel_key} created (PID: {proc.pid})")
+                return True
+            if proc.poll() is None:
+                proc.terminate()
+            logger.error(f"Tunnel {tunnel_key} failed to start (exit code: {proc.poll()}).")
             return False
         except Exception as e:
             logger.error(f"Error creating tunnel: {e}")
             return False
 
+    # --- ControlMaster ---
+
+    def _control(self, *args) -> bool:
+        """Команда управляющему сокету мастер-соединения (ssh -O ...)."""
+        try:
+            result = subprocess.run(
+                [self._get_ssh_executable(), "-S", self.control_path, *args, self._target],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL, timeout=10,
+            )
+            return result.returncode == 0
+        except Exception as e:
+            logger.error(f"SSH control command {args} failed: {e}")
+            return False
+
+    def _ensure_master(self) -> bool:
+        """Поднимает (или подключается к) общему мастер-соединению."""
+        if self._master_pid is not None and _pid_alive(self._master_pid):
+            return True
+        if not self._get_ssh_executable():
+            logger.error("SSH client not found.")
+            return False
+
+        with self.broker.locked(MASTER_KEY):
+            entry = self.broker.read(MASTER_KEY)
+            if entry and _pid_alive(entry["pid"]) and self._control("-O", "check"):
+                pid = entry["pid"]
+                holders = entry["holders"]
+                logger.info(f"SSH master attached (PID: {pid})")
+            else:
+                if entry and _pid_alive(entry["pid"]):
+                    self._terminate(entry["pid"])
+                with contextlib.suppress(OSError):
+                    os.remove(self.control_path)
+                proc = self._spawn([
+                    self._get_ssh_executable(),
+                    "-M", "-S", self.control_path,
+                    "-N",
+                    "-o", "ControlPersist=no",
+                    *self._ssh_options(),
+                    self._target,
+                ])
+                if not self._wait_until(lambda: self._control("-O", "check"), proc):
+                    if proc.poll() is None:
+                        proc.terminate()
+                    logger.error(f"SSH master connection to {self.mirada_host} failed (exit code: {proc.poll()}).")
+                    self.broker.remove(MASTER_KEY)
+                    return False
+                self._procs[MASTER_KEY] = proc
+                pid = proc.pid
+                holders = []
+                logger.info(f"SSH master created (PID: {pid})")
+            if os.getpid() not in holders:
+                holders.append(os.getpid())
+            self.broker.write(MASTER_KEY, {"pid": pid, "holders": holders})
+            self._master_pid = pid
+            return True
+
+    def _add_forward(self, tunnel_key: str, local_port: int, remote_port: int, remote_host: str) -> bool:
+        spec = self._forward_spec(local_port, remote_port, remote_host)
+        if not self._control("-O", "forward", "-L", spec):
+            logger.error(f"Tunnel {tunnel_key}: forward {spec} rejected by SSH master.")
+            return False
+        if not self._wait_for_port(local_port):
+            self._control("-O", "cancel", "-L", spec)
+            logger.error(f"Tunnel {tunnel_key} failed to start.")
+            return False
+        self.tunnels[tunnel_key] = self._master_pid
+        logger.info(f"Tunnel {tunnel_key} forwarded via SSH master (PID: {self._master_pid})")
+        return True
+
+    def _release_master(self) -> None:
+        """Отключается от мастер-соединения; последний пользователь его закрывает."""
+        if self._master_pid is None:
+            return
+        pid, self._master_pid = self._master_pid, None
+        proc = self._procs.pop(MASTER_KEY, None)
+        with self.broker.locked(MASTER_KEY):
+            entry = self.broker.read(MASTER_KEY)
+            holders = [h for h in (entry or {}).get("holders", []) if h != os.getpid()]
+            if entry and entry["pid"] == pid and holders:
+                self.broker.write(MASTER_KEY, {"pid": pid, "holders": holders})
+                return
+            if not self._control("-O", "exit"):
+                self._terminate(pid)
+            if proc is not None:
+                with contextlib.suppress(subprocess.TimeoutExpired):
+                    proc.wait(timeout=5)
+            if entry and entry["pid"] == pid:
+                self.broker.remove(MASTER_KEY)
+        logger.info("SSH master closed.")
+
+    def _terminate(self, pid: int) -> None:
+        """Завершает ssh-процесс (с его группой, если он запущен через setsid)."""
+        try:
+            if IS_UNIX and hasattr(os, 'killpg') and os.getpgid(pid) == pid:
+                os.killpg(pid, signal.SIGTERM)
+            else:
+                os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+
     def close_tunnel(self, service_name: str, local_port: int) -> bool:
-        """Закрывает SSH-туннель."""
+        """Отключается от SSH-туннеля; последний пользователь его закрывает."""
         tunnel_key = f"{service_name}_{local_port}"
         if tunnel_key not in self.tunnels:
             logger.info(f"Tunnel {tunnel_key} not found.")
             return True
-        proc = self.tunnels[tunnel_key]
+        pid = self.tunnels.pop(tunnel_key)
+        proc = self._procs.pop(tunnel_key, None)
         try:
-            if proc.poll() is None:
-                proc.terminate()
-            del self.tunnels[tunnel_key]
+            if self.broker is None:
+                if proc is not None and proc.poll() is None:
+                    proc.terminate()
+                logger.info(f"Tunnel {tunnel_key} closed.")
+                return True
+
+            with self.broker.locked(tunnel_key):
+                entry = self.broker.read(tunnel_key)
+                holders = [h for h in (entry or {}).get("holders", []) if h != os.getpid()]
+                if entry and entry["pid"] == pid and holders:
+                    self.broker.write(tunnel_key, {**entry, "holders": holders})
+                    logger.info(f"Tunnel {tunnel_key} released ({len(holders)} holders left).")
+                    return True
+                if entry and entry.get("mux"):
+                    # Проброс мастер-соединения: снимаем только его
+                    self._control("-O", "cancel", "-L", entry["forward"])
+                else:
+                    self._terminate(pid)
+                    if proc is not None:
+                        # Свой процесс: дожидаемся, чтобы не оставить зомби
+                        with contextlib.suppress(subprocess.TimeoutExpired):
+                            proc.wait(timeout=5)
+                if entry and entry["pid"] == pid:
+                    self.broker.remove(tunnel_key)
             logger.info(f"Tunnel {tunnel_key} closed.")
             return True
         except Exception as e:
             logger.error(f"Error closing tunnel: {e}")
             return False
+        finally:
+            if self.multiplex and not self.tunnels:
+                self._release_master()
@@ -0,0 +1,101 @@
+"""
+Манифест инкрементальной генерации тестов.
+
+Для каждого эндпоинта (`METHOD path`) хранит хэши всего, от чего зависит
+сгенерированный тест: объекта эндпоинта из swagger, найденного файла
+реализации, модулей промптов и итогового файла тестов. Если ничего из этого
+не изменилось — эндпоинт можно пропустить без обращения к модели.
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+MANIFEST_FILENAME = ".qa_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path: str) -> Optional[str]:
+    """Хэш содержимого файла или None, если файла нет."""
+    try:
+        with open(path, "rb") as f:
+            return hash_bytes(f.read())
+    except OSError:
+        return None
+
+
+def hash_endpoint(endpoint: Dict[str, Any]) -> str:
+    """Стабильный хэш endpoint-объекта из extract_endpoints_swagger2."""
+    raw = json.dumps(endpoint, ensure_ascii=False, sort_keys=True, default=str)
+    return hash_bytes(raw.encode("utf-8"))
+
+
+def prompt_versions(*modules) -> Dict[str, str]:
+    """Версии промптов — хэши исходников модулей prompts/* и модулей-генераторов utils/*."""
+    return {m.__name__: hash_file(m.__file__) for m in modules}
+
+
+def endpoint_key(endpoint: Dict[str, Any]) -> str:
+    return f"{endpoint['method']} {endpoint['path']}"
+
+
+class BuildManifest:
+    """Манифест одного сервиса: services/<svc>/.qa_manifest.json"""
+
+    def __init__(self, service_test_dir: str, prompts: Dict[str, str]):
+        self.path = os.path.join(service_test_dir, MANIFEST_FILENAME)
+        self.prompts = prompts
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data.get("endpoints", {})
+        except (OSError, ValueError):
+            pass
+
+    def is_up_to_date(self, endpoint: Dict[str, Any]) -> bool:
+        """True, если ни один из входов эндпоинта и его файл тестов не изменились."""
+        with self._lock:
+            entry = self.entries.get(endpoint_key(endpoint))
+        if not entry:
+            return False
+        if entry.get("endpoint_hash") != hash_endpoint(endpoint):
+            return False
+        if entry.get("prompts") != self.prompts:
+            return False
+        if hash_file(entry.get("implementation_file") or "") != entry.get("implementation_hash"):
+            return False
+        return hash_file(entry.get("test_file") or "") == entry.get("test_hash")
+
+    def record(self, endpoint: Dict[str, Any], implementation_file: str, test_file: str) -> None:
+        """Запоминает успешную генерацию и сразу сохраняет манифест на диск."""
+        test_hash = hash_file(test_file)
+        with self._lock:
+            self.entries[endpoint_key(endpoint)] = {
+                "endpoint_hash": hash_endpoint(endpoint),
+                "implementation_file": implementation_file,
+                "implementation_hash": hash_file(implementation_file),
+                "prompts": self.prompts,
+                "test_file": test_file,
+                "test_hash": test_hash,
+            }
+            # Другие методы того же пути пишут в этот же файл (слиянием),
+            # их тесты сохранены — обновляем и их хэш файла
+            for entry in self.entries.values():
+                if entry.get("test_file") == test_file:
+                    entry["test_hash"] = test_hash
+            self._save()
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "endpoints": self.entries}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
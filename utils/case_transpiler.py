@@ -0,0 +1,142 @@
+"""
+Преобразование JSON кейсов шага 7 в POSITIVE_CASES / NEGATIVE_CASES (шаг 8.3).
+
+Раньше это делала модель; преобразование механическое, поэтому выполняется кодом:
+    - type == "positive" / "negative" (без type — по expected_status < 400)
+    - data: body для POST/PUT/PATCH, query_params для остальных методов
+      (если нужного поля нет — другое, если нет обоих — {})
+    - headers кейса — маркер pytest.mark.request_headers(...), conftest добавляет
+      их к заголовкам запроса (в data они не попадают)
+    - query_params кейса с телом (POST/PUT/PATCH) — маркер pytest.mark.request_params(...),
+      conftest добавляет их к query запроса; body кейса без тела (GET и др.) не
+      передается — об этом возвращается предупреждение
+    - id: "TC-XXX_<title в snake_case латиницей>", уникальные в пределах модуля
+    - литералы через repr: null/true/false -> None/True/False, строки экранируются;
+      NaN/Infinity (json.loads их принимает) -> float('nan') / float('inf')
+"""
+import json
+import math
+import re
+from typing import Any, Dict, List, Tuple
+
+BODY_METHODS = ("POST", "PUT", "PATCH")
+MAX_ID_WORDS = 6
+
+_TRANSLIT = dict(zip(
+    "абвгдеёжзийклмнопрстуфхцчшщъыьэюя",
+    ["a", "b", "v", "g", "d", "e", "e", "zh", "z", "i", "y", "k", "l", "m", "n", "o", "p", "r", "s", "t",
+     "u", "f", "kh", "ts", "ch", "sh", "shch", "", "y", "", "e", "yu", "ya"],
+))
+_NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+
+class CasesFormatError(ValueError):
+    """Ответ шага 7 не является JSON массивом кейсов."""
+
+
+def parse_cases(text: str) -> List[Dict[str, Any]]:
+    """JSON массив кейсов из ответа модели (допускается текст вокруг массива)."""
+    try:
+        cases = json.loads(text)
+    except ValueError:
+        start, end = text.find("["), text.rfind("]")
+        if start == -1 or end <= start:
+            raise CasesFormatError("no JSON array in generated cases")
+        try:
+            cases = json.loads(text[start:end + 1])
+        except ValueError as e:
+            raise CasesFormatError(f"invalid JSON in generated cases: {e}")
+    if isinstance(cases, dict):
+        cases = cases.get("cases", cases.get("test_cases", [cases]))
+    if not isinstance(cases, list):
+        raise CasesFormatError("generated cases are not a JSON array")
+    return [case for case in cases if isinstance(case, dict)]
+
+
+def _slug(text: str) -> str:
+    text = "".join(_TRANSLIT.get(ch, ch) for ch in str(text).lower())
+    words = [w for w in _NON_WORD_RE.split(text) if w]
+    return "_".join(words[:MAX_ID_WORDS])
+
+
+def _status(value: Any) -> Any:
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    if isinstance(value, list):
+        return [_status(v) for v in value]
+    return value
+
+
+def case_type(case: Dict[str, Any]) -> str:
+    kind = str(case.get("type", "")).strip().lower()
+    if kind in ("positive", "negative"):
+        return kind
+    status = _status(case.get("expected_status"))
+    return "positive" if isinstance(status, int) and status < 400 else "negative"
+
+
+def case_data(case: Dict[str, Any], method: str) -> Any:
+    """Содержимое для json= (методы с телом) или params= (остальные)."""
+    body, query = case.get("body"), case.get("query_params")
+    primary, secondary = (body, query) if method.upper() in BODY_METHODS else (query, body)
+    if primary is not None:
+        return primary
+    return secondary if secondary is not None else {}
+
+
+def _literal(value: Any) -> str:
+    """repr, который всегда является корректным Python-выражением (repr(inf) — имя inf)."""
+    if isinstance(value, float) and not math.isfinite(value):
+        if math.isnan(value):
+            return "float('nan')"
+        return "float('inf')" if value > 0 else "float('-inf')"
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{_literal(k)}: {_literal(v)}" for k, v in value.items()) + "}"
+    if isinstance(value, list):
+        return "[" + ", ".join(_literal(v) for v in value) + "]"
+    if isinstance(value, tuple):
+        return "(" + "".join(f"{_literal(v)}, " for v in value).rstrip(" ") + ")"
+    return repr(value)
+
+
+def _param(case: Dict[str, Any], method: str, case_id: str) -> str:
+    args = [_literal(case_data(case, method)), _literal(_status(case.get("expected_status")))]
+    args.append(f"id={case_id!r}")
+    marks = []
+    headers = case.get("headers")
+    if isinstance(headers, dict) and headers:
+        marks.append(f"pytest.mark.request_headers({_literal(headers)})")
+    query = case.get("query_params")
+    if method.upper() in BODY_METHODS and case.get("body") is not None and isinstance(query, dict) and query:
+        marks.append(f"pytest.mark.request_params({_literal(query)})")
+    if marks:
+        args.append(f"marks={marks[0]}" if len(marks) == 1 else f"marks=[{', '.join(marks)}]")
+    return f"pytest.param({', '.join(args)})"
+
+
+def transpile_cases(cases: List[Dict[str, Any]], method: str) -> Tuple[str, str, List[str]]:
+    """
+    Код списков (POSITIVE_CASES, NEGATIVE_CASES) — значения без 'NAME = ' — и
+    предупреждения о данных кейсов, которые не попали в тест.
+    """
+    lists: Dict[str, List[str]] = {"positive": [], "negative": []}
+    warnings: List[str] = []
+    used_ids = set()
+    for index, case in enumerate(cases, 1):
+        base = str(case.get("id") or f"TC-{index:03d}").strip()
+        name = _slug(case.get("title") or case.get("description") or "")
+        case_id = f"{base}_{name}" if name else base
+        unique_id, suffix = case_id, 2
+        while unique_id in used_ids:
+            unique_id, suffix = f"{case_id}_{suffix}", suffix + 1
+        used_ids.add(unique_id)
+        if method.upper() not in BODY_METHODS and case.get("query_params") is not None and case.get("body") is not None:
+            warnings.append(f"{unique_id}: body ignored for {method.upper()} (query_params are sent)")
+        lists[case_type(case)].append(_param(case, method, unique_id))
+
+    def render(params: List[str]) -> str:
+        if not params:
+            return "[]"
+        return "[\n" + "".join(f"    {param},\n" for param in params) + "]"
+
+    return render(lists["positive"]), render(lists["negative"]), warnings
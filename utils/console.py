@@ -1,6 +1,11 @@
 """
 Утилиты для красивого вывода в консоль
 """
+import contextlib
+import contextvars
+import io
+import sys
+
 
 class Colors:
     """ANSI цвета для терминала"""
@@ -76,3 +81,58 @@ def print_model_response(text, max_length=100):
     else:
         preview = text
     print(f"  {Colors.WHITE}💬{Colors.RESET} {preview}")
+
+
+# --- Буферизация вывода для параллельной обработки ---
+
+_output_buffer = contextvars.ContextVar("output_buffer", default=None)
+
+
+class _ContextBufferedStream:
+    """
+    Обёртка над sys.stdout: если в текущем контексте активен буфер,
+    пишет в него, иначе — в исходный поток.
+    Контекст (а не поток) нужен, чтобы вывод из asyncio-задач и tools,
+    запущенных от имени эндпоинта, попадал в его же буфер.
+    """
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text):
+        buffer = _output_buffer.get()
+        if buffer is not None:
+            return buffer.write(text)
+        return self._stream.write(text)
+
+    def flush(self):
+        if _output_buffer.get() is None:
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def current_output_buffer():
+    """Возвращает буфер вывода текущего контекста (или None)"""
+    return _output_buffer.get()
+
+
+def use_output_buffer(buffer):
+    """Делает buffer активным в текущем контексте (для asyncio-задач)"""
+    _output_buffer.set(buffer)
+
+
+@contextlib.contextmanager
+def capture_output():
+    """
+    Перехватывает весь print() текущего контекста в io.StringIO.
+    Используется воркерами, чтобы лог каждого эндпоинта выводился целиком и по порядку.
+    """
+    if not isinstance(sys.stdout, _ContextBufferedStream):
+        sys.stdout = _ContextBufferedStream(sys.stdout)
+    buffer = io.StringIO()
+    token = _output_buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _output_buffer.reset(token)
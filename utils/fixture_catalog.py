@@ -0,0 +1,187 @@
+"""
+Каталог pytest-фикстур, доступных сгенерированным тестам.
+
+Строится разбором conftest.py через ast (без импорта и без модели): функции с
+декоратором @pytest.fixture / @fixture(...) — имя, scope, autouse, аргументы и
+первый абзац docstring. Модули из pytest_plugins разбираются так же (по пути
+относительно корня проекта). Результат по каждому файлу кешируется на диске
+рядом с conftest.py по (mtime, size) с перепроверкой sha256, поэтому повторный
+запуск не перечитывает неизменённые файлы.
+"""
+import ast
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+CATALOG_FILENAME = ".qa_fixture_catalog.json"
+CATALOG_VERSION = 1
+
+
+def _fixture_decorator(decorator: ast.expr) -> Optional[Dict[str, Any]]:
+    """Параметры декоратора фикстуры или None, если это не фикстура."""
+    call = decorator if isinstance(decorator, ast.Call) else None
+    target = call.func if call else decorator
+    name = target.attr if isinstance(target, ast.Attribute) else getattr(target, "id", None)
+    if name != "fixture":
+        return None
+    options = {"scope": "function", "autouse": False}
+    for keyword in call.keywords if call else []:
+        if keyword.arg in ("scope", "autouse", "name") and isinstance(keyword.value, ast.Constant):
+            options[keyword.arg] = keyword.value.value
+    return options
+
+
+def _signature(func: ast.FunctionDef) -> str:
+    args = [a.arg for a in func.args.posonlyargs + func.args.args]
+    if func.args.vararg:
+        args.append(f"*{func.args.vararg.arg}")
+    args.extend(a.arg for a in func.args.kwonlyargs)
+    if func.args.kwarg:
+        args.append(f"**{func.args.kwarg.arg}")
+    return f"({', '.join(args)})"
+
+
+def _summary(docstring: Optional[str]) -> str:
+    """Первый абзац docstring одной строкой."""
+    if not docstring:
+        return ""
+    paragraph = docstring.strip().split("\n\n", 1)[0]
+    return " ".join(line.strip() for line in paragraph.splitlines())
+
+
+def parse_fixtures(source: str) -> Dict[str, Any]:
+    """Фикстуры и pytest_plugins одного модуля."""
+    tree = ast.parse(source)
+    fixtures = []
+    plugins: List[str] = []
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+                isinstance(t, ast.Name) and t.id == "pytest_plugins" for t in node.targets):
+            value = node.value
+            if isinstance(value, ast.Constant) and isinstance(value.value, str):
+                plugins.append(value.value)
+            elif isinstance(value, (ast.List, ast.Tuple)):
+                plugins.extend(e.value for e in value.elts
+                               if isinstance(e, ast.Constant) and isinstance(e.value, str))
+            continue
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        for decorator in node.decorator_list:
+            options = _fixture_decorator(decorator)
+            if options is None:
+                continue
+            fixtures.append({
+                "name": options.get("name") or node.name,
+                "scope": options["scope"],
+                "autouse": bool(options["autouse"]),
+                "signature": _signature(node),
+                "doc": _summary(ast.get_docstring(node)),
+                "line": node.lineno,
+            })
+            break
+    return {"fixtures": fixtures, "plugins": plugins}
+
+
+def _plugin_path(module: str, root: str) -> Optional[str]:
+    base = os.path.join(root, *module.split("."))
+    for candidate in (f"{base}.py", os.path.join(base, "__init__.py")):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+class FixtureCatalog:
+    """Фикстуры conftest.py и его pytest_plugins с кешем разбора по файлам."""
+
+    def __init__(self, conftest_path: str, root: Optional[str] = None):
+        self.conftest_path = os.path.abspath(conftest_path)
+        self.root = os.path.abspath(root or os.path.dirname(os.path.dirname(self.conftest_path)))
+        self.cache_path = os.path.join(os.path.dirname(self.conftest_path), CATALOG_FILENAME)
+        self.reparsed = 0
+        # путь файла -> список фикстур (в порядке обхода: conftest, затем плагины)
+        self.files: Dict[str, List[Dict[str, Any]]] = {}
+
+        cached = self._load()
+        fresh: Dict[str, dict] = {}
+        pending = [self.conftest_path]
+        while pending:
+            path = pending.pop(0)
+            if path in fresh:
+                continue
+            entry = self._file_entry(path, cached.get(self._key(path)))
+            if entry is None:
+                continue
+            fresh[path] = entry
+            self.files[path] = entry["fixtures"]
+            for module in entry["plugins"]:
+                plugin_path = _plugin_path(module, self.root)
+                if plugin_path:
+                    pending.append(plugin_path)
+
+        stored = {self._key(path): entry for path, entry in fresh.items()}
+        if self.reparsed or stored.keys() != cached.keys():
+            self._save(stored)
+
+    def _key(self, path: str) -> str:
+        return os.path.relpath(path, self.root)
+
+    def _file_entry(self, path: str, entry: Optional[dict]) -> Optional[dict]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if entry and entry.get("mtime") == stat.st_mtime and entry.get("size") == stat.st_size:
+            return entry
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        digest = hashlib.sha256(data).hexdigest()
+        if entry and entry.get("sha256") == digest:
+            # Файл тронут (mtime), но содержимое то же — разбор не нужен
+            return dict(entry, mtime=stat.st_mtime, size=stat.st_size)
+        try:
+            parsed = parse_fixtures(data.decode("utf-8", errors="replace"))
+        except SyntaxError:
+            parsed = {"fixtures": [], "plugins": []}
+        self.reparsed += 1
+        return {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": digest, **parsed}
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == CATALOG_VERSION:
+                return data.get("files", {})
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def _save(self, files: Dict[str, dict]) -> None:
+        try:
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": CATALOG_VERSION, "files": files}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            pass
+
+    @property
+    def fixtures(self) -> List[Dict[str, Any]]:
+        """Все фикстуры; при совпадении имен — определение из conftest.py (как в pytest)."""
+        result: Dict[str, Dict[str, Any]] = {}
+        for path, fixtures in reversed(list(self.files.items())):
+            for fixture in fixtures:
+                result[fixture["name"]] = dict(fixture, file=self._key(path))
+        return sorted(result.values(), key=lambda f: (f["file"], f["line"]))
+
+    def render(self) -> str:
+        """Список фикстур для промпта шага 8.4 (формат прежнего ответа шага 8.2)."""
+        lines = ["ФИКСТУРЫ:"]
+        for fixture in self.fixtures:
+            flags = f"scope={fixture['scope']}" + (", autouse" if fixture["autouse"] else "")
+            doc = f": {fixture['doc']}" if fixture["doc"] else ""
+            lines.append(f"- {fixture['name']}{fixture['signature']} [{flags}]{doc}")
+        return "\n".join(lines)
@@ -0,0 +1,185 @@
+"""
+Персистентный кеш ответов модели.
+
+Все вызовы идут с temperature=0, поэтому одинаковые входные данные
+(модель, системный промпт, сообщение, история, use_tools и описания tools,
+настройки) дают одинаковый ответ. Ключ — sha256 от этих данных; значение — ответ
+и полный транскрипт сообщений (включая вызовы tools), сжатые zlib.
+
+Хранилище — SQLite с вытеснением по LRU при превышении лимита размера.
+При попадании read-only вызовы tools из транскрипта выполняются повторно:
+если, например, read_file вернул бы другое содержимое, запись считается
+устаревшей и модель вызывается заново. Вывод tools при перепроверке подавляется.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter, ToolCallPart, ToolReturnPart
+
+from tools.filesystem_processor import check_exists, list_directory, read_file
+from utils.console import capture_output
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".llm_cache", "responses.sqlite3")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Инструменты без побочных эффектов: их результат можно перепроверить при попадании.
+# Транскрипты с любыми другими инструментами (write_files и т.п.) не кешируются.
+READ_ONLY_TOOLS = {
+    "read_file": read_file,
+    "check_exists": check_exists,
+    "list_directory": list_directory,
+}
+# Выходной инструмент pydantic-ai (типизированный ответ): побочных эффектов нет,
+# перепроверять нечего
+OUTPUT_TOOLS = {"final_result"}
+
+
+def _strip_volatile(node: Any) -> Any:
+    """Убирает из сериализованных сообщений поля, меняющиеся от запуска к запуску."""
+    if isinstance(node, dict):
+        return {k: _strip_volatile(v) for k, v in node.items() if k not in ("timestamp", "tool_call_id")}
+    if isinstance(node, list):
+        return [_strip_volatile(x) for x in node]
+    return node
+
+
+def make_key(model: str, system_prompt: Optional[str], user_message: str, use_tools: bool,
+             history: Optional[List[ModelMessage]], model_settings: Optional[Dict[str, Any]],
+             output_schema: Optional[Dict[str, Any]] = None,
+             tools: Optional[List[Dict[str, Any]]] = None) -> str:
+    """
+    Стабильный хэш всех входных данных вызова. tools — определения инструментов
+    агента (имя, описание, JSON-схема аргументов): их изменение меняет ответ модели.
+    """
+    history_json = None
+    if history:
+        history_json = _strip_volatile(ModelMessagesTypeAdapter.dump_python(history, mode="json"))
+    payload = {
+        "model": model,
+        "system_prompt": system_prompt,
+        "user_message": user_message,
+        "use_tools": use_tools,
+        "history": history_json,
+        "model_settings": dict(model_settings) if model_settings else None,
+    }
+    if output_schema is not None:
+        payload["output_schema"] = output_schema
+    if tools:
+        payload["tools"] = tools
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _tool_calls(messages: List[ModelMessage]) -> List[Tuple[ToolCallPart, Optional[ToolReturnPart]]]:
+    """Пары (вызов, результат) из транскрипта."""
+    calls: Dict[str, ToolCallPart] = {}
+    returns: Dict[str, ToolReturnPart] = {}
+    for msg in messages:
+        for part in getattr(msg, "parts", []):
+            if isinstance(part, ToolCallPart):
+                calls[part.tool_call_id] = part
+            elif isinstance(part, ToolReturnPart):
+                returns[part.tool_call_id] = part
+    return [(call, returns.get(call_id)) for call_id, call in calls.items() if call.tool_name not in OUTPUT_TOOLS]
+
+
+def is_cacheable(messages: List[ModelMessage]) -> bool:
+    return all(call.tool_name in READ_ONLY_TOOLS for call, _ in _tool_calls(messages))
+
+
+def transcript_is_fresh(messages: List[ModelMessage]) -> bool:
+    """Повторяет read-only вызовы tools и сверяет результаты с сохранёнными."""
+    for call, ret in _tool_calls(messages):
+        func = READ_ONLY_TOOLS.get(call.tool_name)
+        if func is None or ret is None:
+            return False
+        try:
+            # Перепроверка — не вызов моделью: print_tool_call не должен попадать в лог
+            with capture_output():
+                current = func(**call.args_as_dict())
+        except Exception:
+            return False
+        if current != ret.content:
+            return False
+    return True
+
+
+class LLMCache:
+    """SQLite-кеш ответов модели с LRU-вытеснением по суммарному размеру."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "writes": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries(last_access)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[str, List[ModelMessage]]]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+
+        data = json.loads(zlib.decompress(row[0]).decode("utf-8"))
+        messages = ModelMessagesTypeAdapter.validate_python(data["messages"])
+        if not transcript_is_fresh(messages):
+            with self._lock:
+                self.stats["stale"] += 1
+                self.stats["misses"] += 1
+            return None
+
+        with self._lock:
+            self.stats["hits"] += 1
+        return data["output"], messages
+
+    def put(self, key: str, output: str, messages: List[ModelMessage]) -> None:
+        if not is_cacheable(messages):
+            return
+        data = {
+            "output": output,
+            "messages": ModelMessagesTypeAdapter.dump_python(messages, mode="json"),
+        }
+        value = zlib.compress(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time()),
+            )
+            self.stats["writes"] += 1
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Удаляет самые давно использованные записи, пока кеш не уложится в max_bytes."""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            self.stats["evictions"] += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,117 @@
+"""
+Типизированные ответы модели для шагов поиска реализации, объединения и генерации кейсов.
+
+Модели передаются в send_messages(output_type=...): pydantic-ai строит по ним
+JSON-схему ответа (для шагов без tools — ограниченная схемой генерация Ollama
+через response_format, для шага с read_file — вызов выходного инструмента
+final_result), проверяет ответ локально и только при ошибке валидации
+отправляет модели повторный запрос с текстом ошибок.
+
+Предикаты *_decided — условия ранней остановки потокового ответа
+(send_messages(stop_when=...)): получают частично провалидированный ответ и
+возвращают True, когда шагу уже достаточно полученных полей.
+"""
+from typing import Any, Callable, Dict, List, Literal, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+
+class SearchResult(BaseModel):
+    """Результат шага 5: найдена ли реализация эндпоинта в прочитанном файле."""
+
+    status: Literal["FOUND", "NOT_FOUND"] = Field(description="FOUND, если маршрут есть в прочитанном файле")
+    file: str = Field(description="Путь к прочитанному файлу")
+    reason: Optional[str] = Field(default=None, description="Для NOT_FOUND: почему маршрута нет")
+    code_evidence: str = Field(default="", description="Точная цитата кода с маршрутом из файла")
+    summary: str = Field(default="", description="Краткое описание эндпоинта")
+    description: str = Field(default="", description="Детали: параметры, поведение")
+    response_code: int = Field(default=200, description="HTTP код успешного ответа")
+    response_description: str = Field(default="", description="Описание успешного ответа")
+    schema_type: Literal["object", "array"] = Field(default="object", description="Тип тела ответа")
+    schema_fields: List[str] = Field(
+        default_factory=list,
+        description='Поля ответа, по одному: "field: type | description"',
+    )
+
+    def to_text(self) -> str:
+        """Текстовый анализ кода (формат format_route_analysis) для промпта шага 6."""
+        if self.status == "NOT_FOUND":
+            return f"STATUS: NOT_FOUND\nFILE: {self.file}\nREASON: {self.reason or ''}".strip()
+        return (
+            f"STATUS: FOUND\n"
+            f"FILE: {self.file}\n"
+            f"CODE_EVIDENCE:\n{self.code_evidence}\n\n"
+            f"SUMMARY: {self.summary}\n"
+            f"DESCRIPTION: {self.description}\n"
+            f"RESPONSE_CODE: {self.response_code}\n"
+            f"RESPONSE_DESCRIPTION: {self.response_description}\n"
+            f"SCHEMA_TYPE: {self.schema_type}\n"
+            f"SCHEMA_FIELDS:\n" + "\n".join(self.schema_fields)
+        ).strip()
+
+
+def search_decided(files: List[str]) -> Callable[[SearchResult], bool]:
+    """
+    Шаг 5: при NOT_FOUND достаточно status и file (файл исключается из поиска),
+    длинный reason не нужен. FOUND дочитывается целиком — нужны код и схема.
+    """
+    def decided(partial: SearchResult) -> bool:
+        if partial.status != "NOT_FOUND" or partial.file not in files:
+            return False
+        # Имя файла могло прийти не целиком ("a.py" из "a.pyi") — тогда ждем следующее поле
+        return partial.reason is not None or not any(
+            f != partial.file and f.startswith(partial.file) for f in files
+        )
+    return decided
+
+
+def _has_ref(value) -> bool:
+    """Есть ли ключ "$ref" на любом уровне (строки со "$ref" в описаниях не в счет)."""
+    if isinstance(value, dict):
+        return "$ref" in value or any(_has_ref(v) for v in value.values())
+    if isinstance(value, list):
+        return any(_has_ref(v) for v in value)
+    return False
+
+
+class MergedEndpoint(BaseModel):
+    """Результат шага 6: спецификация эндпоинта в формате Swagger 2.0."""
+
+    model_config = ConfigDict(extra="allow")
+
+    method: str
+    path: str
+    summary: str = ""
+    description: str = ""
+    responses: Dict[str, Dict[str, Any]] = Field(
+        description='Ответы по коду статуса: {"200": {"description": ..., "schema": {...}}}'
+    )
+
+    @field_validator("responses")
+    @classmethod
+    def _no_refs(cls, responses):
+        if _has_ref(responses):
+            raise ValueError("$ref is not allowed: inline the referenced schema")
+        return responses
+
+
+class TestCase(BaseModel):
+    """Один тестовый кейс шага 7 (формат, который читает utils/case_transpiler)."""
+
+    id: str = Field(description="TC-001, TC-002, ...")
+    title: str = ""
+    type: Literal["positive", "negative"]
+    description: str = ""
+    method: str
+    path: str
+    query_params: Optional[Dict[str, Any]] = None
+    headers: Optional[Dict[str, str]] = None
+    body: Optional[Any] = None
+    expected_status: int
+    expected_response: Optional[Any] = None
+
+
+class TestCases(BaseModel):
+    """Результат шага 7: список кейсов."""
+
+    cases: List[TestCase] = Field(min_length=1)
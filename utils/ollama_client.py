@@ -1,11 +1,17 @@
-from pydantic_ai import Agent
+from pydantic_ai import Agent, NativeOutput
+from pydantic_ai.exceptions import UnexpectedModelBehavior
 from pydantic_ai.models.openai import OpenAIChatModel
 from pydantic_ai.providers.openai import OpenAIProvider
-from typing import List, Optional, Tuple, Any
-from pydantic_ai.messages import ModelMessage, ModelResponse
+from typing import Callable, List, Optional, Tuple, Any, Type
+from pydantic_ai.messages import ModelMessage, ModelRequest, ModelResponse, RetryPromptPart, TextPart, ToolCallPart
+from pydantic import BaseModel, ValidationError
 from pydantic_ai.settings import ModelSettings
 from openai.types import chat
 from tools.loader import register_all
+from utils.console import current_output_buffer, use_output_buffer
+from utils.llm_cache import LLMCache, DEFAULT_MAX_BYTES, OUTPUT_TOOLS, make_key
+import asyncio
+import threading
 
 class OllamaCompatibleOpenAIModel(OpenAIChatModel):
     """
@@ -27,15 +33,24 @@ class OllamaCompatibleOpenAIModel(OpenAIChatModel):
 
 DEBUG = False
 
+OLLAMA_MODEL = "llama3.1:8b-instruct-q5_K_M"
+OLLAMA_BASE_URL = "http://127.0.0.1:11434/v1"
+DEFAULT_MODEL_SETTINGS = ModelSettings(temperature=0)
+# Сколько раз pydantic-ai возвращает модели ошибки валидации типизированного ответа
+STRUCTURED_OUTPUT_RETRIES = 2
+# Оценка токенов по длине ответа, если бэкенд не прислал usage (прерванный поток)
+CHARS_PER_TOKEN = 4
+
 def set_debug(value: bool):
     global DEBUG
     DEBUG = value
 
-def build_agent(system_prompt: Optional[str] = None, use_tools: bool = True) -> Agent:
+def build_agent(system_prompt: Optional[str] = None, use_tools: bool = True,
+                output_type: Optional[Type[BaseModel]] = None) -> Agent:
     model = OllamaCompatibleOpenAIModel(
-        "llama3.1:8b-instruct-q5_K_M",
+        OLLAMA_MODEL,
         provider=OpenAIProvider(
-            base_url="http://127.0.0.1:11434/v1",
+            base_url=OLLAMA_BASE_URL,
             api_key="ollama",
         ),
     )
@@ -47,10 +62,20 @@ def build_agent(system_prompt: Optional[str] = None, use_tools: bool = True) ->
     
     final_system_prompt = system_prompt if system_prompt is not None else default_system_prompt
     
+    # Типизированный ответ: без tools — генерация, ограниченная JSON-схемой
+    # (response_format), с tools — выходной инструмент final_result
+    output_kwargs = {}
+    if output_type is not None:
+        output_kwargs = {
+            "output_type": output_type if use_tools else NativeOutput(output_type),
+            "output_retries": STRUCTURED_OUTPUT_RETRIES,
+        }
+
     agent = Agent(
         model, 
         system_prompt=final_system_prompt,
-        model_settings=ModelSettings(temperature=0)
+        model_settings=DEFAULT_MODEL_SETTINGS,
+        **output_kwargs
     )
     
     if use_tools:
@@ -58,27 +83,261 @@ def build_agent(system_prompt: Optional[str] = None, use_tools: bool = True) ->
     
     return agent
 
-_agents = {}  # Кеш агентов по (hash(system_prompt), use_tools)
+_agents = {}  # Кеш агентов по (hash(system_prompt), use_tools, output_type)
+_agents_lock = threading.Lock()
+
+# --- Параллельный режим ---
+# Все асинхронные вызовы модели выполняются в одном фоновом event loop:
+# агенты и их HTTP-клиенты привязаны к циклу, поэтому воркеры-потоки
+# не запускают собственные циклы, а отправляют корутины в общий.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread: Optional[threading.Thread] = None
+_backend_limits = {}       # base_url -> максимум одновременных запросов
+_backend_semaphores = {}   # base_url -> asyncio.Semaphore (живут в _loop)
+
+
+def set_concurrency_limit(limit: int, base_url: str = OLLAMA_BASE_URL):
+    """Ограничивает число одновременных запросов к одному бэкенду Ollama."""
+    _backend_limits[base_url] = max(1, int(limit))
+    _backend_semaphores.pop(base_url, None)
+
+
+def start_background_loop():
+    """Запускает фоновый event loop; после этого send_messages можно звать из нескольких потоков."""
+    global _loop, _loop_thread
+    if _loop is not None:
+        return
+    _loop = asyncio.new_event_loop()
+    _loop_thread = threading.Thread(target=_loop.run_forever, name="ollama-loop", daemon=True)
+    _loop_thread.start()
+
+
+def stop_background_loop():
+    global _loop, _loop_thread
+    if _loop is None:
+        return
+    _loop.call_soon_threadsafe(_loop.stop)
+    _loop_thread.join()
+    _loop.close()
+    _loop = None
+    _loop_thread = None
+    _backend_semaphores.clear()
+
+
+# --- Кеш ответов модели ---
+_cache: Optional[LLMCache] = None
+_refresh_cache = False
+
+
+def configure_cache(enabled: bool = True, refresh: bool = False, max_bytes: int = DEFAULT_MAX_BYTES):
+    """
+    Включает персистентный кеш ответов.
+    refresh=True — не читать из кеша, но сохранять новые ответы (перезапись устаревших).
+    """
+    global _cache, _refresh_cache
+    if _cache is not None:
+        _cache.close()
+    _cache = LLMCache(max_bytes=max_bytes) if enabled else None
+    _refresh_cache = refresh
+
+
+def cache_stats() -> Optional[dict]:
+    return dict(_cache.stats) if _cache is not None else None
+
+
+def _tool_definitions(agent: Agent) -> List[dict]:
+    """Определения зарегистрированных tools агента (то, что видит модель)."""
+    definitions = []
+    for toolset in agent.toolsets:
+        for name, tool in sorted(getattr(toolset, "tools", {}).items()):
+            tool_def = tool.tool_def
+            definitions.append({
+                "name": name,
+                "description": tool_def.description,
+                "parameters": tool_def.parameters_json_schema,
+            })
+    return definitions
+
+
+def _cache_key(agent, user_message, history, system_prompt, use_tools, model_settings, output_type=None) -> Optional[str]:
+    if _cache is None:
+        return None
+    settings = {**DEFAULT_MODEL_SETTINGS, **(model_settings or {})}
+    schema = output_type.model_json_schema() if output_type is not None else None
+    tools = _tool_definitions(agent) if use_tools else None
+    return make_key(OLLAMA_MODEL, system_prompt, user_message, use_tools, history, settings, schema, tools)
+
+
+def _cache_lookup(key: Optional[str], output_type=None) -> Optional[Tuple[Any, List[ModelMessage]]]:
+    if key is None or _refresh_cache:
+        return None
+    cached = _cache.get(key)
+    if cached is None:
+        return None
+    print(f"Модель ответила (кеш): {cached[0]}")
+    if output_type is None:
+        return cached
+    try:
+        return output_type.model_validate_json(cached[0]), cached[1]
+    except ValidationError:
+        # Схема модели изменилась без изменения JSON-схемы (валидаторы) — считаем промахом
+        return None
+
+
+def _cache_store(key: Optional[str], output: Any, messages: List[ModelMessage]):
+    if key is not None:
+        if isinstance(output, BaseModel):
+            output = output.model_dump_json()
+        _cache.put(key, output, messages)
+
+
+# --- Статистика типизированных ответов ---
+# имя типа -> calls (вызовы модели), first_try (валидный ответ с первой попытки),
+# repaired (ответ исправлен после возврата ошибок валидации), retries (всего
+# повторных запросов), failed (ответ так и не прошел валидацию)
+_structured_stats = {}
+_structured_lock = threading.Lock()
+
+
+def _output_retries(messages: List[ModelMessage]) -> int:
+    """Число повторных запросов из-за невалидного типизированного ответа."""
+    return sum(
+        1
+        for message in messages if isinstance(message, ModelRequest)
+        for part in message.parts
+        if isinstance(part, RetryPromptPart) and (part.tool_name is None or part.tool_name in OUTPUT_TOOLS)
+    )
+
+
+def _record_structured(output_type: Type[BaseModel], retries: int = 0, failed: bool = False):
+    with _structured_lock:
+        stats = _structured_stats.setdefault(
+            output_type.__name__, {"calls": 0, "first_try": 0, "repaired": 0, "retries": 0, "failed": 0}
+        )
+        stats["calls"] += 1
+        stats["retries"] += retries
+        if failed:
+            stats["failed"] += 1
+        elif retries:
+            stats["repaired"] += 1
+        else:
+            stats["first_try"] += 1
+
+
+def structured_stats() -> dict:
+    with _structured_lock:
+        return {name: dict(stats) for name, stats in _structured_stats.items()}
+
+
+# --- Потоковый режим с ранней остановкой ---
+# этап (имя типа ответа или "text") -> calls, stopped (прервано предикатом),
+# stopped_tokens (сгенерировано до остановки), completed / completed_tokens
+# (ответы, дошедшие до конца, — база для оценки сэкономленного)
+_stream_stats = {}
+
+
+def _response_tokens(response: ModelResponse) -> int:
+    """Токены ответа: usage бэкенда, для прерванного потока — оценка по длине текста."""
+    usage = getattr(response, "usage", None)
+    if usage is not None and getattr(usage, "output_tokens", 0):
+        return usage.output_tokens
+    chars = 0
+    for part in response.parts:
+        if isinstance(part, TextPart):
+            chars += len(part.content)
+        elif isinstance(part, ToolCallPart):
+            chars += len(part.args_as_json_str())
+    return chars // CHARS_PER_TOKEN
+
+
+def _record_stream(stage: str, messages: List[ModelMessage], stopped: bool):
+    responses = [m for m in messages if isinstance(m, ModelResponse)]
+    tokens = _response_tokens(responses[-1]) if responses else 0
+    with _structured_lock:
+        stats = _stream_stats.setdefault(
+            stage, {"calls": 0, "stopped": 0, "stopped_tokens": 0, "completed": 0, "completed_tokens": 0}
+        )
+        stats["calls"] += 1
+        if stopped:
+            stats["stopped"] += 1
+            stats["stopped_tokens"] += tokens
+        else:
+            stats["completed"] += 1
+            stats["completed_tokens"] += tokens
 
-def send_messages(
-    user_message: str,
-    history: Optional[List[ModelMessage]] = None,
-    system_prompt: Optional[str] = None,
-    use_tools: bool = True,
-    step_name: Optional[str] = None,
-    model_settings: Optional[ModelSettings] = None,
-) -> Tuple[str, List[ModelMessage]]:
-    global _agents, DEBUG
 
-    # Используем хэш системного промпта и флаг использования инструментов как ключ для кеширования
-    prompt_key = (hash(system_prompt) if system_prompt else "default", use_tools)
+def stream_stats() -> dict:
+    """
+    Статистика ранней остановки по этапам. saved_tokens — оценка: средняя длина
+    ответа этапа, дошедшего до конца, минус сгенерированное до остановки
+    (None, пока нет ни одного полного ответа).
+    """
+    with _structured_lock:
+        result = {}
+        for stage, stats in _stream_stats.items():
+            stats = dict(stats)
+            saved = None
+            if stats["completed"]:
+                average = stats["completed_tokens"] / stats["completed"]
+                saved = max(0, round(average * stats["stopped"] - stats["stopped_tokens"]))
+            stats["saved_tokens"] = saved
+            result[stage] = stats
+        return result
+
+
+async def _run_streaming(agent: Agent, user_message: str, history, model_settings, output_type,
+                         stop_when: Callable[[Any], bool]) -> Tuple[Any, List[ModelMessage], bool]:
+    """
+    Потоковый вызов модели. stop_when получает частичный ответ (текст или частично
+    провалидированный объект output_type); как только он вернул True, поток
+    закрывается — соединение с Ollama рвется и генерация прекращается.
+    """
+    async with agent.run_stream(user_message, message_history=history, model_settings=model_settings) as result:
+        partials = result.stream_text(debounce_by=None) if output_type is None else result.stream_output(debounce_by=None)
+        output, stopped = None, False
+        try:
+            async for output in partials:
+                if stop_when(output):
+                    stopped = True
+                    break
+        finally:
+            await partials.aclose()
+        if not stopped:
+            output = await result.get_output()
+        return output, result.all_messages(), stopped
+
+
+def _event_loop() -> asyncio.AbstractEventLoop:
+    """Цикл для потокового вызова без фонового цикла (тот же, что использует run_sync)."""
+    try:
+        return asyncio.get_event_loop()
+    except RuntimeError:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        return loop
+
+
+def _get_agent(system_prompt: Optional[str], use_tools: bool, output_type: Optional[Type[BaseModel]] = None) -> Agent:
+    # Используем хэш системного промпта, флаг использования инструментов и тип ответа как ключ для кеширования
+    prompt_key = (hash(system_prompt) if system_prompt else "default", use_tools, output_type)
 
     # Создаем агента только если его нет в кеше
-    if prompt_key not in _agents:
-        _agents[prompt_key] = build_agent(system_prompt, use_tools=use_tools)
+    with _agents_lock:
+        if prompt_key not in _agents:
+            _agents[prompt_key] = build_agent(system_prompt, use_tools=use_tools, output_type=output_type)
+        return _agents[prompt_key]
 
-    agent = _agents[prompt_key]
-    
+
+def _backend_semaphore(base_url: str) -> Optional[asyncio.Semaphore]:
+    """Семафор бэкенда; создаётся лениво внутри работающего цикла."""
+    if base_url not in _backend_limits:
+        return None
+    if base_url not in _backend_semaphores:
+        _backend_semaphores[base_url] = asyncio.Semaphore(_backend_limits[base_url])
+    return _backend_semaphores[base_url]
+
+
+def _print_request(user_message: str, use_tools: bool, step_name: Optional[str]):
     if DEBUG:
         print(f"{'='*60}")
         print(f"Модель получила сообщение (use_tools={use_tools}): {user_message}")
@@ -86,6 +345,117 @@ def send_messages(
     elif step_name:
         print(f">>> Шаг: {step_name}")
 
+
+async def send_messages_async(
+    user_message: str,
+    history: Optional[List[ModelMessage]] = None,
+    system_prompt: Optional[str] = None,
+    use_tools: bool = True,
+    step_name: Optional[str] = None,
+    model_settings: Optional[ModelSettings] = None,
+    output_type: Optional[Type[BaseModel]] = None,
+    stop_when: Optional[Callable[[Any], bool]] = None,
+) -> Tuple[Any, List[ModelMessage]]:
+    """
+    Асинхронный вариант send_messages с учётом лимита параллельных запросов к бэкенду.
+    stop_when — предикат ранней остановки (см. _run_streaming); с ним ответ читается потоком.
+    """
+    agent = _get_agent(system_prompt, use_tools, output_type)
+    _print_request(user_message, use_tools, step_name)
+
+    key = _cache_key(agent, user_message, history, system_prompt, use_tools, model_settings, output_type)
+    cached = _cache_lookup(key, output_type)
+    if cached is not None:
+        return cached
+
+    semaphore = _backend_semaphore(OLLAMA_BASE_URL)
+    try:
+        if semaphore is not None:
+            await semaphore.acquire()
+        try:
+            stopped = False
+            if stop_when is not None:
+                output, messages, stopped = await _run_streaming(
+                    agent, user_message, history, model_settings, output_type, stop_when
+                )
+                new_messages = messages[len(history or []):]
+                _record_stream(output_type.__name__ if output_type else "text", new_messages, stopped)
+                if stopped:
+                    print(">>> Ответ получен досрочно, генерация остановлена")
+            elif history is not None:
+                result = await agent.run(
+                    user_message,
+                    message_history=history,
+                    model_settings=model_settings
+                )
+                output, messages, new_messages = result.output, result.all_messages(), result.new_messages()
+            else:
+                result = await agent.run(
+                    user_message,
+                    model_settings=model_settings
+                )
+                output, messages, new_messages = result.output, result.all_messages(), result.new_messages()
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+        print(f"Модель ответила: {output}")
+        if output_type is not None:
+            _record_structured(output_type, _output_retries(new_messages))
+        # Досрочно остановленный ответ неполный: в кеш (общий для всех режимов) он не пишется
+        if not stopped:
+            _cache_store(key, output, messages)
+        return output, messages
+    except UnexpectedModelBehavior as e:
+        if output_type is not None:
+            _record_structured(output_type, STRUCTURED_OUTPUT_RETRIES, failed=True)
+        print(f"ОШИБКА ПРИ ВЫЗОВЕ МОДЕЛИ: {e}")
+        raise
+    except Exception as e:
+        print(f"ОШИБКА ПРИ ВЫЗОВЕ МОДЕЛИ: {e}")
+        raise
+
+
+async def _run_in_caller_context(buffer, coro):
+    # Задача получает собственную копию контекста: переносим в неё буфер вывода
+    # вызывающего потока, чтобы лог (включая вызовы tools) остался у его эндпоинта.
+    use_output_buffer(buffer)
+    return await coro
+
+
+def send_messages(
+    user_message: str,
+    history: Optional[List[ModelMessage]] = None,
+    system_prompt: Optional[str] = None,
+    use_tools: bool = True,
+    step_name: Optional[str] = None,
+    model_settings: Optional[ModelSettings] = None,
+    output_type: Optional[Type[BaseModel]] = None,
+    stop_when: Optional[Callable[[Any], bool]] = None,
+) -> Tuple[Any, List[ModelMessage]]:
+    if _loop is not None:
+        coro = send_messages_async(
+            user_message, history, system_prompt, use_tools, step_name, model_settings, output_type, stop_when
+        )
+        future = asyncio.run_coroutine_threadsafe(
+            _run_in_caller_context(current_output_buffer(), coro), _loop
+        )
+        return future.result()
+
+    if stop_when is not None:
+        # Потоковый вызов — только асинхронный; выполняем в цикле текущего потока
+        return _event_loop().run_until_complete(send_messages_async(
+            user_message, history, system_prompt, use_tools, step_name, model_settings, output_type, stop_when
+        ))
+
+    agent = _get_agent(system_prompt, use_tools, output_type)
+    _print_request(user_message, use_tools, step_name)
+
+    key = _cache_key(agent, user_message, history, system_prompt, use_tools, model_settings, output_type)
+    cached = _cache_lookup(key, output_type)
+    if cached is not None:
+        return cached
+
     try:
         if history is not None:
             result = agent.run_sync(
@@ -100,7 +470,15 @@ def send_messages(
             )
         
         print(f"Модель ответила: {result.output}")
+        if output_type is not None:
+            _record_structured(output_type, _output_retries(result.new_messages()))
+        _cache_store(key, result.output, result.all_messages())
         return result.output, result.all_messages()
+    except UnexpectedModelBehavior as e:
+        if output_type is not None:
+            _record_structured(output_type, STRUCTURED_OUTPUT_RETRIES, failed=True)
+        print(f"ОШИБКА ПРИ ВЫЗОВЕ МОДЕЛИ: {e}")
+        raise
     except Exception as e:
         print(f"ОШИБКА ПРИ ВЫЗОВЕ МОДЕЛИ: {e}")
         # Если произошла ошибка 400, это может быть из-за застрявшего состояния или проблем с Ollama
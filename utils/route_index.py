@@ -0,0 +1,133 @@
+"""
+Статический индекс строковых литералов-маршрутов в исходниках сервиса.
+
+Строится один раз на сервис: из каждого файла извлекаются строковые литералы,
+похожие на пути ("/services", "/users/:id", '/items/<int:id>', `/a/${x}`), и
+нормализуются к общему виду шаблона ("/users/{}"). По индексу для эндпоинта
+из swagger строится ранжированный список файлов-кандидатов, который
+передаётся в search_implementation вместо полного списка файлов.
+
+Литералы каждого файла кешируются на диске по (mtime, size), поэтому
+повторные запуски пересканируют только изменённые файлы. Кеш лежит в каталоге
+тестов сервиса (services/<svc>, рядом с .qa_manifest.json), а не в анализируемых
+исходниках.
+"""
+import json
+import os
+import re
+from typing import Dict, Iterable, List, Set
+
+INDEX_FILENAME = ".qa_route_index.json"
+INDEX_VERSION = 1
+DEFAULT_SHORTLIST_SIZE = 10
+
+_STRING_LITERAL_RE = re.compile(r'"((?:[^"\\\n]|\\.){1,200})"|\'((?:[^\'\\\n]|\\.){2,200})\'|`([^`\n]{1,200})`')
+_ROUTE_CHARS_RE = re.compile(r"^[\w\-./{}:<>*~%$]+$")
+# {id}, {id:[0-9]+}, ${id}, <id>, <int:id>, :id, *
+_PARAM_SEGMENT_RE = re.compile(r"^(\$?\{[^}]*\}|<[^>]*>|:\w+|\*\w*)$")
+
+
+def normalize_route(route: str) -> str:
+    """Приводит путь к виду '/a/{}/b': параметры любых стилей заменяются на {}."""
+    route = route.split("?", 1)[0].strip()
+    segments = [s for s in route.split("/") if s]
+    normalized = ["{}" if _PARAM_SEGMENT_RE.match(s) else s for s in segments]
+    return "/" + "/".join(normalized)
+
+
+def _static_segments(normalized: str) -> List[str]:
+    return [s for s in normalized.split("/") if s and s != "{}"]
+
+
+def extract_route_literals(text: str) -> List[str]:
+    """Нормализованные строковые литералы, похожие на маршруты."""
+    routes: Set[str] = set()
+    for match in _STRING_LITERAL_RE.finditer(text):
+        literal = next(g for g in match.groups() if g is not None)
+        if "/" not in literal or "//" in literal or not _ROUTE_CHARS_RE.match(literal):
+            continue
+        normalized = normalize_route(literal)
+        if _static_segments(normalized):
+            routes.add(normalized)
+    return sorted(routes)
+
+
+class RouteIndex:
+    """Индекс маршрутов одного сервиса: файл -> нормализованные литералы."""
+
+    def __init__(self, cache_dir: str, files: Iterable[str]):
+        self.path = os.path.join(cache_dir, INDEX_FILENAME)
+        self.routes: Dict[str, List[str]] = {}
+        self.rescanned = 0
+
+        cached = self._load()
+        fresh = {}
+        for file_path in files:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            entry = cached.get(file_path)
+            if not entry or entry.get("mtime") != stat.st_mtime or entry.get("size") != stat.st_size:
+                try:
+                    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+                        literals = extract_route_literals(f.read())
+                except OSError:
+                    continue
+                entry = {"mtime": stat.st_mtime, "size": stat.st_size, "routes": literals}
+                self.rescanned += 1
+            fresh[file_path] = entry
+            self.routes[file_path] = entry["routes"]
+
+        if self.rescanned or len(fresh) != len(cached):
+            self._save(fresh)
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                return data.get("files", {})
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def _save(self, files: Dict[str, dict]) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "files": files}, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def score(self, endpoint_path: str, file_path: str) -> int:
+        """
+        Оценка файла для эндпоинта:
+        - литерал совпадает с путём целиком (с точностью до стиля параметров);
+        - литерал — хвост пути (роутер смонтирован с префиксом) или путь — хвост литерала (литерал с base_path);
+        - плюс по 1 за каждый статический сегмент пути, встречающийся в литералах файла.
+        """
+        target = normalize_route(endpoint_path)
+        target_segments = _static_segments(target)
+        best = 0
+        file_segments: Set[str] = set()
+        for route in self.routes.get(file_path, []):
+            file_segments.update(_static_segments(route))
+            if route == target:
+                best = max(best, 100)
+            elif route.endswith(target) and target != "/":
+                best = max(best, 90)
+            elif target.endswith(route):
+                best = max(best, 40 + 10 * len(_static_segments(route)))
+        return best + sum(1 for s in set(target_segments) if s in file_segments)
+
+    def shortlist(self, endpoint_path: str, files: List[str], limit: int = DEFAULT_SHORTLIST_SIZE) -> List[str]:
+        """
+        Файлы из files, отсортированные по убыванию оценки (только с оценкой > 0).
+        Если индекс ничего не нашёл — возвращает files без изменений.
+        """
+        scored = [(self.score(endpoint_path, f), f) for f in files]
+        ranked = [f for score, f in sorted(scored, key=lambda x: -x[0]) if score > 0]
+        return ranked[:limit] if ranked else list(files)
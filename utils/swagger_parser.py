@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import hashlib
 import json
-from copy import deepcopy
-from typing import Any, Dict, List, Tuple
+import mmap
+import os
+import pickle
+import re
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Tuple
 
 
 HTTP_METHODS = {"get", "post", "put", "patch", "delete", "head", "options"}
@@ -13,60 +17,181 @@ def load_swagger_json(path: str) -> Dict[str, Any]:
         return json.load(f)
 
 
-def _deref_swagger2_schema(schema: Any, swagger: Dict[str, Any], *, _stack: Tuple[str, ...] = ()) -> Any:
+_NO_REFS: Tuple[str, ...] = ()
+_NO_CUTS: FrozenSet[str] = frozenset()
+
+
+class SwaggerRefResolver:
     """
-    Deref $ref вида '#/definitions/NAME' или '#/components/schemas/NAME' рекурсивно.
+    Разыменование $ref вида '#/definitions/NAME' или '#/components/schemas/NAME' с кешем на документ.
     - цикл -> {'type':'object','x-circular_ref': ref}
     - нерешённое -> {'x-unresolved_ref': ref}
-    ВАЖНО: возвращает inline-объект (не оставляет '$ref' если ref решаемый).
-    """
-    def resolve_ref(ref: str) -> Any:
-        if not isinstance(ref, str) or not ref.startswith("#/"):
-            return {"x-unresolved_ref": ref}
-        
-        parts = ref.split("/")
-        current = swagger
-        try:
-            for part in parts[1:]: # пропускаем '#'
-                # Обработка URL-encoding (например, ~1 для / и ~0 для ~)
-                part = part.replace("~1", "/").replace("~0", "~")
-                if isinstance(current, dict) and part in current:
-                    current = current[part]
-                elif isinstance(current, list) and part.isdigit():
-                    current = current[int(part)]
-                else:
-                    return {"x-unresolved_ref": ref}
-            return current
-        except Exception:
-            return {"x-unresolved_ref": ref}
 
-    if isinstance(schema, list):
-        return [_deref_swagger2_schema(x, swagger, _stack=_stack) for x in schema]
+    Каждое определение разворачивается один раз и дальше переиспользуется
+    (структурное разделение): результаты разных эндпоинтов ссылаются на одни
+    и те же объекты, а поддеревья без $ref возвращаются как есть. Новые
+    объекты создаются только на пути к изменённым узлам и там, где у $ref
+    есть локальные поля (copy-on-write). Поэтому результат нельзя менять
+    на месте — только копировать.
+
+    Результат определения зависит от стека раскрытия только через циклы:
+    закешированное раскрытие переиспользуется, если ни одна из ссылок,
+    раскрытых внутри него, не находится на текущем стеке (иначе там был бы
+    обрыв цикла) — тогда ответ совпадает с полным рекурсивным раскрытием.
 
-    if not isinstance(schema, dict):
-        return schema
+    Нерешённые ссылки собираются в том же обходе.
+    """
 
-    if "$ref" in schema:
-        ref = schema["$ref"]
-        if ref in _stack:
-            merged = {k: v for k, v in schema.items() if k != "$ref"}
+    def __init__(self, swagger: Dict[str, Any]):
+        self.swagger = swagger
+        # ref -> (результат, нерешённые refs, все refs, раскрытые внутри, нерешённые refs по ключам)
+        self._resolved: Dict[str, Tuple[Any, Tuple[str, ...], FrozenSet[str], Dict[str, Tuple[str, ...]] | None]] = {}
+        self._reach_stack: List[set] = [set()]
+        self.stats = {"resolved": 0, "reused": 0}
+
+    def deref(self, schema: Any, unresolved: List[str] | None = None) -> Any:
+        """Возвращает inline-объект (не оставляет '$ref', если ref решаемый)."""
+        result, refs, _ = self._walk(schema, ())
+        if unresolved is not None:
+            for ref in refs:
+                if ref not in unresolved:
+                    unresolved.append(ref)
+        return result
+
+    def _lookup(self, ref: Any) -> Tuple[bool, Any]:
+        if not isinstance(ref, str) or not ref.startswith("#/"):
+            return False, None
+
+        current: Any = self.swagger
+        for part in ref.split("/")[1:]:  # пропускаем '#'
+            # Обработка URL-encoding (например, ~1 для / и ~0 для ~)
+            part = part.replace("~1", "/").replace("~0", "~")
+            if isinstance(current, dict) and part in current:
+                current = current[part]
+            elif isinstance(current, list) and part.isdigit() and int(part) < len(current):
+                current = current[int(part)]
+            else:
+                return False, None
+        return True, current
+
+    def _walk(self, node: Any, stack: Tuple[str, ...]) -> Tuple[Any, Tuple[str, ...], FrozenSet[str]]:
+        """
+        Возвращает (результат, нерешённые refs, cuts), где cuts — refs со стека,
+        на которых цикл был оборван. Результат с непустыми cuts зависит от
+        контекста и не кешируется.
+        """
+        if isinstance(node, list):
+            out = None
+            refs: Tuple[str, ...] = _NO_REFS
+            cuts = _NO_CUTS
+            for i, item in enumerate(node):
+                r, u, c = self._walk(item, stack)
+                if out is None and r is not item:
+                    out = list(node[:i])
+                if out is not None:
+                    out.append(r)
+                if u:
+                    refs += u
+                if c:
+                    cuts |= c
+            return (node if out is None else out), refs, cuts
+
+        if not isinstance(node, dict):
+            return node, _NO_REFS, _NO_CUTS
+
+        if "$ref" in node:
+            return self._walk_ref(node, stack)
+        return self._walk_dict(node, stack)
+
+    def _walk_dict(self, node: Dict[str, Any], stack: Tuple[str, ...],
+                   key_refs: Dict[str, Tuple[str, ...]] | None = None) -> Tuple[Any, Tuple[str, ...], FrozenSet[str]]:
+        """Обход dict без $ref; key_refs (если передан) получает нерешённые refs по каждому ключу."""
+        own = node.get("x-unresolved_ref")
+        refs = (own,) if isinstance(own, str) else _NO_REFS
+        cuts = _NO_CUTS
+        out = None
+        for k, v in node.items():
+            r, u, c = self._walk(v, stack)
+            if r is not v:
+                if out is None:
+                    out = dict(node)
+                out[k] = r
+            if key_refs is not None:
+                key_refs[k] = (v,) if k == "x-unresolved_ref" and isinstance(v, str) else u
+            if u:
+                refs += u
+            if c:
+                cuts |= c
+        return (node if out is None else out), refs, cuts
+
+    def _walk_ref(self, node: Dict[str, Any], stack: Tuple[str, ...]) -> Tuple[Any, Tuple[str, ...], FrozenSet[str]]:
+        ref = node["$ref"]
+        local = {k: v for k, v in node.items() if k != "$ref"}
+
+        if ref in stack:
+            merged = dict(local)
             merged.setdefault("type", "object")
             merged["x-circular_ref"] = ref
-            return _deref_swagger2_schema(merged, swagger, _stack=_stack)
+            r, u, c = self._walk(merged, stack)
+            return r, u, c | {ref}
 
-        resolved = resolve_ref(ref)
-        if isinstance(resolved, dict) and "x-unresolved_ref" in resolved:
-            merged = {k: v for k, v in schema.items() if k != "$ref"}
+        found, target = self._lookup(ref)
+        if not found:
+            merged = dict(local)
             merged["x-unresolved_ref"] = ref
-            return _deref_swagger2_schema(merged, swagger, _stack=_stack)
+            return self._walk(merged, stack)
+
+        if local and isinstance(target, dict) and "$ref" in target:
+            # Определение-псевдоним ({'$ref': ...}): локальные поля наследуются следующей ссылкой цепочки
+            merged = dict(target)
+            merged.update(local)
+            self._reach_stack[-1].add(ref)
+            return self._walk(merged, stack + (ref,))
+
+        base, refs, cuts, key_refs = self._resolve_target(ref, target, stack)
+        if not local:
+            return base, refs, cuts
+
+        # Локальные поля приоритетнее: копия только верхнего уровня, вложенное — общее.
+        # Нерешённые refs перекрытых ключей определения в результат не попадают.
+        local_r, local_u, local_c = self._walk(local, stack + (ref,))
+        merged = dict(base) if isinstance(base, dict) else {}
+        merged.update(local_r)
+        if key_refs is not None:
+            refs = tuple(r for k, u in key_refs.items() if k not in local for r in u)
+        return merged, refs + local_u, cuts | (local_c - {ref})
+
+    def _resolve_target(self, ref: str, target: Any, stack: Tuple[str, ...]):
+        """Раскрытие определения: (результат, нерешённые refs, cuts, нерешённые refs по ключам)"""
+        cached = self._resolved.get(ref)
+        if cached is not None and not any(s in cached[2] for s in stack):
+            self.stats["reused"] += 1
+            self._reach_stack[-1].update(cached[2])
+            return cached[0], cached[1], _NO_CUTS, cached[3]
+
+        key_refs = None
+        self._reach_stack.append(set())
+        try:
+            if isinstance(target, dict) and "$ref" not in target:
+                key_refs = {}
+                r, u, c = self._walk_dict(target, stack + (ref,), key_refs)
+            else:
+                r, u, c = self._walk(target, stack + (ref,))
+        finally:
+            reach = self._reach_stack.pop()
+        reach.add(ref)
+        self._reach_stack[-1].update(reach)
+
+        c = c - {ref}
+        if not c and cached is None:
+            self._resolved[ref] = (r, u, frozenset(reach), key_refs)
+            self.stats["resolved"] += 1
+        return r, u, c, key_refs
 
-        base = deepcopy(resolved)
-        local = {k: v for k, v in schema.items() if k != "$ref"}
-        base.update(local)  # локальные поля приоритетнее
-        return _deref_swagger2_schema(base, swagger, _stack=_stack + (ref,))
 
-    # обычная рекурсия
-    return {k: _deref_swagger2_schema(v, swagger, _stack=_stack) for k, v in schema.items()}
+def _deref_swagger2_schema(schema: Any, swagger: Dict[str, Any]) -> Any:
+    """Разовое разыменование без общего кеша (см. SwaggerRefResolver)."""
+    return SwaggerRefResolver(swagger).deref(schema)
 
 
 def _merge_parameters(path_params: List[Dict[str, Any]] | None,
@@ -83,11 +208,11 @@ def _merge_parameters(path_params: List[Dict[str, Any]] | None,
             key = (str(p.get("name", "")), str(p.get("in", "")))
             # при конфликте приоритет у параметра операции
             if key not in merged or src is (op_params or []):
-                merged[key] = deepcopy(p)
+                merged[key] = dict(p)
     return list(merged.values())
 
 
-def _extract_request_body_from_params(params: List[Dict[str, Any]], swagger: Dict[str, Any],
+def _extract_request_body_from_params(params: List[Dict[str, Any]], resolver: SwaggerRefResolver,
                                       unresolved: List[str]) -> Dict[str, Any] | None:
     """
     Swagger 2.0: тело — это parameter с in='body' и schema.
@@ -99,9 +224,7 @@ def _extract_request_body_from_params(params: List[Dict[str, Any]], swagger: Dic
             if schema is None:
                 body_schema = None
             else:
-                body_schema = _deref_swagger2_schema(schema, swagger)
-                # соберём unresolved refs
-                _collect_unresolved_refs(body_schema, unresolved)
+                body_schema = resolver.deref(schema, unresolved)
             return {
                 "in": "body",
                 "name": p.get("name", "body"),
@@ -112,56 +235,104 @@ def _extract_request_body_from_params(params: List[Dict[str, Any]], swagger: Dic
     return None
 
 
-def _deref_parameters(params: List[Dict[str, Any]], swagger: Dict[str, Any], unresolved: List[str]) -> None:
+def _deref_parameters(params: List[Dict[str, Any]], resolver: SwaggerRefResolver, unresolved: List[str]) -> None:
     for i, p in enumerate(params):
         if not isinstance(p, dict):
             continue
         
-        # Если сам параметр — это $ref
+        # Если сам параметр — это $ref (копия: результат резолвера общий)
         if "$ref" in p:
-            p = _deref_swagger2_schema(p, swagger)
+            p = resolver.deref(p, unresolved)
+            p = dict(p) if isinstance(p, dict) else p
             params[i] = p
-            _collect_unresolved_refs(p, unresolved)
+            if not isinstance(p, dict):
+                continue
 
-        if "schema" in p:
-            p["schema"] = _deref_swagger2_schema(p["schema"], swagger)
-            _collect_unresolved_refs(p["schema"], unresolved)
-        
         # formData/body/query params могут иметь items/properties и т.п. без schema
-        for k in ("items", "properties"):
+        for k in ("schema", "items", "properties"):
             if k in p:
-                p[k] = _deref_swagger2_schema(p[k], swagger)
-                _collect_unresolved_refs(p[k], unresolved)
+                p[k] = resolver.deref(p[k], unresolved)
 
 
-def _deref_responses(responses: Dict[str, Any], swagger: Dict[str, Any], unresolved: List[str]) -> None:
+def _deref_responses(responses: Dict[str, Any], resolver: SwaggerRefResolver, unresolved: List[str]) -> None:
     for code, resp in (responses or {}).items():
         if not isinstance(resp, dict):
             continue
         
         # Если сам ответ — это $ref
         if "$ref" in resp:
-            resp = _deref_swagger2_schema(resp, swagger)
-            responses[code] = resp
-            _collect_unresolved_refs(resp, unresolved)
+            resp = resolver.deref(resp, unresolved)
 
-        if "schema" in resp:
-            resp["schema"] = _deref_swagger2_schema(resp["schema"], swagger)
-            _collect_unresolved_refs(resp["schema"], unresolved)
+        # Копия верхнего уровня: исходный ответ (или общий результат резолвера) не меняем
+        resp = dict(resp) if isinstance(resp, dict) else resp
+        responses[code] = resp
 
+        if isinstance(resp, dict) and "schema" in resp:
+            resp["schema"] = resolver.deref(resp["schema"], unresolved)
 
-def _collect_unresolved_refs(node: Any, out: List[str]) -> None:
-    """
-    Собирает любые 'x-unresolved_ref' рекурсивно.
-    """
-    if isinstance(node, dict):
-        if "x-unresolved_ref" in node and isinstance(node["x-unresolved_ref"], str):
-            out.append(node["x-unresolved_ref"])
-        for v in node.values():
-            _collect_unresolved_refs(v, out)
-    elif isinstance(node, list):
-        for x in node:
-            _collect_unresolved_refs(x, out)
+
+def _path_item_endpoints(path: str, path_item: Any, resolver: SwaggerRefResolver) -> Iterator[Dict[str, Any]]:
+    """Endpoint-объекты всех операций одного элемента paths."""
+    if not isinstance(path_item, dict):
+        return
+
+    path_level_params = path_item.get("parameters") if isinstance(path_item.get("parameters"), list) else []
+
+    for method_lc, op in path_item.items():
+        if method_lc not in HTTP_METHODS:
+            continue
+        if not isinstance(op, dict):
+            continue
+
+        unresolved: List[str] = []
+
+        op_params = op.get("parameters") if isinstance(op.get("parameters"), list) else []
+        parameters = _merge_parameters(path_level_params, op_params)
+
+        # deref параметров
+        _deref_parameters(parameters, resolver, unresolved)
+
+        # request_body (из body-parameter)
+        request_body = _extract_request_body_from_params(parameters, resolver, unresolved)
+
+        # responses
+        responses = dict(op.get("responses", {}) or {})
+        _deref_responses(responses, resolver, unresolved)
+
+        yield {
+            "path": path,
+            "method": method_lc.upper(),
+            "summary": op.get("summary", "") or "",
+            "description": op.get("description", None),
+            "parameters": parameters,
+            "request_body": request_body,
+            "responses": responses,
+            "tags": op.get("tags", []) or [],
+            "operation_id": op.get("operationId", None),
+            "x_unresolved_refs": unresolved,
+            "x_latency_budget_ms": _latency_budget_ms(op, path_item),
+        }
+
+
+def _latency_budget_ms(op: Dict[str, Any], path_item: Dict[str, Any]) -> Optional[float]:
+    """Бюджет времени ответа из x-latency-budget-ms операции (или элемента paths)."""
+    for source in (op, path_item):
+        value = source.get("x-latency-budget-ms")
+        if isinstance(value, bool):
+            continue
+        try:
+            budget = float(value)
+        except (TypeError, ValueError):
+            continue
+        if budget > 0:
+            return int(budget) if budget.is_integer() else budget
+    return None
+
+
+def _check_swagger_keys(keys) -> None:
+    # Поддерживаем и Swagger 2.0, и OpenAPI 3.0+ через общий резолвер
+    if not any(k in keys for k in ("swagger", "openapi")):
+        raise ValueError("This extractor supports Swagger/OpenAPI files only (missing 'swagger' or 'openapi' fields).")
 
 
 def extract_endpoints_swagger2(swagger: Dict[str, Any]) -> List[Dict[str, Any]]:
@@ -169,55 +340,198 @@ def extract_endpoints_swagger2(swagger: Dict[str, Any]) -> List[Dict[str, Any]]:
     Возвращает массив endpoint-объектов в формате:
     {
       path, method, summary, description, parameters, request_body,
-      responses, tags, operation_id, x_unresolved_refs
+      responses, tags, operation_id, x_unresolved_refs, x_latency_budget_ms
     }
     """
-    # Поддерживаем и Swagger 2.0, и OpenAPI 3.0+ через общий резолвер
-    if not any(k in swagger for k in ("swagger", "openapi")):
-        raise ValueError("This extractor supports Swagger/OpenAPI files only (missing 'swagger' or 'openapi' fields).")
+    _check_swagger_keys(swagger)
 
     endpoints: List[Dict[str, Any]] = []
     paths = swagger.get("paths", {}) or {}
+    resolver = SwaggerRefResolver(swagger)
 
     for path, path_item in paths.items():
-        if not isinstance(path_item, dict):
-            continue
-
-        path_level_params = path_item.get("parameters") if isinstance(path_item.get("parameters"), list) else []
-
-        for method_lc, op in path_item.items():
-            if method_lc not in HTTP_METHODS:
-                continue
-            if not isinstance(op, dict):
-                continue
-
-            unresolved: List[str] = []
-
-            op_params = op.get("parameters") if isinstance(op.get("parameters"), list) else []
-            parameters = _merge_parameters(path_level_params, op_params)
+        endpoints.extend(_path_item_endpoints(path, path_item, resolver))
+
+    return endpoints
+
+
+# --- Потоковое извлечение эндпоинтов из файла ---
+
+SIDECAR_VERSION = 4
+
+_WS_RE = re.compile(rb"\s*")
+_STRING_RE = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"')
+_TOKEN_RE = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}]')
+_SCALAR_RE = re.compile(rb"[^,}\]\s]+")
+
+
+def _skip_ws(buf, pos: int) -> int:
+    return _WS_RE.match(buf, pos).end()
+
+
+def _skip_value(buf, pos: int) -> int:
+    """Конец JSON-значения, начинающегося в pos (без разбора: только строки и скобки)."""
+    first = buf[pos:pos + 1]
+    if first == b'"':
+        return _STRING_RE.match(buf, pos).end()
+    if first not in (b"{", b"["):
+        return _SCALAR_RE.match(buf, pos).end()
+    depth = 0
+    for token in _TOKEN_RE.finditer(buf, pos):
+        t = token.group()
+        if t in (b"{", b"["):
+            depth += 1
+        elif t in (b"}", b"]"):
+            depth -= 1
+            if depth == 0:
+                return token.end()
+    raise ValueError("Unterminated JSON value")
+
+
+def _iter_object_members(buf, pos: int) -> Iterator[Tuple[str, int, int]]:
+    """(ключ, начало значения, конец значения) для каждого члена объекта, начинающегося в pos."""
+    pos = _skip_ws(buf, pos)
+    if buf[pos:pos + 1] != b"{":
+        raise ValueError("Expected JSON object")
+    pos = _skip_ws(buf, pos + 1)
+    if buf[pos:pos + 1] == b"}":
+        return
+    while True:
+        key_match = _STRING_RE.match(buf, pos)
+        if not key_match:
+            raise ValueError("Expected object key")
+        key = json.loads(key_match.group())
+        pos = _skip_ws(buf, key_match.end())
+        if buf[pos:pos + 1] != b":":
+            raise ValueError("Expected ':'")
+        start = _skip_ws(buf, pos + 1)
+        end = _skip_value(buf, start)
+        yield key, start, end
+        pos = _skip_ws(buf, end)
+        sep = buf[pos:pos + 1]
+        if sep == b"}":
+            return
+        if sep != b",":
+            raise ValueError("Expected ',' or '}'")
+        pos = _skip_ws(buf, pos + 1)
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sidecar_path(path: str) -> str:
+    """Путь к бинарному кешу эндпоинтов рядом со swagger.json."""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.endpoints.pickle")
+
+
+def _iter_sidecar(sidecar: str, file_hash: str) -> Iterator[Dict[str, Any]] | None:
+    """Итератор по закешированным эндпоинтам или None, если кеш отсутствует/устарел."""
+    try:
+        f = open(sidecar, "rb")
+    except OSError:
+        return None
+    try:
+        header = pickle.load(f)
+    except Exception:
+        f.close()
+        return None
+    if header != {"version": SIDECAR_VERSION, "sha256": file_hash}:
+        f.close()
+        return None
+
+    def records():
+        # Каждый эндпоинт — отдельный pickle-кадр со своим memo: прочитанные
+        # эндпоинты не удерживаются, память не растёт с их числом
+        with f:
+            while True:
+                endpoint = pickle.load(f)
+                if endpoint is None:
+                    return
+                yield endpoint
+
+    return records()
+
+
+def _iter_swagger_file(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Разбирает файл без json.load целиком: за один проход по mmap находит границы
+    разделов верхнего уровня и элементов paths, декодирует всё, кроме paths
+    (нужно для $ref), а элементы paths декодирует и разыменовывает по одному.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"Empty swagger file: {path}")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            start = 3 if buf[:3] == b"\xef\xbb\xbf" else 0
+            document: Dict[str, Any] = {}
+            paths_span = None
+            for key, value_start, value_end in _iter_object_members(buf, start):
+                if key == "paths":
+                    paths_span = (value_start, value_end)
+                else:
+                    document[key] = json.loads(buf[value_start:value_end])
+            _check_swagger_keys(document)
 
-            # deref параметров
-            _deref_parameters(parameters, swagger, unresolved)
+            if paths_span is None or buf[paths_span[0]:paths_span[0] + 1] != b"{":
+                return
 
-            # request_body (из body-parameter)
-            request_body = _extract_request_body_from_params(parameters, swagger, unresolved)
+            resolver = SwaggerRefResolver(document)
+            for path_key, item_start, item_end in _iter_object_members(buf, paths_span[0]):
+                path_item = json.loads(buf[item_start:item_end])
+                yield from _path_item_endpoints(path_key, path_item, resolver)
 
-            # responses
-            responses = deepcopy(op.get("responses", {}) or {})
-            _deref_responses(responses, swagger, unresolved)
 
-            endpoint_obj = {
-                "path": path,
-                "method": method_lc.upper(),
-                "summary": op.get("summary", "") or "",
-                "description": op.get("description", None),
-                "parameters": parameters,
-                "request_body": request_body,
-                "responses": responses,
-                "tags": op.get("tags", []) or [],
-                "operation_id": op.get("operationId", None),
-                "x_unresolved_refs": unresolved,
-            }
-            endpoints.append(endpoint_obj)
+def iter_endpoints_swagger2(path: str, use_cache: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    Лениво отдаёт endpoint-объекты (как extract_endpoints_swagger2) из swagger.json.
 
-    return endpoints
\ No newline at end of file
+    Операции разбираются и разыменовываются по мере потребления, поэтому первый
+    эндпоинт доступен сразу, а память не растёт с размером файла. Результат
+    пишется в бинарный кеш рядом с файлом (ключ — sha256 файла); при следующем
+    запуске эндпоинты читаются из него без разбора JSON. Кеш сохраняется, только
+    если генератор дочитан до конца.
+    """
+    file_hash = _file_sha256(path) if use_cache else None
+    sidecar = sidecar_path(path)
+
+    if use_cache:
+        cached = _iter_sidecar(sidecar, file_hash)
+        if cached is not None:
+            yield from cached
+            return
+
+    if not use_cache:
+        yield from _iter_swagger_file(path)
+        return
+
+    tmp_path = f"{sidecar}.{os.getpid()}.tmp"
+    try:
+        out = open(tmp_path, "wb")
+    except OSError:
+        yield from _iter_swagger_file(path)
+        return
+
+    completed = False
+    try:
+        with out:
+            pickle.dump({"version": SIDECAR_VERSION, "sha256": file_hash}, out, protocol=pickle.HIGHEST_PROTOCOL)
+            for endpoint in _iter_swagger_file(path):
+                # Отдельный кадр на эндпоинт (общий Pickler держал бы в memo все записанные)
+                pickle.dump(endpoint, out, protocol=pickle.HIGHEST_PROTOCOL)
+                yield endpoint
+            pickle.dump(None, out, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, sidecar)
+        completed = True
+    finally:
+        # Срабатывает и при close() недочитанного генератора (GeneratorExit)
+        if not completed:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
@@ -0,0 +1,194 @@
+"""
+Слияние сгенерированного модуля тестов с существующим файлом (шаг 8.5.1).
+
+Модель генерирует модуль только для текущего эндпоинта/метода; объединение с
+уже существующим файлом выполняется здесь по ast, без модели:
+    - импорты: добавляются только недостающие имена (после последнего импорта файла)
+    - верхнеуровневые определения (константы, кейсы, функции тестов) сопоставляются
+      по имени: определение с тем же именем заменяется на месте, новые дописываются
+      в конец файла, тесты, которых нет в новом модуле, сохраняются
+    - если METHOD нового модуля отличается от METHOD файла (другой метод того же
+      пути), конфликтующие имена нового модуля получают суффикс _<METHOD>
+      (POSITIVE_CASES -> POSITIVE_CASES_POST) вместе со всеми ссылками на них;
+      одинаковые определения (например, ENDPOINT) не дублируются
+    - docstring и голые выражения нового модуля не переносятся (остается docstring файла)
+Текст существующего файла вне заменяемых определений (комментарии, отступы) не меняется.
+"""
+import ast
+import io
+import tokenize
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+
+@dataclass
+class MergeResult:
+    code: str
+    added: List[str] = field(default_factory=list)
+    replaced: List[str] = field(default_factory=list)
+    renamed: Dict[str, str] = field(default_factory=dict)
+
+
+def _node_name(node: ast.stmt) -> Optional[str]:
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return node.name
+    if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+        return node.targets[0].id
+    if isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+        return node.target.id
+    return None
+
+
+def _node_lines(node: ast.stmt) -> Tuple[int, int]:
+    """Диапазон строк определения (0-based, конец не включительно), включая декораторы."""
+    start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+    return start - 1, node.end_lineno
+
+
+def _imported(node: ast.stmt) -> Set[Tuple]:
+    if isinstance(node, ast.Import):
+        return {(None, alias.name, alias.asname) for alias in node.names}
+    if isinstance(node, ast.ImportFrom):
+        return {(node.module, alias.name, alias.asname, node.level) for alias in node.names}
+    return set()
+
+
+def _missing_import(node: ast.stmt, existing: Set[Tuple]) -> Optional[str]:
+    """Импорт только с теми именами, которых еще нет в файле (None — все есть)."""
+    if isinstance(node, ast.Import):
+        names = [a for a in node.names if (None, a.name, a.asname) not in existing]
+        return ast.unparse(ast.Import(names=names)) if names else None
+    names = [a for a in node.names if (node.module, a.name, a.asname, node.level) not in existing]
+    return ast.unparse(ast.ImportFrom(module=node.module, names=names, level=node.level)) if names else None
+
+
+def _method(tree: ast.Module) -> Optional[str]:
+    for node in tree.body:
+        if _node_name(node) == "METHOD" and isinstance(node.value, ast.Constant):
+            return str(node.value.value).upper()
+    return None
+
+
+def _rename(source: str, mapping: Dict[str, str]) -> str:
+    """Переименовывает имена (не атрибуты) в исходнике, сохраняя форматирование."""
+    if not mapping:
+        return source
+    tokens = list(tokenize.generate_tokens(io.StringIO(source).readline))
+    lines = source.splitlines(keepends=True)
+    # Заменяем с конца, чтобы не сбивать позиции
+    edits = []
+    previous = None
+    for token in tokens:
+        if (token.type == tokenize.NAME and token.string in mapping
+                and not (previous is not None and previous.type == tokenize.OP and previous.string == ".")):
+            edits.append(token)
+        if token.type not in (tokenize.NL, tokenize.NEWLINE, tokenize.COMMENT, tokenize.INDENT, tokenize.DEDENT):
+            previous = token
+    for token in reversed(edits):
+        row, col = token.start
+        line = lines[row - 1]
+        lines[row - 1] = line[:col] + mapping[token.string] + line[col + len(token.string):]
+    return "".join(lines)
+
+
+def merge_test_module(existing: str, new: str) -> MergeResult:
+    """Объединяет новый модуль тестов с содержимым существующего файла."""
+    old_tree = ast.parse(existing)
+    new_tree = ast.parse(new)
+    old_lines = existing.splitlines(keepends=True)
+    if old_lines and not old_lines[-1].endswith("\n"):
+        old_lines[-1] += "\n"
+    new_lines = new.splitlines(keepends=True)
+
+    old_defs: Dict[str, ast.stmt] = {}
+    old_dumps: Set[str] = set()
+    old_imports: Set[Tuple] = set()
+    last_import_end = 0
+    for node in old_tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            old_imports |= _imported(node)
+            last_import_end = node.end_lineno
+            continue
+        name = _node_name(node)
+        if name:
+            old_defs[name] = node
+        old_dumps.add(ast.dump(node))
+
+    result = MergeResult(code=existing)
+    new_defs = []
+    for node in new_tree.body:
+        # Docstring модуля и прочие голые выражения — не определения: в середине
+        # существующего файла они стали бы бесхозными строками
+        if isinstance(node, ast.Expr):
+            continue
+        if not isinstance(node, (ast.Import, ast.ImportFrom)):
+            start, end = _node_lines(node)
+            new_defs.append((node, _node_name(node), "".join(new_lines[start:end])))
+
+    def renamed_dump(source):
+        return ast.dump(ast.parse(_rename(source, result.renamed)).body[0])
+
+    new_method, old_method = _method(new_tree), _method(old_tree)
+    if new_method and old_method and new_method != old_method:
+        # Имя переименовывается, если в файле уже есть его версия с суффиксом (прошлая
+        # генерация этого метода) или другое определение с тем же именем. Сравнение —
+        # с учетом уже переименованных ссылок, поэтому повторяем до неподвижной точки.
+        changed = True
+        while changed:
+            changed = False
+            for node, name, source in new_defs:
+                if not name or name in result.renamed:
+                    continue
+                target = name + (f"_{new_method.lower()}" if name.startswith("test_") else f"_{new_method}")
+                if target in old_defs or (name in old_defs and renamed_dump(source) != ast.dump(old_defs[name])):
+                    result.renamed[name] = target
+                    changed = True
+
+    imports: List[str] = []
+    for node in new_tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            line = _missing_import(node, old_imports)
+            if line:
+                imports.append(line + "\n")
+                old_imports |= _imported(node)
+
+    replacements: List[Tuple[int, int, str]] = []
+    appended: List[Tuple[ast.stmt, str]] = []
+    for node, name, source in new_defs:
+        dump = renamed_dump(source)
+        if dump in old_dumps:
+            continue
+        source = _rename(source, result.renamed)
+        if not source.endswith("\n"):
+            source += "\n"
+        name = result.renamed.get(name, name)
+        if name in old_defs:
+            old_start, old_end = _node_lines(old_defs[name])
+            replacements.append((old_start, old_end, source))
+            result.replaced.append(name)
+        else:
+            appended.append((node, source))
+            if name:
+                result.added.append(name)
+
+    for start, end, source in sorted(replacements, reverse=True):
+        old_lines[start:end] = [source]
+    if imports:
+        old_lines[last_import_end:last_import_end] = imports
+    code = "".join(old_lines).rstrip("\n") + "\n"
+    previous_is_def = True
+    for node, source in appended:
+        is_def = isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+        # PEP 8: две пустые строки вокруг функций и классов, одна — между константами
+        code += ("\n\n" if is_def or previous_is_def else "\n") + source
+        previous_is_def = is_def
+    result.code = code
+    return result
+
+
+def collect_test_names(code: str) -> Set[str]:
+    """Имена функций тестов верхнего уровня модуля."""
+    return {
+        node.name for node in ast.parse(code).body
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith("test_")
+    }